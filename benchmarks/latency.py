@@ -0,0 +1,291 @@
+# latency.py
+#
+# Copyright (c) 2008-2009 Trevor Caira, 2011-2012 Adam Coddington
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Startup and per-command latency benchmark.
+
+Builds a timebook database of a given size and runs each benchmarked
+command line against a fresh copy of it in a new interpreter, recording
+the wall-clock time of the phases listed in ``PHASES``.  "Cold" runs start
+without the configuration cache, "warm" runs with it, after a run has
+left the database in the operating system's cache.  Run it from the top
+of the source tree::
+
+    python -m benchmarks.latency --entries 100000 --output results.json
+"""
+
+from datetime import date, timedelta
+import json
+import optparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import timebook
+from timebook.config import get_cache_path, parse_config
+from timebook.db import Database
+
+# ``startup`` is the time spent starting and stopping the interpreter and
+# ``other`` whatever the remaining phases do not account for.
+PHASES = ('startup', 'import', 'config', 'db_open', 'migrations', 'hooks',
+          'command', 'commit', 'indexes', 'reporting', 'other')
+
+# Runs a command line in a new interpreter and writes the phase timings
+# to the file named by its first argument.
+RUNNER = '''
+import json, sys, time
+start = time.time()
+from timebook import cmdline, profiling
+imported = time.time()
+path, sys.argv = sys.argv[1], ['t'] + sys.argv[2:]
+profiling.enable()
+try:
+    cmdline.run_from_cmdline()
+except SystemExit:
+    pass
+finally:
+    timings = dict(profiling.timings)
+    timings['import'] = timings.get('import', 0.0) + imported - start
+    timings['total'] = time.time() - start
+    with open(path, 'w') as f:
+        json.dump(timings, f)
+'''
+
+
+def get_commands(today):
+    start = (today - timedelta(days=6)).strftime('%Y-%m-%d')
+    end = today.strftime('%Y-%m-%d')
+    return [
+        ('in', ['in', '--switch', 'benchmark', 'new task']),
+        ('out', ['out']),
+        ('change', ['change', 'another task']),
+        ('now', ['now']),
+        ('list', ['list']),
+        ('display plain', ['display', '--format', 'plain']),
+        ('display csv', ['display', '--format', 'csv']),
+        ('display eu', ['display', '--format', 'eu', '--start', start,
+                        '--end', end]),
+        ('stats', ['stats']),
+        ('hours', ['hours']),
+    ]
+
+
+def build_config(path, hooks=False, reporting_url=None):
+    with open(path, 'w') as f:
+        f.write('[default]\n')
+        if hooks:
+            f.write('pre_hook = true\npost_hook = true\n')
+        if reporting_url:
+            f.write('reporting_url = %s\n' % reporting_url)
+
+
+def get_sheet_name(number):
+    return 'sheet-%s' % number if number else 'default'
+
+
+def build_database(path, config, sheets, entries, meta, holidays):
+    """Creates a database at ``path`` with ``entries`` consecutive hour-long
+    entries spread over ``sheets`` sheets, ending with a running entry on
+    the current sheet, "default"; ``stats`` only looks at that sheet."""
+    rand = random.Random(0)
+    db = Database(path, config)
+    now = int(time.time())
+    rows = []
+    for number in range(entries):
+        start = now - (entries - number) * 3600
+        rows.append((
+            number + 1,
+            get_sheet_name(rand.randrange(sheets)),
+            start,
+            start + 3000,
+            'task %s' % rand.randrange(entries),
+        ))
+    if rows:
+        rows[-1] = rows[-1][:1] + ('default', rows[-1][2], None) + rows[-1][4:]
+    db.execute(u'begin')
+    db.cursor.executemany(u'''
+        insert into entry (id, sheet, start_time, end_time, description)
+        values (?, ?, ?, ?, ?)
+    ''', rows)
+    db.cursor.executemany(u'''
+        insert into entry_details (entry_id, ticket_number, billable)
+        values (?, ?, ?)
+    ''', ((row[0], rand.randrange(1000), rand.randrange(2)) for row in rows))
+    db.cursor.executemany(u'''
+        insert into entry_meta (entry_id, key, value) values (?, ?, ?)
+    ''', (
+        (row[0], 'key_%s' % number, 'value %s' % row[0])
+        for row in rows for number in range(meta)
+    ))
+    day = date.today()
+    db.cursor.executemany(u'''
+        insert into holidays (year, month, day) values (?, ?, ?)
+    ''', (
+        ((day - timedelta(days=7 * number)).timetuple()[:3])
+        for number in range(holidays)
+    ))
+    db.execute(u'commit')
+    db.connection.close()
+
+
+def run_once(workdir, base, argv, cold):
+    db_path = os.path.join(workdir, 'run.db')
+    config_path = os.path.join(workdir, 'timebook.ini')
+    result_path = os.path.join(workdir, 'result.json')
+    shutil.copyfile(base, db_path)
+    if cold and os.path.exists(get_cache_path(config_path)):
+        os.unlink(get_cache_path(config_path))
+    env = dict(os.environ)
+    # Never forward to a daemon that may be running.
+    env['TIMEBOOK_SOCKET'] = os.path.join(workdir, 'no-daemon.sock')
+    env['PYTHONPATH'] = os.path.dirname(os.path.dirname(
+        os.path.abspath(timebook.__file__)
+    ))
+    start = time.time()
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call(
+            [sys.executable, '-c', RUNNER, result_path,
+             '-C', config_path, '-b', db_path] + argv,
+            stdout=devnull, env=env, cwd=workdir
+        )
+    total = time.time() - start
+    with open(result_path) as f:
+        timings = json.load(f)
+    timings['startup'] = total - timings.pop('total')
+    timings['other'] = total - sum(timings.values())
+    timings['total'] = total
+    return dict((name, timings.get(name, 0.0)) for name in
+                PHASES + ('total', ))
+
+
+def summarize(runs):
+    summary = {}
+    for name in PHASES + ('total', ):
+        values = sorted(run[name] for run in runs)
+        summary[name] = {
+            'min': values[0],
+            'median': values[len(values) // 2],
+            'max': values[-1],
+        }
+    return summary
+
+
+def run_benchmark(workdir, base, commands, runs):
+    results = {}
+    for label, argv in commands:
+        results[label] = {}
+        for mode in ('cold', 'warm'):
+            timings = [
+                run_once(workdir, base, argv, cold=mode == 'cold')
+                for _ in range(runs)
+            ]
+            results[label][mode] = summarize(timings)
+    return results
+
+
+def print_results(results, stream):
+    header = ['command', 'mode'] + [p for p in PHASES] + ['total']
+    print >> stream, ' '.join('%-13s' % h for h in header[:2]) + ' ' + \
+        ' '.join('%10s' % h for h in header[2:])
+    for label in sorted(results):
+        for mode in ('cold', 'warm'):
+            summary = results[label][mode]
+            print >> stream, '%-13s %-13s ' % (label, mode) + ' '.join(
+                '%10.2f' % (summary[name]['median'] * 1000)
+                for name in PHASES + ('total', )
+            )
+    print >> stream, '(median milliseconds)'
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='''usage: %prog [OPTIONS]
+
+Time each benchmarked command against a generated timebook database.''')
+    parser.add_option('--sheets', type='int', default=10,
+                      help='Number of sheets (default: %default).')
+    parser.add_option('--entries', type='int', default=10000,
+                      help='Number of entries (default: %default).')
+    parser.add_option('--meta', type='int', default=2,
+                      help='Metadata rows per entry (default: %default).')
+    parser.add_option('--holidays', type='int', default=20,
+                      help='Number of holidays (default: %default).')
+    parser.add_option('-n', '--runs', type='int', default=5,
+                      help='Runs of each command in each mode '
+                           '(default: %default).')
+    parser.add_option('-c', '--command', dest='commands', action='append',
+                      help='Only run this benchmark; may be repeated.')
+    parser.add_option('--hooks', action='store_true', default=False,
+                      help='Configure pre and post hooks running "true".')
+    parser.add_option('--reporting-url', dest='reporting_url',
+                      help='Configure a reporting URL.')
+    parser.add_option('-o', '--output', dest='output',
+                      help='Write the results to this JSON file.')
+    opts, args = parser.parse_args(argv)
+    if args:
+        parser.error('unexpected arguments: %s' % ' '.join(args))
+    if opts.runs < 1:
+        parser.error('--runs must be at least 1.')
+
+    commands = get_commands(date.today())
+    if opts.commands:
+        unknown = set(opts.commands) - set(label for label, _ in commands)
+        if unknown:
+            parser.error('unknown benchmark: %s' % ', '.join(sorted(unknown)))
+        commands = [c for c in commands if c[0] in opts.commands]
+
+    workdir = tempfile.mkdtemp()
+    try:
+        config_path = os.path.join(workdir, 'timebook.ini')
+        base = os.path.join(workdir, 'base.db')
+        build_config(config_path, opts.hooks, opts.reporting_url)
+        build_database(base, parse_config(config_path), opts.sheets,
+                       opts.entries, opts.meta, opts.holidays)
+        results = {
+            'version': timebook.get_version(),
+            'python': sys.version.split()[0],
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'parameters': {
+                'sheets': opts.sheets,
+                'entries': opts.entries,
+                'meta': opts.meta,
+                'holidays': opts.holidays,
+                'runs': opts.runs,
+                'hooks': opts.hooks,
+                'reporting_url': opts.reporting_url,
+            },
+            'results': run_benchmark(workdir, base, commands, opts.runs),
+        }
+    finally:
+        shutil.rmtree(workdir)
+
+    print_results(results['results'], sys.stdout)
+    if opts.output:
+        with open(opts.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+# query_plans.py
+#
+# Copyright (c) 2008-2009 Trevor Caira, 2011-2012 Adam Coddington
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Query plans and timings of the hot queries with and without the
+indexes added by migration 0004.
+
+Builds a database as ``benchmarks.latency`` does, copies it, drops the
+indexes from the copy to get back to the schema before the migration, then
+prints ``EXPLAIN QUERY PLAN`` and the median time of each query on both::
+
+    python -m benchmarks.query_plans --entries 100000 --output plans.json
+"""
+
+import json
+import optparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from benchmarks import latency
+from timebook.config import parse_config
+
+# The indexes added by migration 0004, and the one it removed.
+ADDED_INDEXES = (
+    'entry_sheet_start_time',
+    'entry_sheet_end_time',
+    'entry_meta_entry_id_key',
+    'ticket_details_number',
+    'holidays_date',
+    'vacation_date',
+    'unpaid_date',
+)
+REMOVED_INDEXES = (
+    'create index entry_sheet on entry (sheet)',
+)
+
+QUERIES = (
+    ('running entry', '''
+        select entry.id, entry.start_time, entry.description from sheet
+        inner join entry on entry.id = sheet.running_entry_id
+        where sheet.name = ?
+    ''', ('default', )),
+    ('one running entry', '''
+        select 1 from entry where sheet = ? and end_time is null
+    ''', ('default', )),
+    ('sheet time range', '''
+        select id, start_time, end_time from entry
+        where sheet = ? and start_time > strftime('%s', 'now', '-6 days')
+        order by start_time
+    ''', ('default', )),
+    ('sheet ended after', '''
+        select id from entry where sheet = ? and end_time > ?
+    ''', ('default', 0)),
+    ('entry meta', '''
+        select key, value from entry_meta where entry_id = ? order by key
+    ''', (1, )),
+    ('ticket details', '''
+        select project, details from ticket_details where number = ?
+    ''', (1, )),
+    ('holiday', '''
+        select * from holidays where year = ? and month = ? and day = ?
+    ''', (2012, 1, 1)),
+)
+
+
+def explain(connection, sql, params):
+    return [
+        row[-1] for row in
+        connection.execute('explain query plan ' + sql, params).fetchall()
+    ]
+
+
+def time_query(connection, sql, params, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.time()
+        connection.execute(sql, params).fetchall()
+        timings.append(time.time() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+def remove_indexes(path):
+    connection = sqlite3.connect(path, isolation_level=None)
+    for name in ADDED_INDEXES:
+        connection.execute('drop index %s' % name)
+    for statement in REMOVED_INDEXES:
+        connection.execute(statement)
+    connection.close()
+
+
+def analyze(path):
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.execute('analyze')
+    connection.close()
+
+
+def compare(before, after, runs):
+    connections = {
+        'before': sqlite3.connect(before),
+        'after': sqlite3.connect(after),
+    }
+    results = {}
+    for label, sql, params in QUERIES:
+        results[label] = dict(
+            (schema, {
+                'plan': explain(connection, sql, params),
+                'seconds': time_query(connection, sql, params, runs),
+            })
+            for schema, connection in connections.items()
+        )
+    for connection in connections.values():
+        connection.close()
+    return results
+
+
+def print_results(results, stream):
+    for label, _, _ in QUERIES:
+        result = results[label]
+        print >> stream, '%s: %.3fms -> %.3fms' % (
+            label,
+            result['before']['seconds'] * 1000,
+            result['after']['seconds'] * 1000,
+        )
+        for schema in ('before', 'after'):
+            for line in result[schema]['plan']:
+                print >> stream, '    %-6s  %s' % (schema, line)
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage='''usage: %prog [OPTIONS]
+
+Compare the query plans and timings of the hot queries before and after
+the indexes of migration 0004.''')
+    parser.add_option('--sheets', type='int', default=10,
+                      help='Number of sheets (default: %default).')
+    parser.add_option('--entries', type='int', default=100000,
+                      help='Number of entries (default: %default).')
+    parser.add_option('--meta', type='int', default=2,
+                      help='Metadata rows per entry (default: %default).')
+    parser.add_option('--holidays', type='int', default=200,
+                      help='Number of holidays (default: %default).')
+    parser.add_option('-n', '--runs', type='int', default=20,
+                      help='Runs of each query (default: %default).')
+    parser.add_option('-o', '--output', dest='output',
+                      help='Write the results to this JSON file.')
+    opts, args = parser.parse_args(argv)
+    if args:
+        parser.error('unexpected arguments: %s' % ' '.join(args))
+
+    workdir = tempfile.mkdtemp()
+    try:
+        config_path = os.path.join(workdir, 'timebook.ini')
+        after = os.path.join(workdir, 'after.db')
+        before = os.path.join(workdir, 'before.db')
+        latency.build_config(config_path)
+        latency.build_database(after, parse_config(config_path), opts.sheets,
+                               opts.entries, opts.meta, opts.holidays)
+        shutil.copyfile(after, before)
+        remove_indexes(before)
+        analyze(before)
+        analyze(after)
+        results = compare(before, after, opts.runs)
+    finally:
+        shutil.rmtree(workdir)
+
+    print_results(results, sys.stdout)
+    if opts.output:
+        with open(opts.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from timebook import archive, dbutil, exceptions
+from timebook.config import parse_config
+import timebook.db
+
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tempdir, 'sheets.db')
+        self.db = timebook.db.Database(
+            self.db_path, parse_config(os.path.join(self.tempdir, 'x.ini'))
+        )
+        self.tz = os.environ.get('TZ')
+        os.environ['TZ'] = 'UTC'
+        time.tzset()
+        # Midday on 2011-06-01, 2012-06-01 and 2013-06-01.
+        for start in (1306929600, 1338552000, 1370088000):
+            self.db.execute(u'''
+                insert into entry (sheet, start_time, end_time)
+                values ('default', ?, ?)
+            ''', (start, start + 3600))
+            dbutil.update_entry_meta(
+                self.db, self.db.cursor.lastrowid, {'billable': 'yes'}
+            )
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        if self.tz is None:
+            os.environ.pop('TZ', None)
+        else:
+            os.environ['TZ'] = self.tz
+        time.tzset()
+
+    def get_ids(self, table=u'entry', column=u'id'):
+        self.db.execute(u'select %s from %s order by 1' % (column, table))
+        return [row[0] for row in self.db.fetchall()]
+
+    def test_archive_and_attach(self):
+        self.assertEqual(archive.get_archivable_years(self.db, 2014), [2011, 2012])
+        for year in (2011, 2012):
+            self.assertEqual(archive.archive_year(self.db, year), 1)
+        self.assertEqual(archive.get_archive_years(self.db_path), [2011, 2012])
+        self.assertEqual(self.get_ids(), [3])
+        self.assertEqual(self.get_ids(u'entry_meta', u'entry_id'), [3])
+        self.assertEqual(dbutil.get_entry_count(self.db, 'default'), 1)
+
+        with archive.attached(self.db):
+            self.assertEqual(self.get_ids(), [1, 2, 3])
+            self.assertEqual(dbutil.get_entry_meta(self.db, 1),
+                             {'billable': 'yes'})
+        with archive.attached(self.db, since=1338552000):
+            self.assertEqual(self.get_ids(), [2, 3])
+            # The interval index only covers the database's own entries.
+            self.assertFalse(dbutil.has_interval_index(self.db))
+            self.assertEqual(
+                [entry[0] for entry in dbutil.get_overlapping_entries(
+                    self.db, 1338552000, 1338555600
+                )],
+                [2]
+            )
+        with archive.attached(self.db, since=1370088000):
+            self.assertEqual(self.get_ids(), [3])
+        self.assertEqual(self.get_ids(), [3])
+
+    def test_archiving_again_moves_nothing(self):
+        archive.archive_year(self.db, 2011)
+        self.assertEqual(archive.archive_year(self.db, 2011), 0)
+        with archive.attached(self.db):
+            self.assertEqual(self.get_ids(), [1, 2, 3])
+
+    def test_newest_entry_is_kept(self):
+        self.assertEqual(archive.get_archivable_years(self.db, 2020), [2011, 2012])
+        self.assertEqual(archive.archive_year(self.db, 2013), 0)
+        self.assertEqual(self.get_ids(), [1, 2, 3])
+
+    def test_backdated_entry_is_kept_until_the_next(self):
+        # Midday on 2011-07-01, added after the others.
+        self.db.execute(u'''
+            insert into entry (sheet, start_time, end_time)
+            values ('default', 1309521600, 1309525200)
+        ''')
+        self.assertEqual(archive.archive_year(self.db, 2011), 1)
+        self.assertEqual(self.get_ids(), [2, 3, 4])
+        self.db.execute(u'''
+            insert into entry (sheet, start_time, end_time)
+            values ('default', 1306933200, 1306936800)
+        ''')
+        # The newest entry by start time stays, whatever its id.
+        self.assertEqual(archive.archive_year(self.db, 2013), 0)
+        self.assertEqual(archive.archive_year(self.db, 2011), 1)
+        self.assertEqual(self.get_ids(), [2, 3, 5])
+
+    def test_archives_cannot_be_read_in_a_transaction(self):
+        archive.archive_year(self.db, 2011)
+        self.db.begin()
+        try:
+            with self.assertRaises(exceptions.CommandError):
+                with archive.attached(self.db):
+                    pass
+            # Without archives to attach, nothing needs detaching.
+            with archive.attached(self.db, since=1338552000):
+                self.assertEqual(self.get_ids(), [2, 3])
+        finally:
+            self.db.execute(u'rollback')
+        self.assertFalse(self.db.in_transaction)
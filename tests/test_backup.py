@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from timebook import backup, dbutil, exceptions
+from timebook.config import parse_config
+import timebook.db
+
+
+class TestBackup(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tempdir, 'sheets.db')
+        self.directory = os.path.join(self.tempdir, 'backups')
+        self.db = timebook.db.Database(
+            self.db_path, parse_config(os.path.join(self.tempdir, 'x.ini'))
+        )
+        self.insert('default')
+
+    def tearDown(self):
+        self.db.connection.close()
+        shutil.rmtree(self.tempdir)
+
+    def insert(self, sheet):
+        self.db.execute(u'''
+            insert into entry (sheet, start_time, end_time)
+            values (?, 0, 3600)
+        ''', (sheet, ))
+
+    def test_backup_and_rotate(self):
+        paths = [
+            backup.backup(self.db, self.directory, keep=2, when=when)[0]
+            for when in (1338552000, 1338552001)
+        ]
+        self.assertEqual(
+            backup.get_backups(self.db_path, self.directory), paths
+        )
+        self.assertEqual(os.path.basename(paths[0])[:16], 'sheets-20120601T')
+        path, deleted = backup.backup(
+            self.db, self.directory, 'gzip', keep=2, when=1338552002
+        )
+        self.assertTrue(path.endswith('.db.gz'))
+        self.assertEqual(deleted, paths[:1])
+        self.assertEqual(
+            backup.get_backups(self.db_path, self.directory),
+            [paths[1], path]
+        )
+        # Nothing is left behind from copying.
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def test_restore(self):
+        path, _ = backup.backup(self.db, self.directory, 'gzip')
+        self.insert('other')
+        saved = backup.restore(self.db, path, self.directory)
+        self.assertEqual(list(dbutil.get_sheet_names(self.db)), ['default'])
+        self.assertEqual(
+            backup.get_backups(self.db_path, self.directory),
+            sorted([path, saved])
+        )
+        # The database is usable again once reopened.
+        self.insert('other')
+        self.assertEqual(
+            list(dbutil.get_sheet_names(self.db)), ['default', 'other']
+        )
+
+    def test_restore_refuses_damaged_backup(self):
+        path = os.path.join(self.tempdir, 'sheets-20120601T120000.db')
+        with open(path, 'wb') as damaged:
+            damaged.write('not a database' * 100)
+        self.assertRaises(
+            exceptions.CommandError, backup.restore, self.db, path
+        )
+        self.assertEqual(list(dbutil.get_sheet_names(self.db)), ['default'])
+        self.assertFalse(
+            [name for name in os.listdir(self.tempdir) if 'restore' in name]
+        )
+
+    def test_backup_names_are_unique(self):
+        paths = [
+            backup.backup(self.db, self.directory, when=1338552000)[0]
+            for i in range(2)
+        ]
+        self.assertEqual(
+            backup.get_backups(self.db_path, self.directory), paths
+        )
+
+    def test_unknown_compression(self):
+        self.assertRaises(
+            exceptions.CommandError,
+            backup.backup, self.db, self.directory, 'zip'
+        )
+        self.assertEqual(backup.get_backups(self.db_path, self.directory), [])
@@ -0,0 +1,103 @@
+import StringIO
+import unittest
+
+import mock
+
+from timebook import batch
+from timebook.config import ConfigParser
+import timebook.db
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.db = timebook.db.Database(':memory:', ConfigParser())
+
+    def get_descriptions(self):
+        self.db.execute(u'select description from entry order by id')
+        return [row[0] for row in self.db.fetchall()]
+
+    def test_parse_lines(self):
+        self.assertEqual(
+            batch.parse_batch(
+                '# comment\n\nin "a task"\nalter --id=3 "it\'s done"\n',
+                'utf-8'
+            ),
+            [[u'in', u'a task'], [u'alter', u'--id=3', u"it's done"]]
+        )
+
+    def test_parse_json(self):
+        self.assertEqual(
+            batch.parse_batch('[["in", "a task"], ["out"]]', 'utf-8'),
+            [[u'in', u'a task'], [u'out']]
+        )
+
+    def test_parse_invalid_json(self):
+        self.assertRaises(
+            batch.exceptions.CommandError,
+            batch.parse_batch, '[["in"], []]', 'utf-8'
+        )
+
+    def test_run_batch_commits_in_chunks(self):
+        commands = [
+            ['insert', '2013-01-0%s 09:00' % day, '2013-01-0%s 10:00' % day,
+             'day %s' % day]
+            for day in range(1, 6)
+        ]
+        with mock.patch.object(self.db, 'execute', wraps=self.db.execute) \
+                as execute:
+            failures = batch.run_batch(self.db, commands, 2)
+        self.assertEqual(failures, 0)
+        self.assertEqual(
+            [c for c in execute.call_args_list if c == mock.call(u'commit')],
+            [mock.call(u'commit')] * 3
+        )
+        self.assertEqual(
+            self.get_descriptions(),
+            ['day 1', 'day 2', 'day 3', 'day 4', 'day 5']
+        )
+
+    def test_failed_command_is_rolled_back(self):
+        commands = [['in', 'first'], ['in', 'second'], ['out'], ['in', 'third']]
+        with mock.patch('sys.stderr', StringIO.StringIO()) as stderr:
+            failures = batch.run_batch(self.db, commands, 10)
+        self.assertEqual(failures, 1)
+        self.assertTrue('command 2 (in second)' in stderr.getvalue())
+        self.assertEqual(self.get_descriptions(), ['first'])
+
+    def test_keep_going(self):
+        commands = [['in', 'first'], ['in', 'second'], ['out'], ['in', 'third']]
+        with mock.patch('sys.stderr', StringIO.StringIO()):
+            failures = batch.run_batch(
+                self.db, commands, 10, keep_going=True
+            )
+        self.assertEqual(failures, 1)
+        self.assertEqual(self.get_descriptions(), ['first', 'third'])
+
+    def test_interactive_commands_are_refused(self):
+        with mock.patch('sys.stderr', StringIO.StringIO()) as stderr:
+            failures = batch.run_batch(self.db, [['kill']], 10)
+        self.assertEqual(failures, 1)
+        self.assertTrue('cannot be run in a batch' in stderr.getvalue())
+
+    def test_commands_with_own_transactions_are_refused(self):
+        commands = [['in', 'first'], ['maintain'], ['archive'], ['backup'],
+                    ['out']]
+        with mock.patch('sys.stderr', StringIO.StringIO()) as stderr:
+            failures = batch.run_batch(
+                self.db, commands, 10, keep_going=True
+            )
+        self.assertEqual(failures, 3)
+        for name in ('maintain', 'archive', 'backup'):
+            self.assertTrue(
+                'The %s command cannot be run in a batch' % name
+                in stderr.getvalue()
+            )
+        self.assertEqual(self.get_descriptions(), ['first'])
+
+    def test_hooks_are_not_run_per_command(self):
+        self.db.config.readfp(
+            StringIO.StringIO('[default]\npre_hook = /bin/hook\n')
+        )
+        with mock.patch('subprocess.call') as call:
+            batch.run_batch(self.db, [['in', 'a'], ['out']], 10)
+        self.assertFalse(call.called)
@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks import latency
+from timebook import dbutil
+from timebook.config import parse_config
+import timebook.db
+
+
+class TestLatencyBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.tempdir, 'timebook.ini')
+        self.base = os.path.join(self.tempdir, 'base.db')
+        latency.build_config(self.config_path, hooks=True)
+        latency.build_database(
+            self.base, parse_config(self.config_path),
+            sheets=3, entries=50, meta=2, holidays=4
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_build_database(self):
+        db = timebook.db.Database(self.base, parse_config(self.config_path))
+        db.execute(u'select count(*) from entry')
+        self.assertEqual(db.fetchone()[0], 50)
+        db.execute(u'select count(*) from entry_meta')
+        self.assertEqual(db.fetchone()[0], 100)
+        db.execute(u'select count(*) from holidays')
+        self.assertEqual(db.fetchone()[0], 4)
+        self.assertEqual(dbutil.get_current_sheet(db), 'default')
+        self.assertNotEqual(dbutil.get_current_start_time(db), None)
+
+    def test_run_once_reports_phases(self):
+        timings = latency.run_once(
+            self.tempdir, self.base, ['out'], cold=True
+        )
+        self.assertEqual(
+            sorted(timings), sorted(latency.PHASES + ('total', ))
+        )
+        for name in ('import', 'config', 'migrations', 'hooks', 'command',
+                     'commit', 'indexes'):
+            self.assertTrue(timings[name] > 0, name)
+        self.assertEqual(timings['reporting'], 0.0)
+        self.assertAlmostEqual(
+            sum(timings[name] for name in latency.PHASES), timings['total']
+        )
+        # The base database is copied, not changed.
+        db = timebook.db.Database(self.base, parse_config(self.config_path))
+        self.assertNotEqual(dbutil.get_current_start_time(db), None)
@@ -5,32 +5,41 @@ import time
 import unittest
 
 import mock
-from nose.plugins.skip import SkipTest
 
+from timebook.config import ConfigParser
+from timebook.storage import MemoryDatabase
 import timebook.db
 import timebook.commands as cmds
 
 class TestCommandFunctions(unittest.TestCase):
     def setUp(self):
-        raise SkipTest(
-            'Temporarily broken'
-        )
-        config_mock = mock.Mock() 
-        config_mock.get.return_value = False
         self.default_sheet = 'default'
-        self.db_mock = timebook.db.Database(
-                    ':memory:',
-                    config_mock
-                )
+        self.db_mock = self.make_db()
         self.arbitrary_args = []
 
-        cmds.pre_hook = mock.Mock()
-        cmds.post_hook = mock.Mock()
-
+        # Durations of running entries are measured against the clock, so
+        # start well clear of the end of a second.
+        if time.time() % 1 > 0.5:
+            time.sleep(1 - time.time() % 1)
         self.now = int(time.time())
-        cmds.cmdutil.parse_date_time_or_now = mock.Mock(
-                    return_value = self.now
-                )
+        self.patches = [
+            mock.patch.object(cmds, 'pre_hook'),
+            mock.patch.object(cmds, 'post_hook'),
+            mock.patch.object(
+                cmds.cmdutil, 'parse_date_time_or_now',
+                return_value=self.now
+            ),
+            mock.patch('time.time', return_value=self.now),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+
+    def make_db(self):
+        return MemoryDatabase(ConfigParser())
 
     def adjust_output_rows_for_time(self, rows):
         processed = []
@@ -62,10 +71,7 @@ class TestCommandFunctions(unittest.TestCase):
         return output
 
     def get_entry_rows(self):
-        self.db_mock.execute('''
-            select * from entry;
-            ''')
-        return self.db_mock.fetchall()
+        return self.db_mock.storage.get_entries()
 
     def tabularize_output(self, output):
         output_rows = []
@@ -88,10 +94,10 @@ class TestCommandFunctions(unittest.TestCase):
         sqlite3_binary = 'sqlite3'
         self.db_mock.path = arbitrary_path
 
-        cmds.subprocess.call = mock.MagicMock()
-        cmds.backend(self.db_mock, self.arbitrary_args)
+        with mock.patch('subprocess.call') as call:
+            cmds.backend(self.db_mock, self.arbitrary_args)
 
-        cmds.subprocess.call.assert_called_with(
+        call.assert_called_with(
                     (
                         sqlite3_binary,
                         arbitrary_path,
@@ -99,28 +105,17 @@ class TestCommandFunctions(unittest.TestCase):
                 )
 
     def test_post(self):
-        arbitrary_login_url = "http://some.url/"
-        arbitrary_timesheet_url = "http://some.other.url/"
-        arbitrary_db_path = "/path/to/some/db"
-        arbitrary_config_file = "/path/to/some/file"
-
-        cmds.LOGIN_URL = arbitrary_login_url
-        cmds.TIMESHEET_URL = arbitrary_timesheet_url
-        cmds.TIMESHEET_DB = arbitrary_db_path
-        cmds.CONFIG_FILE = arbitrary_config_file
+        with mock.patch('timebook.autopost.TimesheetPoster') as poster:
+            cmds.post(self.db_mock, self.arbitrary_args)
 
-        cmds.TimesheetPoster= mock.MagicMock()
-
-        cmds.post(self.db_mock, self.arbitrary_args)
-
-        cmds.TimesheetPoster.assert_called_with(
+        poster.assert_called_with(
                     self.db_mock,
                     datetime.datetime.fromtimestamp(self.now).date(),
                 )
 
         self.assertTrue(
                 mock.call().__enter__().main() 
-                in cmds.TimesheetPoster.mock_calls
+                in poster.mock_calls
             )
 
     def test_in(self):
@@ -297,6 +292,76 @@ class TestCommandFunctions(unittest.TestCase):
                 expected_rows
             )
 
+    def get_timestamp(self, value):
+        return int(time.mktime(
+            datetime.datetime.strptime(value, '%Y-%m-%d %H:%M').timetuple()
+        ))
+
+    def test_insert(self):
+        cmds.insert(
+            self.db_mock, ['2012-06-01 10:00', '2012-06-01 12:00', 'first']
+        )
+        cmds.insert(
+            self.db_mock, ['2012-06-01 12:00', '2012-06-01 13:00', 'second']
+        )
+        for start, end in (
+            ('2012-06-01 09:00', '2012-06-01 10:30'),
+            ('2012-06-01 11:00', '2012-06-01 12:30'),
+            ('2012-06-01 12:15', '2012-06-01 12:30'),
+        ):
+            self.assertRaises(
+                cmds.exceptions.CommandError,
+                cmds.insert, self.db_mock, [start, end, 'overlapping']
+            )
+
+        rows = self.get_entry_rows()
+
+        self.assertEqual(
+                [row[4] for row in rows],
+                [u'first', u'second']
+            )
+
+    def test_backdate(self):
+        cmds.insert(
+            self.db_mock, ['2012-06-01 10:00', '2012-06-01 13:00', 'first']
+        )
+        self.assertRaises(
+            cmds.exceptions.CommandError,
+            cmds.backdate, self.db_mock, ['2012-06-01 09:00']
+        )
+        cmds.backdate(self.db_mock, ['2012-06-01 12:00'])
+
+        rows = self.get_entry_rows()
+
+        self.assertEqual(
+                rows[0][2:4],
+                (
+                    self.get_timestamp('2012-06-01 10:00'),
+                    self.get_timestamp('2012-06-01 12:00'),
+                )
+            )
+
+    def test_at(self):
+        cmds.insert(
+            self.db_mock, ['2012-06-01 10:00', '2012-06-01 12:00', 'first']
+        )
+
+        output = self.tabularize_output(
+            self.capture_output(
+                cmds.at, [self.db_mock, ['2012-06-01 11:00']]
+            )
+        )
+
+        self.assertEqual(len(output), 2)
+        self.assertTrue(output[1][0].startswith('default'))
+        self.assertTrue(output[1][0].endswith('first   1'))
+        self.assertEqual(
+            self.capture_output(
+                cmds.at, [self.db_mock, ['2012-06-01 12:00']]
+            ).split('\n')[1:],
+            []
+        )
+
     def test_running(self):
         expected_rows = [
                 [u'Timesheet   Description'], 
@@ -315,11 +380,17 @@ class TestCommandFunctions(unittest.TestCase):
                     expected_rows,
                 )
 
+
+class TestSQLiteCommandFunctions(TestCommandFunctions):
+    def make_db(self):
+        # SQLite's own in-memory database keeps each test isolated.
+        return timebook.db.Database(':memory:', ConfigParser())
+
     def test_display(self):
         expected_rows = self.adjust_output_rows_for_time([
-                [u'Day            Start      End        Duration   Notes             Billable'], 
-                [u'{date}'  + '   {time} - {time} ' +'  00:00:00   some task         yes'], 
-                [u'{time} - '             + '           00:00:00   some other task   yes'], 
+                [u'Day            Start      End        Duration   Billable   Notes'], 
+                [u'{date}'  + '   {time} - {time} ' +'  00:00:00   yes        some task'], 
+                [u'{time} - '             + '           00:00:00   yes        some other task'], 
                 [u'00:00:00'], 
                 [u'Total                                00:00:00']
             ])
@@ -0,0 +1,152 @@
+import os
+import re
+import shutil
+from StringIO import StringIO
+import tempfile
+import unittest
+
+import mock
+
+from timebook import completion, registry
+from timebook.commands import run_command, suppress_hooks
+from timebook.config import parse_config
+import timebook.db
+
+HELP_OPTION = re.compile(r'^\s+(-.*?)(?:\s{2,}|$)')
+
+
+class TestCompletion(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.tempdir, 'timebook.ini')
+        self.db = timebook.db.Database(
+            os.path.join(self.tempdir, 'sheets.db'),
+            parse_config(self.config_path)
+        )
+        self.path = os.path.join(self.tempdir, 'sheets.completion')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def read_index(self, name):
+        with open(os.path.join(self.path, name)) as f:
+            return f.read().splitlines()
+
+    def reload_config(self, content):
+        with open(self.config_path, 'w') as f:
+            f.write(content)
+        # Ensure the change is seen even within the mtime's resolution.
+        os.utime(self.config_path, (0, 0))
+        self.db.config = parse_config(self.config_path)
+
+    def test_index_path_is_next_to_database(self):
+        self.assertEqual(completion.get_index_path(self.db.path), self.path)
+        self.assertEqual(completion.get_index_path(':memory:'), None)
+
+    def test_mutating_commands_write_index(self):
+        run_command(self.db, 'in', ['--switch', u'w\xf6rk', 'writing'])
+        self.assertEqual(
+            self.read_index('sheets'), [u'w\xf6rk'.encode('utf-8')]
+        )
+        self.assertIn('in', self.read_index('commands'))
+        self.assertIn('start', self.read_index('commands'))
+        self.assertIn('start in', self.read_index('aliases'))
+        self.assertIn('--timebook', self.read_index('global_options'))
+        self.assertIn('--switch', self.read_index('options/in'))
+        self.assertFalse(completion.index_is_stale(self.db))
+
+    def test_switch_writes_index(self):
+        completion.write_index(self.db)
+        run_command(self.db, 'switch', ['other'])
+        self.assertEqual(self.read_index('sheets'), ['other'])
+
+    def test_read_only_commands_write_missing_index(self):
+        self.assertTrue(completion.index_is_stale(self.db))
+        with mock.patch('sys.stdout'):
+            run_command(self.db, 'list', [])
+        self.assertEqual(self.read_index('sheets'), ['default'])
+
+    def test_index_is_rebuilt_only_when_sheets_change(self):
+        completion.write_index(self.db)
+        run_command(self.db, 'in', ['writing'])
+        with mock.patch.object(completion, 'write_index') as write_index:
+            run_command(self.db, 'alter', ['editing'])
+            run_command(self.db, 'out', [])
+        self.assertFalse(write_index.called)
+
+        run_command(self.db, 'insert', [
+            '2012-06-01 10:00', '2012-06-01 12:00', 'reading'
+        ])
+        self.assertFalse(completion.index_is_stale(self.db))
+        run_command(self.db, 'in', ['--switch', 'other'])
+        self.assertEqual(self.read_index('sheets'), ['default', 'other'])
+
+    def test_commands_staying_on_the_sheet_do_not_check_index(self):
+        run_command(self.db, 'in', ['writing'])
+        with mock.patch.object(completion, 'index_is_stale') as is_stale:
+            run_command(self.db, 'change', ['editing'])
+            run_command(self.db, 'out', [])
+            with mock.patch('sys.stdout'):
+                run_command(self.db, 'now', [])
+        self.assertFalse(is_stale.called)
+
+    def test_removing_sheets_refreshes_index(self):
+        run_command(self.db, 'in', ['--switch', 'other', 'writing'])
+        run_command(self.db, 'switch', ['default'])
+        self.assertEqual(self.read_index('sheets'), ['default', 'other'])
+        with mock.patch('__builtin__.raw_input', return_value='y'), \
+                mock.patch('sys.stdout'):
+            run_command(self.db, 'kill', ['other'])
+        self.assertEqual(self.read_index('sheets'), ['default'])
+
+    def test_upgrades_refresh_index(self):
+        completion.write_index(self.db)
+        with mock.patch.object(completion, 'get_version',
+                               return_value='99.0.0'):
+            self.assertTrue(completion.index_is_stale(self.db))
+
+    def test_config_changes_refresh_index(self):
+        completion.write_index(self.db)
+        self.reload_config(
+            '[aliases]\nw = switch work\n'
+            '[custom_ticket_meta]\nproject = Project name\n'
+        )
+        self.assertTrue(completion.index_is_stale(self.db))
+        with mock.patch('sys.stdout'):
+            run_command(self.db, 'list', [])
+        self.assertIn('w', self.read_index('commands'))
+        self.assertIn('w switch work', self.read_index('aliases'))
+        self.assertIn('--project', self.read_index('options/in'))
+        self.assertIn('--project', self.read_index('options/alter'))
+        self.assertNotIn('--project', self.read_index('options/out'))
+
+    def test_unchanged_files_are_not_rewritten(self):
+        completion.write_index(self.db)
+        sheets = os.path.join(self.path, 'sheets')
+        os.utime(sheets, (0, 0))
+        completion.write_index(self.db)
+        self.assertEqual(os.stat(sheets).st_mtime, 0)
+
+    def test_registry_options_match_help(self):
+        # Commands without options have no parser to ask (some would run
+        # instead), and ``change`` clocks out before parsing its arguments
+        # but shares its parser with ``in``.
+        for name, info in registry.commands.items():
+            if not info.options or name == 'change':
+                continue
+            stdout = StringIO()
+            with suppress_hooks(), mock.patch('sys.stdout', stdout):
+                try:
+                    info.load()(self.db, ['--help'])
+                except SystemExit:
+                    pass
+            options = []
+            for line in stdout.getvalue().splitlines():
+                match = HELP_OPTION.match(line)
+                if match:
+                    options.extend(
+                        option.split('=')[0].split(' ')[0]
+                        for option in match.group(1).split(', ')
+                    )
+            options = [o for o in options if o not in ('-h', '--help')]
+            self.assertEqual(sorted(options), sorted(info.options), name)
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from timebook import config
+
+CONFIG = '''
+[default]
+root = /opt/hooks
+pre_hook = %(root)s/pre "with spaces"
+post_out_hook = /bin/true
+reporting_url = http://example.com/report/
+autocontinue =
+
+[auth]
+password = 100%
+
+[aliases]
+to = change
+
+[custom_ticket_meta]
+with = Who are you working with?
+'''
+
+
+class TestConfig(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'timebook.ini')
+        f = open(self.path, 'w')
+        try:
+            f.write(CONFIG)
+        finally:
+            f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def assert_compiled(self, parsed):
+        self.assertEqual(
+            parsed.get_hook('default', 'pre_hook'),
+            ['/opt/hooks/pre', 'with spaces']
+        )
+        self.assertEqual(
+            parsed.get_hook('default', 'post_out_hook'),
+            ['/bin/true']
+        )
+        self.assertEqual(parsed.get_hook('default', 'post_hook'), None)
+        self.assertEqual(parsed.get_hook('other', 'pre_hook'), None)
+        self.assertEqual(
+            parsed.get_reporting_url('default'),
+            'http://example.com/report/'
+        )
+        self.assertEqual(parsed.get_alias('to'), 'change')
+        self.assertEqual(parsed.get_alias('from'), None)
+        self.assertEqual(
+            parsed.get_custom_ticket_meta(),
+            [('with', 'Who are you working with?')]
+        )
+        self.assertTrue(parsed.has_option('default', 'autocontinue'))
+        self.assertEqual(parsed.get('auth', 'password', raw=True), '100%')
+
+    def test_parse_writes_cache(self):
+        parsed = config.parse_config(self.path)
+        self.assert_compiled(parsed)
+        self.assertTrue(os.path.exists(config.get_cache_path(self.path)))
+
+    def test_cache_hit_skips_parsing(self):
+        config.parse_config(self.path)
+        with mock.patch.object(config.ConfigParser, 'readfp') as readfp:
+            parsed = config.parse_config(self.path)
+        self.assertFalse(readfp.called)
+        self.assert_compiled(parsed)
+
+    def test_changed_file_invalidates_cache(self):
+        config.parse_config(self.path)
+        f = open(self.path, 'a')
+        try:
+            f.write('\n[other]\npre_hook = /bin/false\n')
+        finally:
+            f.close()
+        parsed = config.parse_config(self.path)
+        self.assertEqual(parsed.get_hook('other', 'pre_hook'), ['/bin/false'])
+
+    def test_corrupt_cache_is_ignored(self):
+        f = open(config.get_cache_path(self.path), 'wb')
+        try:
+            f.write('garbage')
+        finally:
+            f.close()
+        self.assert_compiled(config.parse_config(self.path))
+
+    def test_missing_file_is_created(self):
+        path = os.path.join(self.tempdir, 'a', 'b', 'timebook.ini')
+        parsed = config.parse_config(path)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(parsed.sections(), [])
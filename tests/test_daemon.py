@@ -0,0 +1,134 @@
+import os
+import shutil
+import StringIO
+import tempfile
+import threading
+import unittest
+
+import mock
+
+from timebook import client
+from timebook.config import parse_config
+from timebook.daemon import TimebookDaemon
+import timebook.db
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.tempdir, 'timebook.ini')
+        self.db_path = os.path.join(self.tempdir, 'sheets.db')
+        self.socket_path = os.path.join(self.tempdir, 'timebook.sock')
+        self.db = timebook.db.Database(
+            self.db_path,
+            parse_config(self.config_path)
+        )
+        self.server = TimebookDaemon(self.socket_path, self.db)
+
+    def tearDown(self):
+        self.server.server_close()
+        shutil.rmtree(self.tempdir)
+
+    def argv(self, *args):
+        return ['-C', self.config_path, '-b', self.db_path] + list(args)
+
+    def test_run_captures_output(self):
+        status, stdout, stderr = self.server.run(self.argv('in', 'a task'))
+        self.assertEqual((status, stdout, stderr), (0, '', ''))
+
+        status, stdout, stderr = self.server.run(self.argv('now'))
+        self.assertEqual(status, 0)
+        self.assertTrue(stdout.startswith('default: '))
+        self.assertTrue('a task' in stdout)
+
+    def test_run_reports_command_errors(self):
+        status, stdout, stderr = self.server.run(self.argv('out'))
+        self.assertEqual(status, 1)
+        self.assertEqual(stderr, 'error: timesheet not active\n')
+
+    def test_interactive_commands_run_locally(self):
+        status, stdout, stderr = self.server.run(self.argv('kill'))
+        self.assertEqual(status, client.RUN_LOCALLY)
+
+    def test_other_timebooks_run_locally(self):
+        status, stdout, stderr = self.server.run(
+            ['-C', self.config_path, '-b', self.db_path + '.other', 'now']
+        )
+        self.assertEqual(status, client.RUN_LOCALLY)
+
+    def test_relative_paths_run_locally(self):
+        cwd = os.getcwd()
+        os.chdir(self.tempdir)
+        try:
+            status, stdout, stderr = self.server.run(
+                ['-C', 'timebook.ini', '-b', 'sheets.db', 'now']
+            )
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(status, client.RUN_LOCALLY)
+
+    def test_profiled_commands_run_locally(self):
+        status, stdout, stderr = self.server.run(self.argv('--profile', 'now'))
+        self.assertEqual(status, client.RUN_LOCALLY)
+
+    def test_run_in_client_environment(self):
+        hook_path = os.path.join(self.tempdir, 'hook.sh')
+        with open(hook_path, 'w') as f:
+            f.write('#!/bin/sh\necho "$GREETING from $(pwd)"\n'
+                    'echo warning >&2\n')
+        os.chmod(hook_path, 0o755)
+        with open(self.config_path, 'w') as f:
+            f.write('[default]\npre_hook = %s\n' % hook_path)
+        cwd = os.path.realpath(tempfile.mkdtemp(dir=self.tempdir))
+        environ = dict(os.environ, GREETING='hello')
+        environ.pop('TIMEBOOK_TRACE_SQL', None)
+        status, stdout, stderr = self.server.run(
+            self.argv('in', 'a task'), cwd, environ
+        )
+        self.assertEqual(
+            (status, stdout, stderr),
+            (0, 'hello from %s\n' % cwd, 'warning\n')
+        )
+        self.assertFalse('GREETING' in os.environ)
+        self.assertNotEqual(os.getcwd(), cwd)
+
+        status, stdout, stderr = self.server.run(
+            self.argv('now'), cwd, dict(environ, TIMEBOOK_TRACE_SQL='1')
+        )
+        self.assertEqual(status, client.RUN_LOCALLY)
+
+    def test_request_round_trip(self):
+        argv = ['in', 'a=b', u'caf\xe9'.encode('utf-8'), '']
+        environ = {'A': 'x=y', 'EMPTY': ''}
+        self.assertEqual(
+            client.decode_request(
+                client.encode_request(argv, '/tmp', environ)
+            ),
+            (argv, '/tmp', environ)
+        )
+
+    def test_forward(self):
+        # The database may only be used from the thread that opened it, so
+        # the client runs in the background instead of the server.
+        result = {}
+
+        def forward():
+            result['status'] = client.forward(
+                self.argv('now', '--simple'),
+                self.socket_path
+            )
+        thread = threading.Thread(target=forward)
+        stdout = StringIO.StringIO()
+        with mock.patch('sys.stdout', stdout):
+            thread.start()
+            self.server.handle_request()
+            thread.join()
+        self.assertEqual(result['status'], 0)
+        self.assertEqual(stdout.getvalue(), 'default\n')
+
+    def test_forward_without_daemon(self):
+        self.server.server_close()
+        self.assertEqual(
+            client.forward(self.argv('now'), self.socket_path),
+            None
+        )
@@ -0,0 +1,117 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import mock
+
+from timebook.config import parse_config
+from timebook.migrations import LATEST_VERSION
+import timebook.db
+
+
+class TestDatabase(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.tempdir, 'timebook.ini')
+        self.db_path = os.path.join(self.tempdir, 'sheets.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def open(self, **settings):
+        config = parse_config(self.config_path)
+        if settings:
+            config.add_section('database')
+            for name, value in settings.items():
+                config.set('database', name, str(value))
+        return timebook.db.Database(self.db_path, config)
+
+    def pragma(self, db, name):
+        db.execute(u'pragma %s' % name)
+        return db.fetchone()[0]
+
+    def test_defaults(self):
+        db = self.open()
+        self.assertEqual(self.pragma(db, 'journal_mode'), 'wal')
+        self.assertEqual(
+            self.pragma(db, 'busy_timeout'), timebook.db.DEFAULT_BUSY_TIMEOUT
+        )
+
+    def test_configured_settings(self):
+        db = self.open(journal_mode='delete', busy_timeout=250)
+        self.assertEqual(self.pragma(db, 'journal_mode'), 'delete')
+        self.assertEqual(self.pragma(db, 'busy_timeout'), 250)
+
+    def test_invalid_journal_mode(self):
+        self.assertRaises(ValueError, self.open, journal_mode='wal; drop')
+
+    def test_readers_do_not_block_writer(self):
+        reader = self.open()
+        writer = self.open(busy_timeout=0, lock_retries=0)
+        reader.execute(u'begin')
+        reader.execute(u'select count(*) from entry')
+        reader.fetchone()
+        writer.begin()
+        writer.execute(u'''
+            insert into entry (sheet, start_time) values ('default', 0)
+        ''')
+        writer.execute(u'commit')
+        reader.execute(u'commit')
+
+    def test_begin_retries_while_locked(self):
+        holder = self.open()
+        db = self.open(busy_timeout=0, lock_retries=3, lock_backoff=0.5)
+        holder.begin()
+        with mock.patch('time.sleep') as sleep:
+            self.assertRaises(sqlite3.OperationalError, db.begin)
+        self.assertEqual(
+            [call[0][0] for call in sleep.call_args_list], [0.5, 1.0, 2.0]
+        )
+
+        def release(seconds):
+            holder.execute(u'commit')
+        with mock.patch('time.sleep', side_effect=release) as sleep:
+            db.begin()
+        self.assertEqual(sleep.call_count, 1)
+        db.execute(u'commit')
+
+    def test_read_only(self):
+        self.open().connection.close()
+        db = timebook.db.Database(
+            self.db_path, parse_config(self.config_path), read_only=True
+        )
+        self.assertTrue(db.read_only)
+        self.assertEqual(db.db_version, LATEST_VERSION)
+        self.assertRaises(
+            sqlite3.OperationalError, db.execute,
+            u"insert into entry (sheet, start_time) values ('default', 0)"
+        )
+
+    def test_read_only_creates_and_migrates(self):
+        config = parse_config(self.config_path)
+        db = timebook.db.Database(self.db_path, config, read_only=True)
+        self.assertFalse(db.read_only)
+        db.execute(u"update meta set value = 1 where key = 'db_version'")
+        db.connection.close()
+        db = timebook.db.Database(self.db_path, config, read_only=True)
+        self.assertFalse(db.read_only)
+        self.assertEqual(db.db_version, LATEST_VERSION)
+
+    def test_query_cursors_are_independent(self):
+        db = self.open()
+        for start in range(3):
+            db.execute(u'''
+                insert into entry (sheet, start_time, end_time)
+                values ('default', ?, ?)
+            ''', (start, start + 1))
+        rows = db.query(u'select start_time from entry order by start_time')
+        other = db.query(u'select count(*) from entry')
+        seen = []
+        for row in rows:
+            seen.append(row[0])
+            db.execute(u'select id from entry where start_time = ?', row)
+            self.assertEqual(len(db.fetchall()), 1)
+        self.assertEqual(seen, [0, 1, 2])
+        self.assertEqual(other.fetchone(), (3, ))
@@ -0,0 +1,382 @@
+import datetime
+import os
+import sqlite3
+import time
+import unittest
+
+import mock
+
+from timebook import dbutil
+from timebook.config import ConfigParser
+import timebook.db
+
+
+class TestEntryMeta(unittest.TestCase):
+    def setUp(self):
+        self.db = timebook.db.Database(':memory:', ConfigParser())
+
+    def test_update_entry_meta(self):
+        dbutil.update_entry_meta(self.db, 1, {'ticket': '10', 'a': 'x'})
+        dbutil.update_entry_meta(self.db, 1, {'ticket': '10', 'a': 'y'})
+        self.assertEqual(
+            dbutil.get_entry_meta(self.db, 1), {'ticket': '10', 'a': 'y'}
+        )
+        self.db.execute(u'select count(*) from entry_meta')
+        self.assertEqual(self.db.fetchone()[0], 2)
+
+    def test_update_entry_meta_is_one_statement(self):
+        tracer = self.db.start_tracing()
+        meta = {'ticket': '10', 'a': 'x', 'billable': 'yes'}
+        dbutil.update_entry_meta(self.db, 1, meta)
+        self.assertEqual(tracer.count, 1)
+        self.assertEqual(tracer.queries[0].rows, 3)
+        self.assertEqual(len(tracer.queries[0].params), 3)
+
+        tracer.reset()
+        dbutil.update_entry_meta(self.db, 1, meta)
+        self.assertEqual(tracer.count, 1)
+        self.assertEqual(tracer.queries[0].rows, 0)
+        self.assertEqual(dbutil.get_entry_meta(self.db, 1), meta)
+
+    def test_update_entry_meta_without_upsert(self):
+        tracer = self.db.start_tracing()
+        with mock.patch('sqlite3.sqlite_version_info', (3, 23, 1)):
+            dbutil.update_entry_meta(self.db, 1, {'ticket': '10', 'a': 'x'})
+            dbutil.update_entry_meta(self.db, 1, {'a': 'y', 'b': 'z'})
+        self.assertFalse(any(
+            'on conflict' in query.sql for query in tracer.queries
+        ))
+        self.assertEqual(
+            dbutil.get_entry_meta(self.db, 1),
+            {'ticket': '10', 'a': 'y', 'b': 'z'}
+        )
+
+
+class TestLocalDays(unittest.TestCase):
+    def setUp(self):
+        self.db = timebook.db.Database(':memory:', ConfigParser())
+        self.tz = os.environ.get('TZ')
+
+    def tearDown(self):
+        if self.tz is None:
+            os.environ.pop('TZ', None)
+        else:
+            os.environ['TZ'] = self.tz
+        time.tzset()
+
+    def set_timezone(self, tz):
+        os.environ['TZ'] = tz
+        time.tzset()
+
+    def get_day(self, id):
+        self.db.execute(u'select day from entry where id = ?', (id, ))
+        return self.db.fetchone()[0]
+
+    def test_day_follows_start_time(self):
+        self.set_timezone('UTC')
+        # 2012-01-01 23:30 UTC
+        self.db.execute(u'''
+            insert into entry (sheet, start_time) values ('default', 1325460600)
+        ''')
+        self.assertEqual(self.get_day(1), '2012-01-01')
+        self.db.execute(u'update entry set start_time = start_time + 3600')
+        self.assertEqual(self.get_day(1), '2012-01-02')
+
+    def test_rebuild_local_days(self):
+        self.set_timezone('UTC')
+        self.db.execute(u'''
+            insert into entry (sheet, start_time) values ('default', 1325460600)
+        ''')
+        self.db.execute(u'''
+            insert into entry (sheet, start_time, end_time)
+            values ('default', 1325415600, 1325419200)
+        ''')
+        self.assertEqual(dbutil.rebuild_local_days(self.db), 0)
+        self.set_timezone('Asia/Tokyo')
+        self.assertEqual(dbutil.rebuild_local_days(self.db), 1)
+        self.assertEqual(self.get_day(1), '2012-01-02')
+        self.assertEqual(self.get_day(2), '2012-01-01')
+
+
+class TestDailyTotals(unittest.TestCase):
+    def setUp(self):
+        self.db = timebook.db.Database(':memory:', ConfigParser())
+        self.tz = os.environ.get('TZ')
+        os.environ['TZ'] = 'UTC'
+        time.tzset()
+
+    def tearDown(self):
+        if self.tz is None:
+            os.environ.pop('TZ', None)
+        else:
+            os.environ['TZ'] = self.tz
+        time.tzset()
+
+    def get_totals(self):
+        self.db.execute(u'''
+            select sheet, day, seconds, entry_count from daily_totals
+            order by sheet, day
+        ''')
+        return self.db.fetchall()
+
+    def insert(self, sheet, start_time, end_time=None):
+        self.db.execute(u'''
+            insert into entry (sheet, start_time, end_time) values (?, ?, ?)
+        ''', (sheet, start_time, end_time))
+        return self.db.cursor.lastrowid
+
+    def test_totals_follow_entries(self):
+        # 2012-01-01 10:00 UTC
+        start = 1325412000
+        first = self.insert('default', start, start + 3600)
+        running = self.insert('default', start + 7200)
+        self.assertEqual(self.get_totals(), [('default', '2012-01-01', 3600, 1)])
+
+        self.db.execute(u'update entry set end_time = ? where id = ?',
+                        (start + 9000, running))
+        self.assertEqual(self.get_totals(), [('default', '2012-01-01', 5400, 2)])
+
+        self.db.execute(u'''
+            update entry set start_time = start_time + 86400,
+                end_time = end_time + 86400
+            where id = ?
+        ''', (first, ))
+        self.assertEqual(self.get_totals(), [
+            ('default', '2012-01-01', 1800, 1),
+            ('default', '2012-01-02', 3600, 1),
+        ])
+
+        self.db.execute(u'update entry set sheet = ? where id = ?',
+                        ('other', running))
+        self.assertEqual(self.get_totals(), [
+            ('default', '2012-01-02', 3600, 1),
+            ('other', '2012-01-01', 1800, 1),
+        ])
+
+        self.db.execute(u'delete from entry where id = ?', (first, ))
+        self.assertEqual(self.get_totals(), [('other', '2012-01-01', 1800, 1)])
+        self.assertEqual(dbutil.check_daily_totals(self.db), [])
+
+    def test_check_and_rebuild(self):
+        self.insert('default', 1325412000, 1325415600)
+        self.db.execute(u'update daily_totals set seconds = 60')
+        self.db.execute(u'''
+            insert into daily_totals values ('gone', '2012-01-01', 60, 1)
+        ''')
+        self.assertEqual(dbutil.check_daily_totals(self.db), [
+            ('default', '2012-01-01', (60, 1), (3600, 1)),
+            ('gone', '2012-01-01', (60, 1), None),
+        ])
+        dbutil.rebuild_daily_totals(self.db)
+        self.assertEqual(dbutil.check_daily_totals(self.db), [])
+        self.assertEqual(self.get_totals(), [('default', '2012-01-01', 3600, 1)])
+
+
+class TestSheets(unittest.TestCase):
+    def setUp(self):
+        self.db = timebook.db.Database(':memory:', ConfigParser())
+
+    def insert(self, sheet, start_time, end_time=None):
+        self.db.execute(u'''
+            insert into entry (sheet, start_time, end_time) values (?, ?, ?)
+        ''', (sheet, start_time, end_time))
+        return self.db.cursor.lastrowid
+
+    def get_sheets(self):
+        self.db.execute(u'''
+            select name, entry_count, seconds, running_entry_id from sheet
+            order by name
+        ''')
+        return self.db.fetchall()
+
+    def test_counters_follow_entries(self):
+        first = self.insert('default', 0, 3600)
+        running = self.insert('default', 7200)
+        self.assertEqual(self.get_sheets(), [('default', 2, 3600, running)])
+
+        self.db.execute(u'update entry set end_time = 9000 where id = ?',
+                        (running, ))
+        self.assertEqual(self.get_sheets(), [('default', 2, 5400, None)])
+
+        self.db.execute(u'update entry set sheet = ? where id = ?',
+                        ('other', first))
+        self.assertEqual(self.get_sheets(), [
+            ('default', 1, 1800, None),
+            ('other', 1, 3600, None),
+        ])
+        self.db.execute(u'pragma table_info(entry)')
+        self.assertNotIn(
+            'sheet_id', [column[1] for column in self.db.fetchall()]
+        )
+
+        self.db.execute(u'delete from entry where id = ?', (running, ))
+        self.assertEqual(dbutil.get_sheet_names(self.db), ('other', ))
+        self.assertEqual(dbutil.get_entry_count(self.db, 'default'), 0)
+        self.assertEqual(dbutil.get_entry_count(self.db, 'other'), 1)
+        self.assertEqual(dbutil.get_entry_count(self.db, 'missing'), 0)
+        self.assertEqual(dbutil.check_sheet_counters(self.db), [])
+
+    def test_check_and_rebuild(self):
+        running = self.insert('default', 0)
+        self.db.execute(u'''
+            update sheet set entry_count = 3, running_entry_id = null
+        ''')
+        self.assertEqual(dbutil.check_sheet_counters(self.db), [
+            ('default', (3, 0, None), (1, 0, running)),
+        ])
+        dbutil.rebuild_sheet_counters(self.db)
+        self.assertEqual(dbutil.check_sheet_counters(self.db), [])
+        self.assertEqual(
+            [row[:2] for row in dbutil.get_running_entries(self.db)],
+            [('default', 0)]
+        )
+
+
+class TestRunningEntry(unittest.TestCase):
+    def setUp(self):
+        self.db = timebook.db.Database(':memory:', ConfigParser())
+
+    def insert(self, sheet, start_time, end_time=None):
+        self.db.execute(u'''
+            insert into entry (sheet, start_time, end_time, description)
+            values (?, ?, ?, 'working')
+        ''', (sheet, start_time, end_time))
+        return self.db.cursor.lastrowid
+
+    def test_lookups(self):
+        self.insert('default', 0, 10)
+        self.assertEqual(dbutil.get_current_start_time(self.db), None)
+        running = self.insert('default', 20)
+        self.insert('other', 30)
+        self.assertEqual(
+            dbutil.get_current_start_time(self.db), (running, 20)
+        )
+        self.assertEqual(dbutil.get_current_active_info(self.db)[0], running)
+        self.assertEqual(
+            dbutil.get_active_info(self.db, 'default')[1:],
+            ('working', running)
+        )
+        self.assertEqual(dbutil.get_active_info(self.db, 'missing'), None)
+
+    def test_one_running_entry_per_sheet(self):
+        finished = self.insert('default', 0, 10)
+        self.insert('default', 20)
+        self.assertRaises(
+            sqlite3.IntegrityError, self.insert, 'default', 30
+        )
+        self.assertRaises(
+            sqlite3.IntegrityError, self.db.execute,
+            u'update entry set end_time = null where id = ?', (finished, )
+        )
+        self.insert('other', 30)
+        self.assertEqual(dbutil.get_entry_count(self.db, 'default'), 2)
+
+
+class TestNeighbors(unittest.TestCase):
+    def setUp(self):
+        self.db = timebook.db.Database(':memory:', ConfigParser())
+        self.first = self.insert('default', 0, 10)
+        self.second = self.insert('default', 20, 30)
+        self.insert('other', 10, 20)
+
+    def insert(self, sheet, start_time, end_time=None):
+        self.db.execute(u'''
+            insert into entry (sheet, start_time, end_time, description)
+            values (?, ?, ?, 'working')
+        ''', (sheet, start_time, end_time))
+        return self.db.cursor.lastrowid
+
+    def get_overlapping_ids(self, start, end=None):
+        return [
+            entry[0] for entry in dbutil.get_overlapping_neighbors(
+                self.db, 'default', start, end
+            )
+        ]
+
+    def test_neighbors(self):
+        self.assertEqual(
+            dbutil.get_previous_entry(self.db, 'default', 20),
+            (self.second, 20, 30, 'working')
+        )
+        self.assertEqual(
+            dbutil.get_next_entry(self.db, 'default', 5)[0], self.second
+        )
+        self.assertEqual(dbutil.get_previous_entry(self.db, 'other', 5), None)
+        self.assertEqual(dbutil.get_next_entry(self.db, 'default', 20), None)
+
+    def test_overlapping_neighbors(self):
+        self.assertEqual(self.get_overlapping_ids(10, 20), [])
+        self.assertEqual(self.get_overlapping_ids(30), [])
+        self.assertEqual(self.get_overlapping_ids(5, 15), [self.first])
+        self.assertEqual(self.get_overlapping_ids(15, 25), [self.second])
+        self.assertEqual(
+            self.get_overlapping_ids(5, 25), [self.first, self.second]
+        )
+        self.assertEqual(self.get_overlapping_ids(15), [self.second])
+        running = self.insert('default', 40)
+        self.assertEqual(self.get_overlapping_ids(50, 60), [running])
+
+
+class TestIntervals(unittest.TestCase):
+    def setUp(self):
+        self.db = timebook.db.Database(':memory:', ConfigParser())
+        self.first = self.insert('default', 0, 10)
+        self.second = self.insert('other', 5, 20)
+
+    def insert(self, sheet, start_time, end_time=None):
+        self.db.execute(u'''
+            insert into entry (sheet, start_time, end_time, description)
+            values (?, ?, ?, 'working')
+        ''', (sheet, start_time, end_time))
+        return self.db.cursor.lastrowid
+
+    def get_overlapping_ids(self, start, end):
+        return [
+            entry[0]
+            for entry in dbutil.get_overlapping_entries(self.db, start, end)
+        ]
+
+    def test_index_follows_entries(self):
+        running = self.insert('default', 30)
+        self.db.execute(u'select id, start_time, end_time from entry_interval')
+        intervals = sorted(self.db.fetchall())
+        self.assertEqual(
+            intervals[:2], [(self.first, 0, 10), (self.second, 5, 20)]
+        )
+        # Bounds are rounded outwards to single precision.
+        self.assertEqual(intervals[2][:2], (running, 30))
+        self.assertTrue(intervals[2][2] >= dbutil.RUNNING_END)
+        self.db.execute(
+            u'update entry set end_time = 40 where id = ?', (running, )
+        )
+        self.db.execute(u'delete from entry where id = ?', (self.first, ))
+        self.db.execute(u'select id, end_time from entry_interval')
+        self.assertEqual(
+            sorted(self.db.fetchall()), [(self.second, 20), (running, 40)]
+        )
+
+    def test_overlapping_entries(self):
+        self.assertTrue(dbutil.has_interval_index(self.db))
+        self.assertEqual(
+            self.get_overlapping_ids(7, 8), [self.first, self.second]
+        )
+        self.assertEqual(self.get_overlapping_ids(10, 11), [self.second])
+        self.assertEqual(self.get_overlapping_ids(20, 30), [])
+        running = self.insert('default', 30)
+        self.assertEqual(self.get_overlapping_ids(25, 35), [running])
+        # Running entries end now.
+        self.assertEqual(
+            self.get_overlapping_ids(time.time() + 60, time.time() + 120), []
+        )
+
+    def test_count_hours_after(self):
+        from timebook.payperiodutil import PayPeriodUtil
+        self.insert('default', 3600, 3 * 3600)
+        util = PayPeriodUtil(self.db, 'Weekly')
+        self.assertEqual(
+            util.count_hours_after(
+                datetime.datetime.fromtimestamp(2 * 3600),
+                datetime.datetime.fromtimestamp(5 * 3600),
+            ),
+            1.0
+        )
@@ -0,0 +1,66 @@
+import unittest
+
+from timebook import dbutil, maintenance
+from timebook.config import ConfigParser
+import timebook.db
+
+
+class TestMaintenance(unittest.TestCase):
+    def setUp(self):
+        self.db = timebook.db.Database(':memory:', ConfigParser())
+
+    def insert(self, sheet, description):
+        self.db.execute(u'''
+            insert into entry (sheet, start_time, end_time, description)
+            values (?, 0, 1, ?)
+        ''', (sheet, description))
+        entry_id = self.db.cursor.lastrowid
+        dbutil.update_entry_meta(self.db, entry_id, {'billable': 'yes'})
+        self.db.execute(u'''
+            insert into entry_details (entry_id, billable) values (?, 1)
+        ''', (entry_id, ))
+        return entry_id
+
+    def test_delete_orphans(self):
+        kept = self.insert('default', 'kept')
+        deleted = self.insert('default', 'deleted')
+        self.db.execute(u'delete from entry where id = ?', (deleted, ))
+        self.assertEqual(
+            maintenance.delete_orphans(self.db),
+            {'entry_meta': 1, 'entry_details': 1}
+        )
+        self.assertEqual(dbutil.get_entry_meta(self.db, kept),
+                         {'billable': 'yes'})
+        self.assertEqual(
+            maintenance.delete_orphans(self.db),
+            {'entry_meta': 0, 'entry_details': 0}
+        )
+
+    def test_vacuum(self):
+        for i in range(500):
+            self.insert('default', 'x' * 200)
+        maintenance.vacuum(self.db)
+        self.db.execute(u'pragma auto_vacuum')
+        self.assertEqual(
+            self.db.fetchone()[0], maintenance.AUTO_VACUUM_INCREMENTAL
+        )
+        self.db.execute(u'delete from entry')
+        self.assertTrue(maintenance.vacuum(self.db) > 0)
+        self.assertEqual(maintenance.get_file_usage(self.db)[2], 0)
+
+    def test_checks_and_sizes(self):
+        self.insert('default', 'x')
+        maintenance.analyze(self.db)
+        self.assertEqual(maintenance.check_integrity(self.db), [])
+        sizes = dict(
+            (name, (rows, pages)) for name, rows, pages
+            in maintenance.get_table_sizes(self.db)
+        )
+        self.assertEqual(sizes['entry'][0], 1)
+        self.assertEqual(sizes['entry_meta'][0], 1)
+        self.assertFalse('sqlite_stat1' in sizes)
+        if 'entry_interval' in sizes:
+            # The R*Tree's shadow tables are counted as part of it.
+            self.assertEqual(sizes['entry_interval'][0], 1)
+            self.assertNotEqual(sizes['entry_interval'][1], 0)
+            self.assertFalse('entry_interval_node' in sizes)
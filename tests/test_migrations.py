@@ -0,0 +1,123 @@
+import os
+import re
+import unittest
+
+import mock
+
+from timebook import dbutil, migrations
+from timebook.config import ConfigParser
+import timebook.db
+
+
+class TestMigrationManager(unittest.TestCase):
+    def setUp(self):
+        self.db = timebook.db.Database(':memory:', ConfigParser())
+
+    def test_manifest_lists_every_migration_module(self):
+        on_disk = []
+        for filename in os.listdir(os.path.dirname(migrations.__file__)):
+            match = re.match(r'^(\d+)(\D*)\.py$', filename)
+            if match:
+                on_disk.append((int(match.group(1)), filename[:-3]))
+        self.assertEqual(sorted(on_disk), list(migrations.MIGRATIONS))
+
+    def test_fresh_database_is_upgraded_to_latest(self):
+        self.assertEqual(self.db.db_version, migrations.LATEST_VERSION)
+
+    def test_current_database_does_not_load_migrations(self):
+        manager = migrations.MigrationManager(self.db)
+        with mock.patch.object(manager, '_find_migration_modules') as find:
+            manager.upgrade()
+        self.assertFalse(find.called)
+
+    def test_only_pending_migrations_are_loaded(self):
+        self.db.execute(u'''
+            UPDATE meta SET value = ? WHERE key = 'db_version'
+        ''', (migrations.LATEST_VERSION - 1, ))
+        manager = migrations.MigrationManager(self.db)
+        modules = manager._find_migration_modules(after=self.db.db_version)
+        self.assertEqual(
+            [module['number'] for module in modules],
+            [migrations.LATEST_VERSION]
+        )
+
+    def test_hot_query_indexes_remove_duplicates(self):
+        self.db.executescript(u'''
+            drop index entry_meta_entry_id_key;
+            drop index ticket_details_number;
+            insert into entry_meta (entry_id, key, value) values (1, 'a', 'x');
+            insert into entry_meta (entry_id, key, value) values (1, 'a', 'y');
+            insert into entry_meta (entry_id, key, value) values (1, 'b', 'z');
+            insert into ticket_details (number, project) values (10, 'old');
+            insert into ticket_details (number, project) values (10, 'new');
+            update meta set value = 3 where key = 'db_version';
+        ''')
+        migrations.MigrationManager(self.db).upgrade()
+        self.db.execute(u'select entry_id, key, value from entry_meta')
+        self.assertEqual(
+            sorted(self.db.fetchall()), [(1, 'a', 'y'), (1, 'b', 'z')]
+        )
+        self.db.execute(u'select number, project from ticket_details')
+        self.assertEqual(self.db.fetchall(), [(10, 'new')])
+        self.db.execute(u'''
+            select name from sqlite_master where type = 'index'
+        ''')
+        indexes = set(row[0] for row in self.db.fetchall())
+        self.assertTrue(set([
+            'entry_sheet_start_time', 'entry_sheet_end_time',
+            'entry_meta_entry_id_key',
+            'ticket_details_number', 'holidays_date', 'vacation_date',
+            'unpaid_date',
+        ]).issubset(indexes))
+        self.assertFalse('entry_sheet' in indexes)
+
+    def test_extra_running_entries_are_ended(self):
+        self.db.executescript(u'''
+            drop trigger entry_running_insert;
+            drop trigger entry_running_update;
+            insert into entry (sheet, start_time) values ('default', 100);
+            insert into entry (sheet, start_time, end_time)
+                values ('default', 200, 300);
+            insert into entry (sheet, start_time) values ('default', 400);
+            insert into entry (sheet, start_time) values ('default', 500);
+            insert into entry (sheet, start_time) values ('other', 50);
+            update meta set value = 7 where key = 'db_version';
+        ''')
+        with mock.patch('timebook.logger.warning') as warning:
+            migrations.MigrationManager(self.db).upgrade()
+        self.assertTrue('Ending 2 entries' in warning.call_args[0][0])
+        self.db.execute(u'select id, end_time from entry order by id')
+        self.assertEqual(
+            self.db.fetchall(),
+            [(1, 200), (2, 300), (3, 500), (4, None), (5, None)]
+        )
+
+        storage = self.db.storage
+        self.assertEqual(storage.get_running_entry('default')[0], 4)
+        storage.update_entry(4, end_time=600)
+        self.assertEqual(storage.get_running_entry('default'), None)
+        storage.add_entry('default', 700)
+        self.assertEqual(storage.get_running_entry('default')[0], 6)
+
+    def test_daily_totals_without_upsert(self):
+        self.db.executescript(u'''
+            drop trigger entry_insert;
+            drop trigger entry_update;
+            update meta set value = 5 where key = 'db_version';
+        ''')
+        with mock.patch('sqlite3.sqlite_version_info', (3, 23, 1)):
+            migrations.MigrationManager(self.db).upgrade()
+        self.db.execute(u'''
+            select sql from sqlite_master where name = 'entry_insert'
+        ''')
+        self.assertFalse('on conflict' in self.db.fetchone()[0])
+
+        storage = self.db.storage
+        first = storage.add_entry('default', 0, 60)
+        storage.add_entry('default', 120, 180)
+        running = storage.add_entry('default', 240)
+        storage.update_entry(running, end_time=330)
+        storage.update_entry(first, start_time=30)
+        self.db.execute(u'select seconds, entry_count from daily_totals')
+        self.assertEqual(self.db.fetchall(), [(180, 3)])
+        self.assertEqual(dbutil.check_daily_totals(self.db), [])
@@ -0,0 +1,100 @@
+import datetime
+import json
+import os
+import pstats
+import shutil
+from StringIO import StringIO
+import tempfile
+import unittest
+
+import mock
+
+from timebook import cmdline, profiling
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        profiling.disable()
+        shutil.rmtree(self.tempdir)
+
+    def run_t(self, *argv):
+        argv = [
+            't',
+            '-C', os.path.join(self.tempdir, 'timebook.ini'),
+            '-b', os.path.join(self.tempdir, 'sheets.db'),
+        ] + list(argv)
+        environ = {'TIMEBOOK_SOCKET': os.path.join(self.tempdir, 'sock')}
+        with mock.patch('sys.argv', argv), \
+                mock.patch.dict('os.environ', environ), \
+                mock.patch('sys.stdout', StringIO()), \
+                mock.patch('sys.stderr', StringIO()) as stderr:
+            cmdline.run_from_cmdline()
+        return stderr.getvalue()
+
+    def test_phases_are_only_timed_when_enabled(self):
+        with profiling.phase('command'):
+            pass
+        self.assertEqual(profiling.timings, {})
+        profiling.enable()
+        with mock.patch('time.time', side_effect=[10.0, 10.5, 11.0, 11.25]):
+            with profiling.phase('command'):
+                pass
+            with profiling.phase('command'):
+                pass
+        self.assertEqual(profiling.timings, {'command': 0.75})
+
+    def test_nested_phases_are_timed_once(self):
+        profiling.enable()
+        with mock.patch('time.time', side_effect=[10.0, 12.0]):
+            with profiling.phase('command'):
+                with profiling.phase('hooks'):
+                    with profiling.phase('command'):
+                        pass
+        self.assertEqual(profiling.timings, {'command': 2.0})
+
+    def test_commands_running_commands_add_up(self):
+        self.run_t('in', '--at', (
+            datetime.datetime.now() - datetime.timedelta(hours=2)
+        ).strftime('%Y-%m-%d %H:%M'), 'writing')
+        report_path = os.path.join(self.tempdir, 'profile.json')
+        for argv in (['backdate', '1h', 'reading'], ['change', 'editing']):
+            self.run_t('--profile-output', report_path, *argv)
+            with open(report_path) as f:
+                report = json.load(f)
+            self.assertTrue(report['phases']['command'] > 0, argv)
+            self.assertTrue(
+                report['total'] >= sum(report['phases'].values()), argv
+            )
+
+    def test_profile_prints_phases(self):
+        output = self.run_t('--profile', 'in', 'writing')
+        phases = [line.split()[0] for line in output.splitlines()[1:]]
+        for name in ('import', 'config', 'db_open', 'migrations', 'hooks',
+                     'command', 'commit', 'indexes', 'other', 'total'):
+            self.assertIn(name, phases)
+        self.assertFalse(profiling.enabled)
+
+    def test_profile_output_and_dump(self):
+        report_path = os.path.join(self.tempdir, 'profile.json')
+        dump_path = os.path.join(self.tempdir, 'profile.prof')
+        output = self.run_t(
+            '--profile-output', report_path, '--profile-dump', dump_path,
+            'in', 'writing'
+        )
+        self.assertEqual(output, '')
+        with open(report_path) as f:
+            report = json.load(f)
+        self.assertEqual(report['argv'][-2:], ['in', 'writing'])
+        self.assertTrue(report['phases']['command'] > 0)
+        self.assertTrue(
+            report['total'] >= sum(report['phases'].values())
+        )
+        functions = [
+            function for (_, _, function)
+            in pstats.Stats(dump_path).stats
+        ]
+        self.assertIn('in_', functions)
+        self.assertNotIn('parse_config', functions)
@@ -0,0 +1,132 @@
+import subprocess
+import sys
+import unittest
+
+from timebook import registry
+import timebook.commands as cmds
+
+# Commands run from shell prompts and editor hooks many times a minute.
+HOT_COMMANDS = ('now', 'in', 'out', 'change', 'alter', 'switch', 'running')
+
+# Modules which none of the hot commands may cause to be imported.
+IMPORT_BUDGET_EXCLUDES = (
+    'base64',
+    'dateutil',
+    'hashlib',
+    'httplib',
+    'imp',
+    'inspect',
+    'json',
+    'subprocess',
+    'timebook.archive',
+    'timebook.autopost',
+    'timebook.backup',
+    'timebook.chiliproject',
+    'timebook.completion',
+    'timebook.maintenance',
+    'timebook.payperiodutil',
+    'timebook.snapshot',
+    'urllib',
+    'urllib2',
+    'urlparse',
+)
+
+# The only timebook modules the hot commands may cause to be imported.
+HOT_TIMEBOOK_MODULES = (
+    'timebook',
+    'timebook.client',
+    'timebook.cmdline',
+    'timebook.cmdutil',
+    'timebook.commands',
+    'timebook.dbutil',
+    'timebook.exceptions',
+    'timebook.profiling',
+    'timebook.registry',
+)
+
+# The most modules, timebook's and the standard library's, that loading the
+# hot commands may import; it took 44 on Python 2.7.
+MAX_HOT_IMPORTS = 48
+
+# The longest, in seconds, that loading the hot commands may take, at best
+# of IMPORT_TIME_RUNS fresh interpreters; it took 0.05 on Python 2.7,
+# without compiled modules to read.
+MAX_HOT_IMPORT_TIME = 0.15
+IMPORT_TIME_RUNS = 5
+
+# Loads the hot commands, then prints the modules imported and the time
+# taken.
+HOT_IMPORTS_SCRIPT = '''
+import sys
+import time
+before = set(sys.modules)
+start = time.time()
+import timebook.cmdline
+from timebook import registry
+for name in %r:
+    registry.commands[name].load()
+elapsed = time.time() - start
+print " ".join(
+    name for name in set(sys.modules) - before
+    if sys.modules[name] is not None
+)
+print elapsed
+''' % (HOT_COMMANDS, )
+
+
+class TestRegistry(unittest.TestCase):
+    def test_registry_matches_implementations(self):
+        loaded = dict(
+            (name, info.load()) for name, info in registry.commands.items()
+        )
+        self.assertEqual(
+            sorted(registry.commands),
+            sorted(cmds.commands)
+        )
+        for name, info in registry.commands.items():
+            func = loaded[name]
+            self.assertEqual(func.description, info.description)
+            self.assertEqual(func.locking, info.locking)
+            self.assertEqual(func.read_only, info.read_only)
+
+    def test_query_only_commands_take_no_locks(self):
+        for name, info in registry.commands.items():
+            if info.query_only:
+                self.assertTrue(info.read_only, name)
+                self.assertFalse(info.locking, name)
+
+    def test_aliases_match_implementations(self):
+        self.assertEqual(registry.cmd_aliases, cmds.cmd_aliases)
+
+    def load_hot_commands(self):
+        """Returns the modules imported by loading the hot commands in a
+        fresh interpreter, and the time it took."""
+        output = subprocess.check_output(
+            [sys.executable, '-c', HOT_IMPORTS_SCRIPT]
+        )
+        modules, elapsed = output.splitlines()
+        return set(modules.split()), float(elapsed)
+
+    def test_hot_commands_import_budget(self):
+        loaded, _ = self.load_hot_commands()
+        self.assertEqual(
+            sorted(loaded.intersection(IMPORT_BUDGET_EXCLUDES)),
+            []
+        )
+        self.assertEqual(
+            sorted(name for name in loaded if name.startswith('timebook')),
+            sorted(HOT_TIMEBOOK_MODULES)
+        )
+        self.assertTrue(
+            len(loaded) <= MAX_HOT_IMPORTS,
+            '%d modules imported: %s' % (len(loaded), sorted(loaded))
+        )
+
+    def test_hot_commands_import_time(self):
+        elapsed = min(
+            self.load_hot_commands()[1] for _ in range(IMPORT_TIME_RUNS)
+        )
+        self.assertTrue(
+            elapsed <= MAX_HOT_IMPORT_TIME,
+            'loading the hot commands took %.3fs' % elapsed
+        )
@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import mock
+
+from timebook import snapshot
+from timebook.commands import run_command
+from timebook.config import parse_config
+import timebook.db
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.db = timebook.db.Database(
+            os.path.join(self.tempdir, 'sheets.db'),
+            parse_config(os.path.join(self.tempdir, 'timebook.ini'))
+        )
+        self.path = os.path.join(self.tempdir, 'sheets.status')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_snapshot_path_is_next_to_database(self):
+        self.assertEqual(snapshot.get_snapshot_path(self.db.path), self.path)
+        self.assertEqual(snapshot.get_snapshot_path(':memory:'), None)
+
+    def test_mutating_commands_write_snapshot(self):
+        description = u"it's\nd\xf6ne"
+        run_command(self.db, 'in', ['--ticket=1234', description])
+        current = snapshot.read_snapshot(self.path)
+        self.assertEqual(current['TIMEBOOK_SHEET'], 'default')
+        self.assertEqual(current['TIMEBOOK_DESCRIPTION'], description)
+        self.assertEqual(
+            current['TIMEBOOK_STATUS'],
+            snapshot.get_snapshot(self.db)['TIMEBOOK_STATUS']
+        )
+        self.assertTrue(
+            abs(int(current['TIMEBOOK_START']) - time.time()) < 5
+        )
+
+        run_command(self.db, 'out', [])
+        current = snapshot.read_snapshot(self.path)
+        self.assertEqual(current['TIMEBOOK_START'], '')
+        self.assertEqual(
+            snapshot.format_status(current),
+            'default: (inactive)'
+        )
+
+    def test_switch_writes_snapshot(self):
+        run_command(self.db, 'switch', ['other'])
+        current = snapshot.read_snapshot(self.path)
+        self.assertEqual(current['TIMEBOOK_SHEET'], 'other')
+
+    def test_read_only_commands_do_not_write_snapshot(self):
+        with mock.patch('sys.stdout'):
+            run_command(self.db, 'list', [])
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_format_status(self):
+        current = dict.fromkeys(snapshot.FIELDS, u'')
+        current.update({
+            'TIMEBOOK_SHEET': u'default',
+            'TIMEBOOK_START': u'1000',
+            'TIMEBOOK_STATUS': u'writing; billable: yes',
+        })
+        with mock.patch('time.time', return_value=1090):
+            self.assertEqual(
+                snapshot.format_status(current),
+                u'default: 0:01:30 (writing; billable: yes)'
+            )
+
+    def test_is_snapshot_request(self):
+        config = self.db.config
+        self.assertTrue(
+            snapshot.is_snapshot_request(config, ['now', '--from-snapshot'])
+        )
+        self.assertTrue(
+            snapshot.is_snapshot_request(config, ['info', '--from-snapshot'])
+        )
+        self.assertFalse(snapshot.is_snapshot_request(config, ['now']))
+        self.assertFalse(
+            snapshot.is_snapshot_request(
+                config, ['now', '--from-snapshot', 'other']
+            )
+        )
@@ -0,0 +1,104 @@
+import os
+import shutil
+from StringIO import StringIO
+import tempfile
+import unittest
+
+import mock
+
+from timebook import cmdline
+from timebook.commands import run_command
+from timebook.config import parse_config
+import timebook.db
+
+
+class TestSQLTrace(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.tempdir, 'timebook.ini')
+        self.db_path = os.path.join(self.tempdir, 'sheets.db')
+        self.db = timebook.db.Database(
+            self.db_path, parse_config(self.config_path)
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_counts_statements_and_rows(self):
+        tracer = self.db.start_tracing()
+        run_command(self.db, 'in', ['first'])
+        run_command(self.db, 'out', [])
+        tracer.reset()
+
+        self.db.execute(u'select id from entry')
+        self.db.fetchall()
+        self.db.execute(u'update entry set description = ?', (u'x', ))
+        self.assertEqual(tracer.count, 2)
+        select, update = tracer.queries
+        self.assertEqual(select.sql, 'select id from entry')
+        self.assertEqual(select.rows, 1)
+        self.assertEqual(update.params, (u'x', ))
+        self.assertEqual(update.rows, 1)
+
+    def test_traces_query_cursors(self):
+        stream = StringIO()
+        tracer = self.db.start_tracing(stream)
+        run_command(self.db, 'in', ['first'])
+        run_command(self.db, 'out', [])
+        tracer.reset()
+
+        rows = self.db.query(u'select id from entry where id > ?', (0, ))
+        self.db.execute(u'select count(*) from entry')
+        self.db.fetchone()
+        self.assertEqual(list(rows), [(1, )])
+        self.assertEqual(tracer.count, 2)
+        self.assertEqual(tracer.queries[0].rows, 1)
+        self.assertEqual(tracer.queries[0].params, (0, ))
+        # A query is logged once all its rows have been read, other
+        # statements when the next one starts.
+        tracer.finish()
+        logged = stream.getvalue().splitlines()[-2:]
+        self.assertTrue(logged[0].endswith(
+            'select id from entry where id > ? (0,)'
+        ))
+        self.assertTrue(logged[1].endswith('select count(*) from entry ()'))
+
+    def test_logs_statements_and_summary(self):
+        stream = StringIO()
+        tracer = self.db.start_tracing(stream)
+        for _ in range(3):
+            self.db.execute(u'''
+                select value
+                from meta
+                where key = 'current_sheet'
+            ''')
+            self.db.fetchone()
+        self.db.execute(u'select count(*) from entry')
+        tracer.print_summary(stream, 'now', limit=1)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[0].endswith(
+            "1 row: select value from meta where key = 'current_sheet' ()"
+        ))
+        self.assertTrue(lines[4].startswith('sql: now: 4 statements in '))
+        self.assertEqual(
+            lines[5],
+            "sql:      3 x select value from meta where key = 'current_sheet'"
+        )
+
+    def test_trace_sql_option(self):
+        argv = ['t', '-C', self.config_path, '-b', self.db_path]
+        environ = {'TIMEBOOK_SOCKET': os.path.join(self.tempdir, 'sock')}
+        for options, environ_value in (
+            (['--trace-sql'], ''),
+            ([], '1'),
+        ):
+            environ['TIMEBOOK_TRACE_SQL'] = environ_value
+            with mock.patch.dict('os.environ', environ), \
+                    mock.patch('sys.argv', argv + options + ['running']), \
+                    mock.patch('sys.stdout', StringIO()), \
+                    mock.patch('sys.stderr', StringIO()) as stderr:
+                cmdline.run_from_cmdline()
+            output = stderr.getvalue()
+            self.assertTrue('db_version' in output)
+            self.assertTrue('sql: running: ' in output)
@@ -0,0 +1,217 @@
+import datetime
+import time
+import unittest
+
+from timebook import exceptions
+from timebook.config import ConfigParser
+from timebook.storage import MemoryStorage, Storage
+import timebook.db
+
+
+def get_timestamp(value):
+    return int(time.mktime(
+        datetime.datetime.strptime(value, '%Y-%m-%d %H:%M').timetuple()
+    ))
+
+
+class StorageTests(object):
+    """Checks that a storage engine behaves as ``Storage`` describes."""
+
+    def test_current_sheet(self):
+        self.assertEqual(self.storage.get_current_sheet(), 'default')
+        self.storage.set_current_sheet('other')
+        self.assertEqual(self.storage.get_current_sheet(), 'other')
+
+    def test_entries(self):
+        first = self.storage.add_entry('default', 0, 10, 'first')
+        second = self.storage.add_entry('other', 5, None, 'second', 'x')
+        self.assertEqual(second, first + 1)
+        self.assertEqual(
+            self.storage.get_entry(second),
+            (second, 'other', 5, None, 'second', 'x')
+        )
+        self.assertEqual(self.storage.get_entry(second + 1), None)
+        self.assertEqual(
+            [entry[0] for entry in self.storage.get_entries()],
+            [first, second]
+        )
+        self.assertEqual(
+            [entry[0] for entry in self.storage.get_entries('default')],
+            [first]
+        )
+        self.assertEqual(list(self.storage.get_sheet_names()),
+                         ['default', 'other'])
+        self.assertEqual(self.storage.get_entry_count('default'), 1)
+        self.assertEqual(self.storage.get_entry_count('missing'), 0)
+
+        self.storage.update_entry(first, start_time=2, description='moved')
+        self.assertEqual(
+            self.storage.get_entry(first),
+            (first, 'default', 2, 10, 'moved', None)
+        )
+        self.assertRaises(
+            ValueError, self.storage.update_entry, first, sheet='other'
+        )
+
+    def test_one_running_entry_per_sheet(self):
+        finished = self.storage.add_entry('default', 0, 10)
+        running = self.storage.add_entry('default', 20)
+        self.assertRaises(
+            exceptions.CommandError, self.storage.add_entry, 'default', 30
+        )
+        self.assertRaises(
+            exceptions.CommandError,
+            self.storage.update_entry, finished, end_time=None
+        )
+        self.storage.add_entry('other', 30, description='working')
+        self.assertEqual(
+            self.storage.get_running_entry('default')[:2], (running, 20)
+        )
+        self.assertEqual(
+            [entry[1:] for entry in self.storage.get_running_entries()],
+            [('default', 20, None), ('other', 30, 'working')]
+        )
+
+        self.storage.update_entry(running, end_time=25)
+        self.assertEqual(self.storage.get_running_entry('default'), None)
+        self.storage.update_entry(finished, end_time=None)
+        self.assertEqual(
+            self.storage.get_running_entry('default')[0], finished
+        )
+        self.storage.end_running_entries(40)
+        self.assertEqual(self.storage.get_running_entries(), [])
+        self.assertEqual(self.storage.get_entry(finished)[3], 40)
+
+    def test_neighbors(self):
+        first = self.storage.add_entry('default', 0, 10, 'first')
+        second = self.storage.add_entry('default', 20, 30, 'second')
+        self.storage.add_entry('other', 15, 25)
+        self.assertEqual(self.storage.get_previous_entry('default', -1), None)
+        self.assertEqual(
+            self.storage.get_previous_entry('default', 20),
+            (second, 20, 30, 'second')
+        )
+        self.assertEqual(
+            self.storage.get_next_entry('default', 0),
+            (second, 20, 30, 'second')
+        )
+        self.assertEqual(self.storage.get_next_entry('default', 20), None)
+        self.assertEqual(
+            self.storage.get_previous_entry('default', 15)[0], first
+        )
+
+    def test_overlapping_entries(self):
+        first = self.storage.add_entry('default', 0, 10)
+        second = self.storage.add_entry('default', 20, 30)
+        other = self.storage.add_entry('other', 5, 25)
+        running = self.storage.add_entry('default', 40)
+        self.assertEqual(
+            [entry[0] for entry in self.storage.get_overlapping_entries(
+                9, 21
+            )],
+            [first, other, second]
+        )
+        self.assertEqual(
+            self.storage.get_overlapping_entries(10, 20),
+            [(other, 'other', 5, 25, None)]
+        )
+        self.assertEqual(self.storage.get_overlapping_entries(30, 40), [])
+        self.assertEqual(
+            [entry[0] for entry in self.storage.get_overlapping_entries(
+                int(time.time()) - 1, int(time.time())
+            )],
+            [running]
+        )
+
+    def test_totals(self):
+        day = get_timestamp('2012-06-01 00:00')
+        self.storage.add_entry('default', day - 60, day)
+        self.storage.add_entry('default', day, day + 60)
+        self.storage.add_entry('default', day + 3600, day + 3720)
+        self.storage.add_entry('default', day + 7200)
+        self.storage.add_entry('other', day + 60, day + 90)
+        self.assertEqual(
+            self.storage.get_day_totals('2012-06-01'),
+            {'default': 180, 'other': 30}
+        )
+        self.assertEqual(
+            [tuple(row) for row in self.storage.get_sheet_totals()],
+            [('default', 4, 240), ('other', 1, 30)]
+        )
+
+    def test_delete_sheet(self):
+        deleted = self.storage.add_entry('default', 0, 10)
+        self.storage.update_entry_meta(deleted, {'billable': 'yes'})
+        kept = self.storage.add_entry('other', 0)
+        self.storage.delete_sheet('default')
+        self.assertEqual(list(self.storage.get_sheet_names()), ['other'])
+        self.assertEqual(self.storage.get_entry_meta(deleted), {})
+        self.assertEqual(self.storage.get_latest_entry('default'), None)
+        self.assertEqual(self.storage.get_latest_entry('other')[0], kept)
+
+    def test_entry_meta(self):
+        self.storage.update_entry_meta(1, {'ticket': '10', 'a': 'x'})
+        self.storage.update_entry_meta(1, {'a': 'y'})
+        self.assertEqual(
+            self.storage.get_entry_meta(1), {'ticket': '10', 'a': 'y'}
+        )
+        self.assertEqual(self.storage.get_entry_meta(2), {})
+
+    def test_excluded_days(self):
+        self.add_excluded_day('holidays', 2012, 12, 25)
+        self.assertTrue(
+            self.storage.is_excluded_day('holidays', 2012, 12, 25)
+        )
+        self.assertFalse(
+            self.storage.is_excluded_day('vacation', 2012, 12, 25)
+        )
+        self.assertRaises(
+            ValueError, self.storage.is_excluded_day, 'entry', 2012, 12, 25
+        )
+
+    def test_adjustments(self):
+        self.assertEqual(self.storage.get_adjustment_total(0, 100), 0)
+        for timestamp, adjustment in ((0, 1.5), (50, -0.5), (100, 2)):
+            self.add_adjustment(timestamp, adjustment)
+        self.assertEqual(self.storage.get_adjustment_total(0, 100), 1)
+        self.assertEqual(self.storage.get_adjustment_total(50, 101), 1.5)
+
+    def test_ticket_details(self):
+        self.assertEqual(self.storage.get_ticket_details(10), None)
+        self.storage.set_ticket_details(10, 'timebook', 'first')
+        self.storage.set_ticket_details(10, 'timebook', 'second')
+        self.assertEqual(
+            tuple(self.storage.get_ticket_details(10)),
+            ('timebook', 'second')
+        )
+
+
+class TestSQLiteStorage(StorageTests, unittest.TestCase):
+    def setUp(self):
+        self.db = timebook.db.Database(':memory:', ConfigParser())
+        self.storage = self.db.storage
+
+    def add_excluded_day(self, kind, year, month, day):
+        self.db.execute(u'''
+        insert into %s (year, month, day) values (?, ?, ?)
+        ''' % kind, (year, month, day))
+
+    def add_adjustment(self, timestamp, adjustment):
+        self.db.execute(u'''
+        insert into adjustments (timestamp, adjustment) values (?, ?)
+        ''', (timestamp, adjustment))
+
+
+class TestMemoryStorage(StorageTests, unittest.TestCase):
+    def setUp(self):
+        self.storage = MemoryStorage()
+        self.add_excluded_day = self.storage.add_excluded_day
+        self.add_adjustment = self.storage.add_adjustment
+
+
+class TestStorage(unittest.TestCase):
+    def test_incomplete_engines_cannot_be_created(self):
+        class PartialStorage(Storage):
+            def get_current_sheet(self):
+                return u'default'
+        self.assertRaises(TypeError, PartialStorage)
@@ -4,75 +4,127 @@
 
 # Install: Put this file inside under the global or local (~/.bash_completion.d/completions)
 # bash completions path and name this file "t".
+#
+# Candidates are read from the completion index that timebook keeps next
+# to its database (see "Completion Index" in the README), so completing
+# does not start Python.  Set TIMEBOOK_COMPLETION_INDEX if your timebook
+# database is not in the default location.
+
+_t_index_dir()
+{
+    local i
+    for (( i=1; i < cword; i++ )); do
+        if [[ ${words[i]} == -b || ${words[i]} == --timebook ]]; then
+            echo "${words[i+1]%.*}.completion"
+            return
+        fi
+    done
+    echo "${TIMEBOOK_COMPLETION_INDEX:-$HOME/.config/timebook/sheets.completion}"
+}
+
+_t_config_file()
+{
+    local i
+    for (( i=1; i < cword; i++ )); do
+        if [[ ${words[i]} == -C || ${words[i]} == --config ]]; then
+            echo "${words[i+1]}"
+            return
+        fi
+    done
+    echo "$HOME/.config/timebook/timebook.ini"
+}
+
+# Prints the lines of index file $1.
+_t_index()
+{
+    local dir=$(_t_index_dir)
+    local config=$(_t_config_file)
+    if [[ ! -r $dir/stamp || $config -nt $dir/stamp ]]; then
+        # "list" rebuilds a missing or outdated index and changes nothing.
+        t list >/dev/null 2>&1
+    fi
+    [[ -r $dir/$1 ]] && cat "$dir/$1"
+}
+
+# Prints the command that name or alias $1 stands for.
+_t_command()
+{
+    local alias cmd
+    while read -r alias cmd; do
+        if [[ $alias == "$1" ]]; then
+            echo "$cmd"
+            return
+        fi
+    done < <(_t_index aliases)
+    echo "$1"
+}
 
 _t()
 {
-    local cur prev words cword cmd
+    local cur prev words cword cmd i
     _init_completion || return
 
-    case "$prev" in
-        alter|running)
-            return 0
-            ;;
+    # The command is the first argument that is not a global option.
+    for (( i=1; i < cword; i++ )); do
+        case "${words[i]}" in
+            -C|--config|-b|--timebook|-e|--encoding)
+                (( i++ ))
+                ;;
+            -*)
+                ;;
+            *)
+                cmd=$(_t_command "${words[i]}")
+                break
+                ;;
+        esac
+    done
 
-        list|out) # no other argument than options
-            COMPREPLY=( $( compgen -W "$(t $prev --help|_parse_help -)" -- "$cur" ) )
+    case "$prev" in
+        --config|-C|--timebook|-b)
+            _filedir
             return 0
             ;;
-
-        switch|display|now|in)
-            # all takes a timesheet or options as arguments
-            COMPREPLY=( $( compgen -W "$(t list --simple)" -- "$cur" ) )
-            COMPREPLY+=( $( compgen -W "$(t $prev --help|_parse_help -)" -- "$cur" ) )
+        --encoding)
             return 0
             ;;
+    esac
 
-        kill)
-            COMPREPLY=( $( compgen -W "$(t list --simple)" -- "$cur" ) )
-            return 0
-            ;;
+    if [[ -z $cmd ]]; then
+        if [[ $cur == -* ]]; then
+            COMPREPLY=( $( compgen -W "$(_t_index global_options)" -- "$cur" ) )
+        else
+            COMPREPLY=( $( compgen -W "$(_t_index commands)" -- "$cur" ) )
+        fi
+        return 0
+    fi
 
-        --config|-C|--timebook|-b)
-            _filedir
+    case "$cmd,$prev" in
+        display,-f|display,--format)
+            COMPREPLY=( $( compgen -W "plain csv eu" -- "$cur" ) )
             return 0
             ;;
-
-        # display
-        -f|--format)
-            COMPREPLY=( $( compgen -W "plain csv" -- "$cur" ) ) 
+        in,--switch|change,--switch)
+            COMPREPLY=( $( compgen -W "$(_t_index sheets)" -- "$cur" ) )
             return 0
             ;;
-        --start|-s|--end|-e)
-            return 0 # dates
-            ;;
-
-        # in
-        --switch) # -s) TODO: conflict with display -s
-            COMPREPLY=( $( compgen -W "$(t list --simple)" -- "$cur" ) )
-            return 0
+        *,--start|*,-s|*,--end|*,-e|*,--at|*,-a|*,--date)
+            # dates; -s is also --simple and --switch, which take none
+            if [[ $cmd == display || $cmd == stats || $prev != -s ]]; then
+                return 0
+            fi
             ;;
     esac
 
-    if [[ "$cur" == -* ]]; then
-        cmd="${words[1]}"
-        if [[ $cmd =~ ^alter|running|list|out|switch|display|now|kill$ ]]; then
-            COMPREPLY=( $( compgen -W '$(t $prev --help|_parse_help -)' -- "$cur" ) )
-        elif [[ -z "$cmd" || $cmd == $1 || $cmd =~ ^-- ]]; then
-            COMPREPLY=( $( compgen -W '$(_parse_help $1 --help)' -- "$cur" ) )
-        else : # dunno
-        fi
-
-        # completion --xxx= don't add extra-space
-        if (( "${#COMPREPLY[*]}" == 1 )) && [[ "${COMPREPLY[0]}" =~ =$ ]]; then
-            compopt -o nospace;
-        fi
+    if [[ $cur == -* ]]; then
+        COMPREPLY=( $( compgen -W "$(_t_index options/$cmd)" -- "$cur" ) )
         return 0
     fi
 
-    # main completion
-    COMPREPLY=( $( compgen -W 'alter backend display in kill list nonw out running switch' -- "$cur" ) )
-    COMPREPLY+=( $( compgen -W "$(_parse_help $1)" -- "$cur" ) )
-
+    case "$cmd" in
+        switch|display|now|kill|in)
+            COMPREPLY=( $( compgen -W "$(_t_index sheets)" -- "$cur" ) )
+            ;;
+    esac
 
     return 0
 } &&
@@ -41,3 +41,4 @@ logger.addHandler(handler)
 CONFIG_DIR = os.path.expanduser('~/.config/timebook')
 CONFIG_FILE = os.path.join(CONFIG_DIR, "timebook.ini")
 TIMESHEET_DB = os.path.join(CONFIG_DIR, "sheets.db")
+DAEMON_SOCKET = os.path.join(CONFIG_DIR, "timebook.sock")
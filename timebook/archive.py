@@ -0,0 +1,253 @@
+# archive.py
+#
+# Copyright (c) 2008-2009 Trevor Caira, 2011-2012 Adam Coddington
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Per-year archives of old entries.
+
+``t archive`` moves the finished entries of past years, with their
+metadata and details, out of the timebook database into one SQLite file
+per year kept next to it (``sheets-2012.db`` for ``sheets.db``), so that
+the tables day-to-day commands use stay small.
+
+Commands reporting on a range of dates wrap their queries in
+``attached(db, since)``, which attaches the archives of the years the range
+reaches into and shadows ``entry``, ``entry_meta`` and ``entry_details``
+with temporary views over both, so that unqualified queries see archived
+entries too.
+"""
+
+from contextlib import contextmanager
+import glob
+import os
+import time
+
+from timebook import exceptions
+
+ENTRY_COLUMNS = (
+    'id', 'sheet', 'start_time', 'end_time', 'description', 'extra', 'day',
+)
+ENTRY_META_COLUMNS = ('entry_id', 'key', 'value')
+ENTRY_DETAILS_COLUMNS = ('entry_id', 'ticket_number', 'billable')
+
+TABLES = (
+    ('entry', ENTRY_COLUMNS),
+    ('entry_meta', ENTRY_META_COLUMNS),
+    ('entry_details', ENTRY_DETAILS_COLUMNS),
+)
+
+SCHEMA = (
+    u'''
+    create table if not exists %(schema)s.entry (
+        id integer primary key not null,
+        sheet varchar(32) not null,
+        start_time integer not null,
+        end_time integer,
+        description varchar(64),
+        extra blob,
+        day varchar(10)
+    )
+    ''',
+    u'''
+    create index if not exists %(schema)s.entry_sheet_day
+        on entry (sheet, day)
+    ''',
+    u'''
+    create table if not exists %(schema)s.entry_meta (
+        entry_id integer not null,
+        key varchar(16) not null,
+        value varchar(256) not null
+    )
+    ''',
+    u'''
+    create unique index if not exists %(schema)s.entry_meta_entry_id_key
+        on entry_meta (entry_id, key)
+    ''',
+    u'''
+    create table if not exists %(schema)s.entry_details (
+        entry_id integer primary key not null,
+        ticket_number integer default null,
+        billable integer default 0
+    )
+    ''',
+)
+
+
+def get_archive_path(db_path, year):
+    return '%s-%04d.db' % (os.path.splitext(db_path)[0], year)
+
+
+def get_archive_years(db_path):
+    """Returns the years, in order, that have an archive next to the
+    database at ``db_path``."""
+    if db_path == ':memory:':
+        return []
+    base = os.path.splitext(db_path)[0]
+    return sorted(
+        int(path[len(base) + 1:-3])
+        for path in glob.glob(base + '-[0-9][0-9][0-9][0-9].db')
+    )
+
+
+def get_schema_name(year):
+    return 'archive_%04d' % year
+
+
+def attach(db, year):
+    schema = get_schema_name(year)
+    db.execute(u'pragma database_list')
+    if schema not in [row[1] for row in db.fetchall()]:
+        db.execute(
+            u'attach database ? as %s' % schema,
+            (get_archive_path(db.path, year), )
+        )
+    return schema
+
+
+def detach(db, year):
+    db.execute(u'detach database %s' % get_schema_name(year))
+
+
+# Entries which stay in the database whatever their year: the newest
+# entry, and the one with the highest id, since SQLite numbers new entries
+# after it and they must not reuse the ids of archived ones.  The latter
+# only differs from the former after backdating, until the next entry.
+KEPT_ENTRIES = u'''
+    start_time < (select max(start_time) from main.entry)
+    and id < (select max(id) from main.entry)
+'''
+
+
+def get_archivable_years(db, before):
+    """Returns the years before ``before`` that have finished entries."""
+    db.execute(u'''
+    select distinct
+        substr(day, 1, 4)
+    from
+        main.entry
+    where
+        end_time is not null
+        and day < ?
+        and %s
+    order by
+        1
+    ''' % KEPT_ENTRIES, ('%04d' % before, ))
+    return [int(row[0]) for row in db.fetchall()]
+
+
+def archive_year(db, year):
+    """Moves the finished entries of ``year`` into its archive; returns
+    the number of entries moved.
+
+    Rows are copied with ``insert or replace``, so if moving is interrupted
+    after the archive is written, running it again finishes the job.
+    """
+    schema = attach(db, year)
+    try:
+        for statement in SCHEMA:
+            db.execute(statement % {'schema': schema})
+        db.begin()
+        try:
+            db.execute(u'''
+            create temp table archived_entry (id integer primary key)
+            ''')
+            db.execute(u'''
+            insert into temp.archived_entry (id)
+            select
+                id
+            from
+                main.entry
+            where
+                end_time is not null
+                and day >= ? and day < ?
+                and %s
+            ''' % KEPT_ENTRIES, ('%04d' % year, '%04d' % (year + 1)))
+            count = db.cursor.rowcount
+            for table, columns in TABLES:
+                key = 'id' if table == 'entry' else 'entry_id'
+                db.execute(u'''
+                insert or replace into %(schema)s.%(table)s (%(columns)s)
+                select %(columns)s from main.%(table)s
+                where %(key)s in (select id from temp.archived_entry)
+                ''' % {
+                    'schema': schema,
+                    'table': table,
+                    'columns': ', '.join(columns),
+                    'key': key,
+                })
+                db.execute(u'''
+                delete from main.%(table)s
+                where %(key)s in (select id from temp.archived_entry)
+                ''' % {'table': table, 'key': key})
+            db.execute(u'drop table temp.archived_entry')
+            db.execute(u'commit')
+        except:
+            db.execute(u'rollback')
+            raise
+    finally:
+        detach(db, year)
+    return count
+
+
+@contextmanager
+def attached(db, since=None):
+    """Makes the archived entries of the years from that of the unix
+    timestamp ``since`` on (or of all years) visible to unqualified queries
+    for the duration of the block.
+
+    Archives cannot be detached inside a transaction, so this is for
+    commands which do not lock the database, and fails with a
+    ``CommandError`` inside one, as in ``t batch``.
+    """
+    years = get_archive_years(db.path)
+    if since is not None:
+        first_year = time.localtime(since).tm_year
+        years = [year for year in years if year >= first_year]
+    if not years:
+        yield
+        return
+    if db.in_transaction:
+        raise exceptions.CommandError(
+            'Archived entries cannot be read inside a transaction; '
+            'run this command on its own rather than in a batch.'
+        )
+    schemas = [attach(db, year) for year in years]
+    if db.read_only:
+        # Read-only connections refuse even temporary views.
+        db.execute(u'pragma query_only = 0')
+    try:
+        for table, columns in TABLES:
+            columns = ', '.join(columns)
+            db.execute(u'create temp view %s as %s' % (
+                table,
+                u' union all '.join(
+                    u'select %s from %s.%s' % (columns, schema, table)
+                    for schema in ['main'] + schemas
+                ),
+            ))
+        yield
+    finally:
+        for table, _ in TABLES:
+            db.execute(u'drop view if exists temp.%s' % table)
+        for year in years:
+            detach(db, year)
+        if db.read_only:
+            db.execute(u'pragma query_only = 1')
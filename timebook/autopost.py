@@ -100,7 +100,7 @@ class TimesheetPoster(object):
         return r
 
     def get_entries(self, day):
-        self.db.execute("""
+        results = self.db.query("""
             SELECT
                 id,
                 start_time,
@@ -122,7 +122,6 @@ class TimesheetPoster(object):
                 AND
                 sheet = 'default'
             """, (day.strftime("%Y-%m-%d"), day.strftime("%Y-%m-%d"), ))
-        results = self.db.fetchall()
 
         helper = ChiliprojectConnector(
                     self.db,
@@ -0,0 +1,267 @@
+# backup.py
+#
+# Copyright (c) 2008-2009 Trevor Caira, 2011-2012 Adam Coddington
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""Snapshots of the timebook database, as taken by ``t backup`` and put
+back by ``t restore``.
+
+Backups are timestamped copies of the database (``sheets-20120601T170000.db``
+for ``sheets.db``), optionally compressed, kept in a directory of their own;
+the oldest are deleted once there are more than the number to keep.  Copies
+are taken while other commands carry on using the database, and are
+checked before one replaces it.
+"""
+
+import os
+import re
+import sqlite3
+import time
+
+from timebook import exceptions, maintenance
+from timebook.migrations import LATEST_VERSION
+
+# Defaults for the ``backup`` section of the configuration file.
+DEFAULT_KEEP = 10
+DEFAULT_DIRECTORY_NAME = 'backups'
+
+# File name suffixes, by compression.
+COMPRESSIONS = {
+    'gzip': '.gz',
+    'lzma': '.xz',
+}
+
+TIMESTAMP_FORMAT = '%Y%m%dT%H%M%S'
+
+
+def get_directory(db):
+    return os.path.expanduser(db.config.get_with_default(
+        'backup',
+        'directory',
+        os.path.join(
+            os.path.dirname(os.path.abspath(db.path)), DEFAULT_DIRECTORY_NAME
+        )
+    ))
+
+
+def get_keep(db):
+    return int(db.config.get_with_default('backup', 'keep', DEFAULT_KEEP))
+
+
+def get_compression(db):
+    return db.config.get_with_default('backup', 'compress', None) or None
+
+
+def get_backup_name(db_path, when, compression=None):
+    return '%s-%s.db%s' % (
+        os.path.splitext(os.path.basename(db_path))[0],
+        time.strftime(TIMESTAMP_FORMAT, time.localtime(when)),
+        COMPRESSIONS[compression] if compression else '',
+    )
+
+
+def get_backups(db_path, directory):
+    """Returns the paths of the backups of the database at ``db_path`` in
+    ``directory``, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    pattern = re.compile(r'^%s-\d{8}T\d{6}\.db(%s)?$' % (
+        re.escape(os.path.splitext(os.path.basename(db_path))[0]),
+        '|'.join(re.escape(suffix) for suffix in COMPRESSIONS.values()),
+    ))
+    return [
+        os.path.join(directory, name)
+        for name in sorted(os.listdir(directory))
+        if pattern.match(name)
+    ]
+
+
+def get_compression_of(path):
+    for compression, suffix in COMPRESSIONS.items():
+        if path.endswith(suffix):
+            return compression
+    return None
+
+
+def get_opener(compression=None):
+    """Returns the function that opens files with ``compression``."""
+    if compression is None:
+        return open
+    if compression == 'gzip':
+        import gzip
+        return gzip.open
+    if compression == 'lzma':
+        try:
+            import lzma
+        except ImportError:
+            try:
+                from backports import lzma
+            except ImportError:
+                raise exceptions.CommandError(
+                    'lzma compression needs Python 3 or backports.lzma.'
+                )
+        return lzma.open
+    raise exceptions.CommandError(
+        'Unknown compression %r; use one of %s.' % (
+            compression, ', '.join(sorted(COMPRESSIONS))
+        )
+    )
+
+
+def copy_file(source, source_compression, target, target_compression):
+    import shutil
+    with get_opener(source_compression)(source, 'rb') as source_file:
+        with get_opener(target_compression)(target, 'wb') as target_file:
+            shutil.copyfileobj(source_file, target_file)
+
+
+def copy_database(db, path):
+    """Writes a consistent copy of the database to ``path``.
+
+    The copy is taken with ``VACUUM INTO`` in a single read transaction.
+    Python 2's sqlite3 has no online backup to copy a few pages at a time,
+    so in WAL mode other commands can write meanwhile, but in any other
+    journal mode they wait until the whole copy is written.
+    """
+    db.execute(u'vacuum into ?', (path, ))
+
+
+def backup(db, directory, compression=None, keep=DEFAULT_KEEP, when=None):
+    """Copies the database into ``directory`` and deletes all but the
+    newest ``keep`` backups there; returns the path of the new backup and
+    those of the deleted ones."""
+    if when is None:
+        when = time.time()
+    # Fail before copying if the compression is unavailable.
+    get_opener(compression)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    path = os.path.join(
+        directory, get_backup_name(db.path, when, compression)
+    )
+    # Never overwrite a backup taken within the same second.
+    while os.path.exists(path):
+        when += 1
+        path = os.path.join(
+            directory, get_backup_name(db.path, when, compression)
+        )
+    # Copy under a name that is not taken for a backup until complete.
+    copy_path = path + '.tmp'
+    for temp_path in (copy_path, copy_path + '.db'):
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+    try:
+        if compression is None:
+            copy_database(db, copy_path)
+        else:
+            copy_database(db, copy_path + '.db')
+            copy_file(copy_path + '.db', None, copy_path, compression)
+            os.unlink(copy_path + '.db')
+        os.rename(copy_path, path)
+    finally:
+        for temp_path in (copy_path, copy_path + '.db'):
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+    return path, rotate(db.path, directory, keep)
+
+
+def rotate(db_path, directory, keep):
+    """Deletes all but the newest ``keep`` backups in ``directory``;
+    returns the paths of those deleted."""
+    backups = get_backups(db_path, directory)
+    deleted = backups[:max(0, len(backups) - keep)]
+    for path in deleted:
+        os.unlink(path)
+    return deleted
+
+
+def check_backup(path):
+    """Returns the problems that keep the uncompressed backup at ``path``
+    from replacing the database, if any."""
+    connection = sqlite3.connect(path)
+    try:
+        cursor = connection.cursor()
+        try:
+            problems = maintenance.check_integrity(cursor)
+        except sqlite3.DatabaseError as e:
+            return [str(e)]
+        if problems:
+            return problems
+        try:
+            cursor.execute(
+                u"select value from meta where key = 'db_version'"
+            )
+            version = int(cursor.fetchone()[0])
+        except (sqlite3.DatabaseError, TypeError, ValueError):
+            return ['not a timebook database']
+        if version > LATEST_VERSION:
+            return ['written by a newer version of timebook']
+        return []
+    finally:
+        connection.close()
+
+
+def release(db):
+    """Closes the connection to the database, leaving WAL mode first so
+    that every change is in the database file itself rather than in a
+    ``-wal`` file that SQLite would apply to whatever replaces it."""
+    try:
+        db.execute(u'pragma journal_mode = delete')
+        journal_mode = db.fetchone()[0]
+    except sqlite3.OperationalError:
+        journal_mode = None
+    if journal_mode != 'delete':
+        raise exceptions.CommandError(
+            'The database is in use; stop the daemon and other timebook '
+            'commands before restoring.'
+        )
+    db.connection.close()
+
+
+def restore(db, path, directory=None, compression=None, keep=DEFAULT_KEEP):
+    """Replaces the database with the backup at ``path``, once it has been
+    checked, and reopens it; if ``directory`` is given, the database is
+    backed up there first.  Returns the path of that backup, if any."""
+    restore_path = '%s.restore-%d' % (db.path, os.getpid())
+    try:
+        copy_file(path, get_compression_of(path), restore_path, None)
+        problems = check_backup(restore_path)
+        if problems:
+            raise exceptions.CommandError(
+                'Not restoring %s: %s' % (path, '; '.join(problems))
+            )
+        saved = None
+        if directory is not None:
+            # Keep every backup there, so as not to rotate away the one
+            # being restored.
+            saved, _ = backup(db, directory, compression, max(
+                keep, len(get_backups(db.path, directory)) + 1
+            ))
+        release(db)
+        try:
+            os.rename(restore_path, db.path)
+        finally:
+            db.reopen()
+        return saved
+    finally:
+        if os.path.exists(restore_path):
+            os.unlink(restore_path)
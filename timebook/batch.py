@@ -0,0 +1,147 @@
+# batch.py
+#
+# Copyright (c) 2008-2009 Trevor Caira, 2011-2012 Adam Coddington
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import json
+import locale
+import optparse
+import shlex
+import sys
+
+from timebook import exceptions, logger, registry
+from timebook.commands import command, suppress_hooks, update_snapshot
+
+DEFAULT_TRANSACTION_SIZE = 1000
+
+
+def parse_batch(data, encoding):
+    """Returns the list of argument lists described by ``data``.
+
+    ``data`` is either a JSON array of argument lists or one command per
+    line, quoted as on a shell command line.  Blank lines and lines
+    starting with ``#`` are skipped.
+    """
+    if data.lstrip().startswith('['):
+        batch = json.loads(data.decode(encoding))
+        if not all(
+            isinstance(argv, list)
+            and argv
+            and all(isinstance(arg, basestring) for arg in argv)
+            for argv in batch
+        ):
+            raise exceptions.CommandError(
+                'A JSON batch must be an array of non-empty arrays of strings.'
+            )
+        return batch
+    batch = []
+    for line in data.splitlines():
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        batch.append([arg.decode(encoding) for arg in shlex.split(line)])
+    return batch
+
+
+def get_transaction_size(db):
+    return int(db.config.get_with_default(
+        'batch', 'transaction_size', DEFAULT_TRANSACTION_SIZE
+    ))
+
+
+def run_batch(db, batch, transaction_size, keep_going=False):
+    """Runs each argument list in ``batch``, committing after every
+    ``transaction_size`` commands; returns the number of failures."""
+    failures = 0
+    pending = 0
+    db.begin()
+    try:
+        for number, argv in enumerate(batch, 1):
+            db.execute(u'savepoint batch_command')
+            try:
+                run_batch_command(db, argv)
+            except (Exception, SystemExit) as e:
+                db.execute(u'rollback to batch_command')
+                failures += 1
+                print >> sys.stderr, 'command %s (%s): %s' % (
+                    number, ' '.join(argv), e
+                )
+                if not keep_going:
+                    break
+            finally:
+                db.execute(u'release batch_command')
+            pending += 1
+            if pending >= transaction_size:
+                db.execute(u'commit')
+                db.begin()
+                pending = 0
+        db.execute(u'commit')
+    except:
+        db.execute(u'rollback')
+        raise
+    return failures
+
+
+def run_batch_command(db, argv):
+    info = registry.commands[
+        registry.get_command_by_name(db.config, argv[0])
+    ]
+    if info.interactive or info.own_transaction:
+        raise exceptions.CommandError(
+            'The %s command cannot be run in a batch.' % info.name
+        )
+    with suppress_hooks():
+        info.load()(db, argv[1:])
+
+
+@command('run many commands read from standard input', locking=False)
+def batch(db, args):
+    parser = optparse.OptionParser(usage='''usage: %prog batch
+
+Run the commands read from standard input, one per line (quoted as on
+the command line, without the leading "t"), or given as a JSON array of
+argument lists, in a single process.  Changes are committed every
+--transaction-size commands.  Hooks and the reporting URL are run once
+for the whole batch rather than for each command.''')
+    parser.add_option('-n', '--transaction-size', dest='transaction_size',
+            type='int', default=get_transaction_size(db),
+            help='Number of commands to run per transaction (default: %s)'
+                % get_transaction_size(db)
+            )
+    parser.add_option('-k', '--keep-going', dest='keep_going',
+            action='store_true', default=False,
+            help='Continue with the remaining commands when one fails.'
+            )
+    opts, args = parser.parse_args(args=args)
+    if args:
+        parser.error('"t batch" takes no arguments.')
+    if opts.transaction_size < 1:
+        parser.error('--transaction-size must be at least 1.')
+
+    commands = parse_batch(sys.stdin.read(), locale.getpreferredencoding())
+    failures = run_batch(
+        db, commands, opts.transaction_size, keep_going=opts.keep_going
+    )
+    logger.debug("Ran %s commands; %s failed." % (len(commands), failures))
+    if failures:
+        # Exiting skips the snapshot that run_command would write for the
+        # commands which did succeed.
+        update_snapshot(db)
+        raise SystemExit(1)
@@ -21,6 +21,7 @@
 
 import base64
 import json
+import sqlite3
 import urllib2
 
 from timebook import logger
@@ -53,23 +54,16 @@ class ChiliprojectConnector(object):
     def store_ticket_info_in_db(self, ticket_number, project, details):
         logger.debug("Storing ticket information for %s" % ticket_number)
         try:
-            self.db.execute("""
-                INSERT INTO ticket_details (number, project, details)
-                VALUES (?, ?, ?)
-                """, (ticket_number, project, details, ))
+            self.db.storage.set_ticket_details(ticket_number, project, details)
         except sqlite3.OperationalError as e:
             logger.exception(e)
 
     def get_ticket_info_from_db(self, ticket_number):
-        try:
-            logger.debug("Checking in DB for %s" % ticket_number)
-            return self.db.execute("""
-                SELECT project, details FROM ticket_details
-                WHERE number = ?
-                """, (ticket_number, )).fetchall()[0]
-        except IndexError as e:
+        logger.debug("Checking in DB for %s" % ticket_number)
+        details = self.db.storage.get_ticket_details(ticket_number)
+        if details is None:
             logger.debug("No information in DB for %s" % ticket_number)
-            return None
+        return details
 
     def get_ticket_details(self, ticket_number):
         data = self.get_ticket_info_from_db(ticket_number)
@@ -0,0 +1,122 @@
+# client.py
+#
+# Copyright (c) 2008-2009 Trevor Caira, 2011-2012 Adam Coddington
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Thin client for ``t daemon``.
+
+A request is the client's working directory, the number of its
+environment variables, those variables as ``NAME=VALUE`` and the command
+line arguments, joined by NUL bytes, so that the command and its hooks run
+as they would in the client; the reply is
+a ``STATUS STDOUT_LENGTH`` header line followed by the command's standard
+output and then its standard error.  A status of ``RUN_LOCALLY`` asks the
+client to run the command in-process instead.
+
+This module is imported on every invocation of ``t``, so it must stay
+free of anything heavier than ``socket``.
+"""
+
+import os
+import socket
+import sys
+
+from timebook import DAEMON_SOCKET
+
+RUN_LOCALLY = 'local'
+
+
+def get_socket_path():
+    return os.environ.get('TIMEBOOK_SOCKET', DAEMON_SOCKET)
+
+
+def encode_request(argv, cwd, environ):
+    return '\0'.join(
+        [cwd, str(len(environ))]
+        + ['%s=%s' % item for item in sorted(environ.items())]
+        + list(argv)
+    )
+
+
+def decode_request(data):
+    """Returns the command line arguments, working directory and
+    environment of a request."""
+    fields = data.split('\0')
+    cwd, count = fields[0], int(fields[1])
+    environ = dict(
+        field.split('=', 1) for field in fields[2:2 + count]
+    )
+    return fields[2 + count:], cwd, environ
+
+
+def encode_response(status, stdout, stderr):
+    return '%s %d\n%s%s' % (status, len(stdout), stdout, stderr)
+
+
+def decode_response(data):
+    header, _, body = data.partition('\n')
+    status, stdout_length = header.split(' ')
+    stdout_length = int(stdout_length)
+    return status, body[:stdout_length], body[stdout_length:]
+
+
+def send_request(path, argv):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        sock.sendall(encode_request(argv, os.getcwd(), os.environ))
+        sock.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        sock.close()
+    return ''.join(chunks)
+
+
+def forward(argv, path=None):
+    """Run ``argv`` in the daemon and relay its output.
+
+    Returns the command's exit status, or None if no daemon is listening
+    or the daemon asked for the command to be run in-process.
+    """
+    path = path or get_socket_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        response = send_request(path, argv)
+    except socket.error:
+        return None
+    try:
+        status, stdout, stderr = decode_response(response)
+    except ValueError:
+        # The daemon accepted the request, so the command may have run;
+        # running it again here could apply it twice.
+        sys.stderr.write('t: error: no response from the timebook daemon\n')
+        return 1
+    if status == RUN_LOCALLY:
+        return None
+    sys.stdout.write(stdout)
+    sys.stderr.write(stderr)
+    return int(status)
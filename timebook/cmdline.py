@@ -21,15 +21,14 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+# Everything but the daemon client is imported where it is used, so that a
+# command forwarded to ``t daemon`` does not pay for loading the rest of
+# timebook.
 import locale
-from optparse import OptionParser
+import os
+import sys
 
-from timebook import get_version
-from timebook.db import Database
-from timebook.commands import commands, run_command
-from timebook.config import parse_config
-from timebook.cmdutil import AmbiguousLookup, NoMatch
-from timebook.exceptions import CommandError
+from timebook import client, get_version
 
 from timebook import CONFIG_FILE, TIMESHEET_DB
 
@@ -39,8 +38,10 @@ DEFAULTS = {'config': CONFIG_FILE,
 
 
 def make_parser():
-    cmd_descs = ['%s - %s' % (k, commands[k].description) for k
-                 in sorted(commands)]
+    from optparse import OptionParser
+    from timebook import registry
+    cmd_descs = ['%s - %s' % (k, registry.commands[k].description) for k
+                 in sorted(registry.commands)]
     parser = OptionParser(usage='''usage: %%prog [OPTIONS] COMMAND \
 [ARGS...]
 
@@ -57,18 +58,35 @@ alternate timebook file (default: "%s").' % DEFAULTS['timebook'])
                       default=DEFAULTS['encoding'], help='Specify an \
 alternate encoding to decode command line options and arguments (default: \
 "%s")' % DEFAULTS['encoding'])
+    parser.add_option('--trace-sql', dest='trace_sql', action='store_true',
+                      default=bool(os.environ.get('TIMEBOOK_TRACE_SQL')),
+                      help='Log each SQL statement run, and a summary of \
+them, to standard error (default: set if TIMEBOOK_TRACE_SQL is).')
+    parser.add_option('--profile', dest='profile', action='store_true',
+                      default=False, help='Print how long each phase of \
+running the command took to standard error.')
+    parser.add_option('--profile-output', dest='profile_output',
+                      metavar='FILE', help='Write the timing of each phase \
+to FILE as JSON instead of printing it.')
+    parser.add_option('--profile-dump', dest='profile_dump', metavar='FILE',
+                      help='Also profile the command with cProfile, writing \
+the statistics to FILE for use with the pstats module.')
     return parser
 
 
-def parse_options(parser):
-    options, args = parser.parse_args()
+def parse_options(parser, argv=None):
+    options, args = parser.parse_args(argv)
     encoding = options.__dict__.pop('encoding')
     try:
-        options.__dict__ = dict((k, v.decode(encoding)) for (k, v) in
-                                options.__dict__.iteritems())
+        options.__dict__ = dict(
+            (k, v.decode(encoding) if isinstance(v, str) else v)
+            for (k, v) in options.__dict__.iteritems()
+        )
         args = [a.decode(encoding) for a in args]
     except LookupError:
         parser.error('unknown encoding %s' % encoding)
+    if options.profile_output or options.profile_dump:
+        options.profile = True
 
     if len(args) < 1:
         # default to ``t now``
@@ -77,10 +95,82 @@ def parse_options(parser):
 
 
 def run_from_cmdline():
+    status = client.forward(sys.argv[1:])
+    if status is not None:
+        sys.exit(status)
+    from timebook import profiling
     parser = make_parser()
     options, args = parse_options(parser)
-    config = parse_config(options.config)
-    db = Database(options.timebook, config)
+    if not options.profile:
+        run(parser, options, args)
+        return
+    profiling.enable(profile=bool(options.profile_dump))
+    try:
+        run(parser, options, args)
+    finally:
+        report = profiling.get_report(sys.argv[1:])
+        if options.profile_output:
+            profiling.write_report(report, options.profile_output)
+        else:
+            profiling.print_report(report, sys.stderr)
+        if options.profile_dump:
+            profiling.dump_profile(options.profile_dump)
+        profiling.disable()
+
+
+def run(parser, options, args):
+    from timebook import profiling
+    with profiling.phase('import'):
+        from timebook.config import parse_config
+        from timebook.db import Database
+    with profiling.phase('config'):
+        config = parse_config(options.config)
+    if '--from-snapshot' in args[1:]:
+        from timebook import snapshot
+        if snapshot.is_snapshot_request(config, args):
+            current = snapshot.read_snapshot(
+                snapshot.get_snapshot_path(options.timebook)
+            )
+            if current is not None:
+                from timebook.commands import print_snapshot
+                print_snapshot(current, '-s' in args or '--simple' in args)
+                return
+    read_only = is_query_only(config, args[0])
+    if not options.trace_sql:
+        dispatch(
+            parser,
+            Database(options.timebook, config, read_only=read_only),
+            args
+        )
+        return
+    db = Database(
+        options.timebook, config, trace_stream=sys.stderr, read_only=read_only
+    )
+    try:
+        dispatch(parser, db, args)
+    finally:
+        db.tracer.print_summary(sys.stderr, args[0])
+
+
+def is_query_only(config, cmd):
+    """Whether ``cmd`` never writes to the database, which can then be
+    opened read-only."""
+    from timebook import exceptions, registry
+    try:
+        return registry.commands[
+            registry.get_command_by_name(config, cmd)
+        ].query_only
+    except (ValueError, exceptions.CommandError):
+        # Let the command line report the lookup error.
+        return False
+
+
+def dispatch(parser, db, args):
+    from timebook import profiling
+    with profiling.phase('import'):
+        from timebook.cmdutil import AmbiguousLookup, NoMatch
+        from timebook.commands import run_command
+        from timebook.exceptions import CommandError
     cmd, args = args[0], args[1:]
     try:
         run_command(db, cmd, args)
@@ -67,12 +67,14 @@ def pprint_table(table, footer_row=False):
                       for (cell, spacing) in zip(row[:-1], widths[:-1])]
         print ''.join(first_cols + [row[-1]])
 
-today_str = time.strftime("%Y-%m-%d", datetime.datetime.now().timetuple())
-matches = [(re.compile(r'^\d+:\d+$'), today_str + " ", ":00"),
-           (re.compile(r'^\d+:\d+:\d+$'), today_str + " ", ""),
-           (re.compile(r'^\d+-\d+-\d+$'), "", " 00:00:00"),
-           (re.compile(r'^\d+-\d+-\d+\s+\d+:\d+$'), "", ":00"),
-           (re.compile(r'^\d+-\d+-\d+\s+\d+:\d+:\d+$'), "", ""),
+# (pattern, whether the time is relative to today, suffix); today's date
+# is looked up when parsing since a process may outlive the day it
+# started on.
+matches = [(re.compile(r'^\d+:\d+$'), True, ":00"),
+           (re.compile(r'^\d+:\d+:\d+$'), True, ""),
+           (re.compile(r'^\d+-\d+-\d+$'), False, " 00:00:00"),
+           (re.compile(r'^\d+-\d+-\d+\s+\d+:\d+$'), False, ":00"),
+           (re.compile(r'^\d+-\d+-\d+\s+\d+:\d+:\d+$'), False, ""),
           ]
 fmt = "%Y-%m-%d %H:%M:%S"
 offset_regexp = re.compile(
@@ -112,8 +114,9 @@ def get_time_offset(offset_str):
 
 
 def parse_date_time(dt_str):
-    for (patt, prepend, postpend) in matches:
+    for (patt, on_today, postpend) in matches:
         if patt.match(dt_str):
+            prepend = time.strftime("%Y-%m-%d ") if on_today else ""
             res = time.strptime(prepend + dt_str + postpend, fmt)
             return int(time.mktime(res))
     raise ValueError("%s is not in a valid time format" % dt_str)
@@ -135,18 +138,15 @@ def timedelta_hms_display(timedelta):
 
 def collect_user_specified_attributes(db, opts):
     meta = {}
-    if db.config.has_section('custom_ticket_meta'):
-        for key in db.config.options('custom_ticket_meta'):
-            value = getattr(opts, key)
-            if value != None:
-                meta[key] = value
+    for key, help_text in db.config.get_custom_ticket_meta():
+        value = getattr(opts, key)
+        if value != None:
+            meta[key] = value
     return meta
 
 
 def add_user_specified_attributes(db, parser):
-    if db.config.has_section('custom_ticket_meta'):
-        for key in db.config.options('custom_ticket_meta'):
-            help_text=db.config.get('custom_ticket_meta', key)
-            parser.add_option('--' + key, type='string', dest=key,
-                    help=help_text, default=None
-                    )
+    for key, help_text in db.config.get_custom_ticket_meta():
+        parser.add_option('--' + key, type='string', dest=key,
+                help=help_text, default=None
+                )
@@ -21,46 +21,87 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+# Only modules needed by every command are imported here; anything heavier
+# (networking, subprocesses, dateutil) is imported by the command that needs
+# it so that ``t now`` and friends stay cheap to start.
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from functools import wraps
 from gettext import ngettext
 import calendar
-import hashlib
-import httplib
-import json
 import os
 import optparse
 import re
-import shlex
-import subprocess
+import sqlite3
 import sys
 import time
-from urllib import urlencode
-from urlparse import urlparse
 
-from timebook import logger, dbutil, cmdutil, exceptions
-from timebook.autopost import TimesheetPoster
-from timebook.payperiodutil import PayPeriodUtil
+from timebook import logger, dbutil, cmdutil, exceptions, profiling, \
+    registry
 from timebook.cmdutil import rawinput_date_format
 
 commands = {}
 cmd_aliases = {}
 
+# Incremented while hooks are suppressed; see ``suppress_hooks``.
+hooks_suppressed = 0
+
+
+# Incremented while the output of hooks is relayed; see
+# ``relay_hook_output``.
+hook_output_relayed = 0
+
+
+@contextmanager
+def relay_hook_output():
+    """Writes the output of hooks run within this block to ``sys.stdout``
+    and ``sys.stderr``, as the daemon captures them, rather than leaving it
+    to go to the process's own."""
+    global hook_output_relayed
+    hook_output_relayed += 1
+    try:
+        yield
+    finally:
+        hook_output_relayed -= 1
+
+
+def run_hook(args):
+    """Runs the hook command ``args`` and returns its exit status."""
+    import subprocess
+    if not hook_output_relayed:
+        return subprocess.call(args)
+    process = subprocess.Popen(
+        args, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    stdout, stderr = process.communicate()
+    sys.stdout.write(stdout)
+    sys.stderr.write(stderr)
+    return process.returncode
+
+
+@contextmanager
+def suppress_hooks():
+    """Skips the pre and post hooks of commands run within this block."""
+    global hooks_suppressed
+    hooks_suppressed += 1
+    try:
+        yield
+    finally:
+        hooks_suppressed -= 1
+
 
 def pre_hook(db, func_name, args, kwargs):
+    if hooks_suppressed:
+        return True
     current_sheet = dbutil.get_current_sheet(db)
     keys_to_check = [
                 'pre_%s_hook' % func_name,
                 'pre_hook',
             ]
     for key_name in keys_to_check:
-        if db.config.has_option(current_sheet, key_name):
-            command = shlex.split(
-                        db.config.get(current_sheet, key_name),
-                    )
-            res = subprocess.call(
-                    command + args,
-                )
+        command = db.config.get_hook(current_sheet, key_name)
+        if command:
+            res = run_hook(command + args)
             if res != 0:
                 raise exceptions.PreHookException(
                         "%s (%s)(%s)" % (command, func_name, ', '.join(args))
@@ -69,19 +110,17 @@ def pre_hook(db, func_name, args, kwargs):
 
 
 def post_hook(db, func_name, args, kwargs, res):
+    if hooks_suppressed:
+        return True
     current_sheet = dbutil.get_current_sheet(db)
     keys_to_check = [
                 'post_%s_hook' % func_name,
                 'post_hook',
             ]
     for key_name in keys_to_check:
-        if db.config.has_option(current_sheet, key_name):
-            command = shlex.split(
-                        db.config.get(current_sheet, key_name),
-                    )
-            res = subprocess.call(
-                    command + args + [str(res)]
-                )
+        command = db.config.get_hook(current_sheet, key_name)
+        if command:
+            res = run_hook(command + args + [str(res)])
             if res != 0:
                 raise exceptions.PostHookException(
                         "%s (%s)(%s)(%s)" %
@@ -103,9 +142,12 @@ def command(desc, name=None, aliases=(), locking=True, read_only=False):
         @wraps(func)
         def decorated(db, args, **kwargs):
             try:
-                pre_hook(db, func_name, args, kwargs)
-                res = func(db, args, **kwargs)
-                post_hook(db, func_name, args, kwargs, res)
+                with profiling.phase('hooks'):
+                    pre_hook(db, func_name, args, kwargs)
+                with profiling.phase('command'), profiling.profiled():
+                    res = func(db, args, **kwargs)
+                with profiling.phase('hooks'):
+                    post_hook(db, func_name, args, kwargs, res)
             except exceptions.PreHookException as e:
                 print "Error, command aborted. Pre hook failed: %s" % e
                 raise e
@@ -118,71 +160,85 @@ def command(desc, name=None, aliases=(), locking=True, read_only=False):
 
 
 def get_command_by_user_configured_alias(db, cmd):
-    if (
-        not db.config.has_section('aliases') 
-        or not db.config.has_option('aliases', cmd)
-        ):
-        return
-    alias = db.config.get('aliases', cmd)
-    if alias in commands.keys():
-        return alias
-    else:
-        raise exceptions.CommandError("The alias '%s' is mapped to a function that does not exist." % cmd)
+    return registry.get_command_by_user_configured_alias(db.config, cmd)
 
 
 def get_command_by_name(db, cmd):
-    func = get_command_by_user_configured_alias(db, cmd)
-    if func:
-        return func
-    func = cmd_aliases.get(cmd, None)
-    if func:
-        return func
-    return cmdutil.complete(commands, cmd, 'command')
+    return registry.get_command_by_name(db.config, cmd)
 
 
 def run_command(db, cmd, args):
-    func = get_command_by_name(db, cmd)
+    info = registry.commands[get_command_by_name(db, cmd)]
     try:
-        if commands[func].locking:
-            db.execute(u'begin')
-        commands[func](db, args)
-        if commands[func].locking:
-            db.execute(u'commit')
+        if info.locking:
+            db.begin()
+        previous_sheet = dbutil.get_current_sheet(db)
+        info.load()(db, args)
+        if info.locking:
+            with profiling.phase('commit'):
+                db.execute(u'commit')
         current_sheet = dbutil.get_current_sheet(db)
-        if not commands[func].read_only:
-            if db.config.has_option(
+        with profiling.phase('indexes'):
+            # Entries are only added to the current timesheet, which is
+            # always in the index, so other commands cannot change it.
+            if info.refreshes_index or current_sheet != previous_sheet:
+                from timebook import completion
+                if completion.index_is_stale(db):
+                    update_completion_index(db)
+            if not info.read_only:
+                update_snapshot(db)
+        if not info.read_only:
+            reporting_url = db.config.get_reporting_url(current_sheet)
+            if reporting_url:
+                with profiling.phase('reporting'):
+                    current_info = dbutil.get_active_info(db, current_sheet)
+                    status_string = dbutil.get_status_string(
+                        db,
                         current_sheet,
-                        'reporting_url'
-                    ):
-                current_info = dbutil.get_active_info(db, current_sheet)
-                status_string = dbutil.get_status_string(
-                    db,
-                    current_sheet,
-                    exclude=['billable']
-                )
-                report_to_url(
-                        db.config.get(current_sheet, 'reporting_url'),
-                        None,
-                        status_string,
-                        (
-                            datetime.utcnow()
-                            - timedelta(seconds=current_info[0])
-                        ).strftime("%Y-%m-%d %H:%M:%S")
-                        if current_info else '',
-                        datetime.now() - timedelta(seconds=current_info[0]) if current_info else timedelta(seconds=0),
-                        current_info[0] if current_info else 0,
-                        cmd,
-                        args
+                        exclude=['billable']
                     )
+                    report_to_url(
+                            reporting_url,
+                            None,
+                            status_string,
+                            (
+                                datetime.utcnow()
+                                - timedelta(seconds=current_info[0])
+                            ).strftime("%Y-%m-%d %H:%M:%S")
+                            if current_info else '',
+                            datetime.now() - timedelta(seconds=current_info[0]) if current_info else timedelta(seconds=0),
+                            current_info[0] if current_info else 0,
+                            cmd,
+                            args
+                        )
     except Exception:
         import traceback
         traceback.print_exc()
-        if commands[func].locking:
+        if info.locking:
             db.execute(u'rollback')
         raise
 
 
+def update_snapshot(db):
+    from timebook import snapshot
+    try:
+        snapshot.write_snapshot(db)
+    except (IOError, OSError) as e:
+        logger.warning("Unable to write status snapshot: %s" % e)
+
+
+def update_completion_index(db):
+    from timebook import completion
+    try:
+        completion.write_index(db)
+    except (IOError, OSError) as e:
+        logger.warning("Unable to write completion index: %s" % e)
+
+
 def report_to_url(url, user, current, since_str, since, seconds, command, args):
+    import httplib
+    import json
+    from urlparse import urlparse
     try:
         url_data = urlparse(url)
         h = httplib.HTTPConnection(url_data.netloc)
@@ -241,6 +297,7 @@ def get_date_from_cli_string(option,  option_str, value, parser):
 @command("open the backend's interactive shell", aliases=('shell',), 
         locking=False)
 def backend(db, args):
+    import subprocess
     parser = optparse.OptionParser(usage='''usage: %prog backend
 
 Run an interactive database session on the timebook database. Requires
@@ -257,6 +314,7 @@ def change(db, args, extra=None):
 @command('post timesheet hours to timesheet online',
         name='post', locking=False)
 def post(db, args, extra=None):
+    from timebook.autopost import TimesheetPoster
     parser = optparse.OptionParser()
     parser.add_option("--date", type="string", action="callback",
             help='''Date for which to post timesheet entries for.
@@ -268,7 +326,7 @@ the report.  (default: today)''',
             dest="date",
             default=datetime.now().date()
         )
-    (options, args, ) = parser.parse_args()
+    (options, args, ) = parser.parse_args(args=args)
 
     with TimesheetPoster(
             db,
@@ -286,6 +344,10 @@ the report.  (default: today)''',
     locking=False
 )
 def taskwarrior(db, args, extra=None):
+    import hashlib
+    import json
+    import subprocess
+
     def poll_taskwarrior():
         tasks = []
         results = subprocess.check_output(
@@ -359,8 +421,10 @@ def taskwarrior(db, args, extra=None):
 
 
 @command('provides hours information for the current pay period', name='hours',
-        aliases=('payperiod', 'pay', 'period', 'offset', ), read_only=True)
+        aliases=('payperiod', 'pay', 'period', 'offset', ), locking=False,
+        read_only=True)
 def hours(db, args, extra=None):
+    from timebook.payperiodutil import PayPeriodUtil
     payperiod_class = 'MonthlyOnSecondToLastFriday'
     current_sheet = dbutil.get_current_sheet(db)
     if db.config.has_option(current_sheet, 'payperiod_type'):
@@ -372,7 +436,7 @@ def hours(db, args, extra=None):
         "--payperiod-type", type="string",
         dest="payperiod_type", default=payperiod_class
     )
-    (options, args, ) = parser.parse_args()
+    (options, args, ) = parser.parse_args(args=args)
 
     ppu = PayPeriodUtil(db, options.payperiod_type)
     hour_info = ppu.get_hours_details()
@@ -454,27 +518,24 @@ Notes may be specified for this period. This is exactly equivalent to
     running = dbutil.get_active_info(db, sheet)
     if running is not None:
         raise SystemExit('error: timesheet already active')
-    most_recent_clockout = dbutil.get_most_recent_clockout(db, sheet)
+    if dbutil.get_overlapping_neighbors(db, sheet, timestamp):
+        raise SystemExit('error: time periods could end up overlapping')
     description = u' '.join(args) or None
-    if most_recent_clockout:
-        (id, start_time, prev_timestamp, prev_desc) = most_recent_clockout
-        prev_meta = dbutil.get_entry_meta(db, id)
-        if timestamp < prev_timestamp:
-            raise SystemExit('error: time periods could end up overlapping')
-        current_sheet = dbutil.get_current_sheet(db)
-        if change and db.config.has_option(current_sheet, 'autocontinue'):
+    current_sheet = dbutil.get_current_sheet(db)
+    if change and db.config.has_option(current_sheet, 'autocontinue'):
+        previous = dbutil.get_previous_entry(db, sheet, timestamp)
+        if previous:
+            (id, start_time, prev_timestamp, prev_desc) = previous
+            prev_meta = dbutil.get_entry_meta(db, id)
             if not description:
                 description = prev_desc
             for p_key, p_value in prev_meta.items():
                 if p_key not in metadata.keys() or not metadata[p_key]:
                     metadata[p_key] = p_value
 
-    db.execute(u'''
-    insert into entry (
-        sheet, start_time, description, extra
-    ) values (?,?,?,?)
-    ''', (sheet, timestamp, description, extra))
-    entry_id = db.cursor.lastrowid
+    entry_id = db.storage.add_entry(
+        sheet, timestamp, description=description, extra=extra
+    )
     dbutil.update_entry_meta(db, entry_id, metadata)
 
 
@@ -504,12 +565,13 @@ timesheet and switch to the default timesheet.''')
     if not confirm:
         print 'canceled'
         return
-    db.execute(u'delete from entry where sheet = ?', (to_delete,))
+    db.storage.delete_sheet(to_delete)
     if switch_to_default:
         switch(db, ['default'])
 
 
-@command('show the available timesheets', aliases=('ls',), read_only=True)
+@command('show the available timesheets', aliases=('ls',), locking=False,
+         read_only=True)
 def list(db, args):
     parser = optparse.OptionParser(usage='''usage: %prog list
 
@@ -520,54 +582,29 @@ of the available timesheets.')
     opts, args = parser.parse_args(args=args)
 
     if opts.simple:
-        db.execute(
-        u'''
-        select
-            distinct sheet
-        from
-            entry
-        order by
-            sheet asc;
-        ''')
-        print u'\n'.join(r[0] for r in db.fetchall())
+        print u'\n'.join(dbutil.get_sheet_names(db))
         return
 
     table = [[' Timesheet', 'Running', 'Today', 'Total time']]
-    db.execute(u'''
-    select
-        e1.sheet as name,
-        e1.sheet = meta.value as is_current,
-        ifnull((select
-            strftime('%s', 'now') - e2.start_time
-         from
-            entry e2
-         where
-            e1.sheet = e2.sheet and e2.end_time is null), 0
-        ) as active,
-        (select
-            ifnull(sum(ifnull(e3.end_time, strftime('%s', 'now')) -
-                       e3.start_time), 0)
-            from
-                entry e3
-            where
-                e1.sheet = e3.sheet and
-                e3.start_time > strftime('%s', date('now'))
-        ) as today,
-        ifnull(sum(ifnull(e1.end_time, strftime('%s', 'now')) -
-                   e1.start_time), 0) as total
-    from
-        entry e1, meta
-    where
-        meta.key = 'current_sheet'
-    group by e1.sheet
-    order by e1.sheet asc;
-    ''')
-    sheets = db.fetchall()
+    # Finished entries are summed up in sheet and daily_totals; only
+    # running entries need looking at.
+    sheets = dbutil.get_sheet_totals(db)
+    now = int(time.time())
+    today_day = time.strftime('%Y-%m-%d', time.localtime(now))
+    today_totals = db.storage.get_day_totals(today_day)
+    running = dict(
+        (sheet, (now - start_time, day))
+        for sheet, start_time, day, _ in dbutil.get_running_entries(db)
+    )
     if len(sheets) == 0:
         print u'(no sheets)'
         return
-    for (name, is_current, active, today, total) in sheets:
-        cur_name = '%s%s' % ('*' if is_current else ' ', name)
+    current_sheet = dbutil.get_current_sheet(db)
+    for name, entry_count, seconds in sheets:
+        active, day = running.get(name, (0, None))
+        today = today_totals.get(name, 0) + (active if day == today_day else 0)
+        total = seconds + active
+        cur_name = '%s%s' % ('*' if name == current_sheet else ' ', name)
         active = str(timedelta(seconds=active)) if active != 0 \
                                                 else '--'
         today = str(timedelta(seconds=today))
@@ -595,14 +632,10 @@ number of entries of the timesheet.')
     # optimization: check that the given timesheet is not already
     # current. updates are far slower than selects.
     if dbutil.get_current_sheet(db) != sheet:
-        db.execute(u'''
-        update
-            meta
-        set
-            value = ?
-        where
-            key = 'current_sheet'
-        ''', (args[0],))
+        db.storage.set_current_sheet(sheet)
+        # Switching is read-only as far as reporting is concerned, but the
+        # snapshot records the current sheet.
+        update_snapshot(db)
 
     if opts.verbose:
         entry_count = dbutil.get_entry_count(db, sheet)
@@ -653,23 +686,9 @@ def clock_out(db, at=None, verbose=False, timestamp=None, all_out=False):
     if active_time < 0:
         raise SystemExit("Error: Negative active time")
     if all_out:
-        db.execute(u'''
-        UPDATE
-            entry
-        SET
-            end_time = ?
-        WHERE
-            end_time is null
-        ''', (timestamp, ))
+        db.storage.end_running_entries(timestamp)
     else:
-        db.execute(u'''
-        update
-            entry
-        set
-            end_time = ?
-        where
-            entry.id = ?
-        ''', (timestamp, active_id))
+        db.storage.update_entry(active_id, end_time=timestamp)
 
 
 @command('create a new timebook entry and backdate it')
@@ -694,45 +713,20 @@ def backdate(db, args):
         if active:
             clock_out(db)
 
-        sql = """
-            SELECT id 
-            FROM entry
-            WHERE 
-                sheet = ?
-                AND
-                end_time > ?
-        """
-        sql_args = (
-            dbutil.get_current_sheet(db),
-            int(time.mktime(start.timetuple())),
-        )
-        db.execute(sql, sql_args)
-
-        rows = db.fetchall()
-
-        if len(rows) > 1:
+        sheet = dbutil.get_current_sheet(db)
+        timestamp = int(time.mktime(start.timetuple()))
+        overlapping = dbutil.get_overlapping_neighbors(db, sheet, timestamp)
+        if [entry for entry in overlapping if entry[1] > timestamp]:
             raise exceptions.CommandError(
-                '%s overlaps %s entries. '
+                '%s is before the start of another entry. '
                 'Please select a later time to backdate to.' % (
                     start,
-                    len(rows)
                 )
             )
 
-        sql = """
-            UPDATE entry
-            SET end_time = ?
-            WHERE 
-                sheet = ?
-                AND
-                end_time > ?
-        """
-        sql_args = (
-            int(time.mktime(start.timetuple())),
-            dbutil.get_current_sheet(db),
-            int(time.mktime(start.timetuple())),
-        )
-        db.execute(sql, sql_args)
+        # Cut short the entry the new one starts during.
+        for id, _, _, _ in overlapping:
+            db.storage.update_entry(id, end_time=timestamp)
 
         # Clock in
         args.extend(
@@ -778,14 +772,7 @@ timesheet. For example, ``t alter Documenting timebook.``''')
     else:
         entry_id = opts.entry_id
     if args:
-        db.execute(u'''
-        update
-            entry
-        set
-            description = ?
-        where
-            entry.id = ?
-        ''', (' '.join(args), entry_id))
+        db.storage.update_entry(entry_id, description=' '.join(args))
     meta = cmdutil.collect_user_specified_attributes(db, opts)
     if opts.billable != None:
         meta['billable'] = 'yes' if opts.billable else 'no'
@@ -794,28 +781,82 @@ timesheet. For example, ``t alter Documenting timebook.``''')
     dbutil.update_entry_meta(db, entry_id, meta)
 
 
-@command('show all running timesheets', aliases=('active',), read_only=True)
+@command('show all running timesheets', aliases=('active',), locking=False,
+         read_only=True)
 def running(db, args):
     parser = optparse.OptionParser(usage='''usage: %prog running
 
 Print all active sheets and any messages associated with them.''')
     opts, args = parser.parse_args(args=args)
-    db.execute(u'''
-    select
-        entry.sheet,
-        ifnull(entry.description, '--')
-    from
-        entry
-    where
-        entry.end_time is null
-    order by
-        entry.sheet asc;
-    ''')
-    cmdutil.pprint_table([(u'Timesheet', u'Description')] + db.fetchall())
+    cmdutil.pprint_table([(u'Timesheet', u'Description')] + [
+        (sheet, description or u'--')
+        for _, sheet, _, description in db.storage.get_running_entries()
+    ])
+
+
+@command('show the entries running at a time', locking=False, read_only=True)
+def at(db, args):
+    from timebook import archive
+    parser = optparse.OptionParser(usage='''usage: %prog at TIME
+
+Print the entries of every timesheet which were running at TIME, given as
+YYYY-MM-DD HH:MM or, for today, HH:MM.''')
+    opts, args = parser.parse_args(args=args)
+    if not args:
+        parser.error('"t at" takes a time.')
+    try:
+        timestamp = cmdutil.parse_date_time(' '.join(args))
+    except ValueError as e:
+        raise exceptions.CommandError(str(e))
+    with archive.attached(db, timestamp):
+        entries = dbutil.get_overlapping_entries(db, timestamp, timestamp + 1)
+    format_entries(entries)
+
+
+@command('show the entries overlapping a period', locking=False,
+         read_only=True)
+def overlapping(db, args):
+    from timebook import archive
+    parser = optparse.OptionParser(usage='''usage: %prog overlapping START END
+
+Print the entries of every timesheet which were running at any time from
+START until END, each given as YYYY-MM-DD HH:MM or, for today, HH:MM; all
+parameters should be quoted.''')
+    opts, args = parser.parse_args(args=args)
+    if len(args) != 2:
+        parser.error('"t overlapping" takes a start and an end time.')
+    try:
+        start, end = [cmdutil.parse_date_time(arg) for arg in args]
+    except ValueError as e:
+        raise exceptions.CommandError(str(e))
+    if end <= start:
+        raise exceptions.CommandError('END must be after START.')
+    with archive.attached(db, start):
+        entries = dbutil.get_overlapping_entries(db, start, end)
+    format_entries(entries)
+
+
+def format_entries(entries):
+    table = [[u'Timesheet', u'Start', u'End', u'Duration', u'Notes', u'ID']]
+    now = int(time.time())
+    for id, sheet, start_time, end_time, description in entries:
+        table.append([
+            sheet,
+            datetime.fromtimestamp(start_time).strftime('%Y-%m-%d %H:%M:%S'),
+            datetime.fromtimestamp(end_time).strftime('%Y-%m-%d %H:%M:%S')
+                if end_time is not None else u'',
+            cmdutil.timedelta_hms_display(timedelta(
+                seconds=(end_time if end_time is not None else now)
+                    - start_time
+            )),
+            description or u'',
+            str(id),
+        ])
+    cmdutil.pprint_table(table)
 
 
 @command('show the status of the current timesheet',
-         aliases=('info',), read_only=True)
+         aliases=('info',), locking=False, read_only=True)
 def now(db, args):
     parser = optparse.OptionParser(usage='''usage: %prog now [TIMESHEET]
 
@@ -828,8 +869,18 @@ timesheet instead.''')
     parser.add_option('-s', '--simple', dest='simple',
                       action='store_true', help='Only display the name \
 of the current timesheet.')
+    parser.add_option('--from-snapshot', dest='from_snapshot',
+                      action='store_true', help='Read the status of the \
+current timesheet from the status snapshot rather than the database.')
     opts, args = parser.parse_args(args=args)
 
+    if opts.from_snapshot and not args:
+        from timebook import snapshot
+        current = snapshot.read_snapshot(snapshot.get_snapshot_path(db.path))
+        if current is not None:
+            print_snapshot(current, opts.simple)
+            return
+
     if opts.simple:
         print dbutil.get_current_sheet(db)
         return
@@ -860,6 +911,14 @@ usage, see "%(prog)s --help".' % {'prog': os.path.basename(sys.argv[0])})
         print '%s: (inactive)' % sheet
 
 
+def print_snapshot(current, simple=False):
+    if simple:
+        print current['TIMEBOOK_SHEET']
+    else:
+        from timebook import snapshot
+        print snapshot.format_status(current)
+
+
 @command('insert a new timesheet entry at a specified time')
 def insert(db, args):
     try:
@@ -867,15 +926,20 @@ def insert(db, args):
         end = datetime.strptime(args[1], "%Y-%m-%d %H:%M")
         memo = args[2]
 
-        sql = """INSERT INTO entry (sheet, start_time, end_time, description)
-            VALUES (?, ?, ?, ?)"""
-        args = (
-                    dbutil.get_current_sheet(db),
-                    int(time.mktime(start.timetuple())),
-                    int(time.mktime(end.timetuple())),
-                    memo
+        sheet = dbutil.get_current_sheet(db)
+        start_time = int(time.mktime(start.timetuple()))
+        end_time = int(time.mktime(end.timetuple()))
+        overlapping = dbutil.get_overlapping_neighbors(
+            db, sheet, start_time, end_time
+        )
+        if overlapping:
+            raise exceptions.CommandError(
+                'The entry would overlap entry %s.' % ' and '.join(
+                    str(entry[0]) for entry in overlapping
                 )
-        db.execute(sql, args)
+            )
+
+        db.storage.add_entry(sheet, start_time, end_time, memo)
     except (ValueError, IndexError, ) as e:
         print "Insert requires three arguments, START END DESCRIPTION. \
 Please use the date format \"YYYY-MM-DD HH:MM\""
@@ -888,24 +952,19 @@ def modify(db, args):
         raise exceptions.CommandError("You must select the ID number of an entry \
 of you'd like to modify. Use 'modify latest' to modify the latest entry of the current sheet.")
     if args[0] == "latest":
-        db.execute(u"""
-            SELECT id
-            FROM entry WHERE sheet = ?
-            ORDER BY id DESC LIMIT 1
-        """, (dbutil.get_current_sheet(db), ))
-        row = db.fetchone()
+        row = db.storage.get_latest_entry(dbutil.get_current_sheet(db))
         if not row:
             raise exceptions.CommandError("No entries for modification found.")
         id = row[0]
     else:
-        id = args[0]
-    db.execute(u"""
-        SELECT start_time, end_time, description
-        FROM entry WHERE id = ?
-    """, (id, ))
-    row = db.fetchone()
+        try:
+            id = int(args[0])
+        except ValueError:
+            id = None
+        row = db.storage.get_entry(id)
     if not row:
         raise exceptions.CommandError("The ID you specified does not exist.")
+    row = row[2:5]
     start = datetime.fromtimestamp(row[0])
     try:
         end = datetime.fromtimestamp(row[1])
@@ -954,20 +1013,246 @@ of you'd like to modify. Use 'modify latest' to modify the latest entry of the c
     if not description:
         description = row[2]
 
-    sql = """
-        UPDATE entry
-        SET start_time = ?, end_time = ?, description = ? WHERE id = ?
-        """
-    args = (
-            int(time.mktime(start.timetuple())),
-            int(time.mktime(end.timetuple())) if end else None,
-            description,
-            id
+    # Leaving the end blank restarts an entry, which is refused if the
+    # timesheet already has a running entry.
+    db.storage.update_entry(
+        id,
+        start_time=int(time.mktime(start.timetuple())),
+        end_time=int(time.mktime(end.timetuple())) if end else None,
+        description=description,
+    )
+
+
+@command('recompute the local day of every entry', name='rebuild-days')
+def rebuild_days(db, args):
+    parser = optparse.OptionParser(usage='''usage: %prog rebuild-days
+
+Recompute the local day each entry starts on, which is stored alongside
+it for grouping entries by day. Run this after changing your timezone.''')
+    opts, args = parser.parse_args(args=args)
+    if args:
+        parser.error('"t rebuild-days" takes no arguments.')
+    count = dbutil.rebuild_local_days(db)
+    print ngettext('updated %d entry', 'updated %d entries', count) % count
+
+
+@command('move the entries of past years into archive files',
+         name='archive', locking=False)
+def archive_(db, args):
+    from timebook import archive
+    parser = optparse.OptionParser(usage='''usage: %prog archive --before YEAR
+
+Move the finished entries of each year before YEAR, with their metadata,
+into an archive file of their own next to the timebook database.  Reports
+covering archived dates still include them; listing timesheets and
+counting pay period hours only count the entries left in the database.''')
+    parser.add_option('-b', '--before', dest='before', type='int',
+            metavar='YEAR',
+            help='Archive the entries of the years before this one.'
+            )
+    opts, args = parser.parse_args(args=args)
+    if args:
+        parser.error('"t archive" takes no arguments.')
+    if opts.before is None:
+        parser.error('--before is required.')
+    if db.path == ':memory:':
+        raise exceptions.CommandError(
+            'An in-memory database cannot be archived.'
         )
-    db.execute(sql, args)
+    for year in archive.get_archivable_years(db, opts.before):
+        count = archive.archive_year(db, year)
+        print ngettext(
+            'archived %d entry from %d', 'archived %d entries from %d', count
+        ) % (count, year)
+
+
+@command('tidy up and check the timebook database', locking=False)
+def maintain(db, args):
+    from timebook import maintenance
+    parser = optparse.OptionParser(usage='''usage: %prog maintain [--cron]
+
+Check the database for damage, delete the metadata left behind by deleted
+entries, refresh the statistics SQLite uses to plan queries and return
+unused space to the file system, then print the number of rows and pages
+each table uses.''')
+    parser.add_option('--cron', dest='cron', action='store_true',
+            default=False,
+            help='Print nothing unless the database is damaged, and skip '
+                'maintenance while another command is using the database.'
+            )
+    opts, args = parser.parse_args(args=args)
+    if args:
+        parser.error('"t maintain" takes no arguments.')
+
+    problems = maintenance.check_integrity(db)
+    if problems:
+        print >> sys.stderr, 'error: the database is damaged:'
+        for problem in problems:
+            print >> sys.stderr, problem
+        raise SystemExit(1)
+    try:
+        db.begin()
+        try:
+            deleted = maintenance.delete_orphans(db)
+            maintenance.analyze(db)
+            db.execute(u'commit')
+        except:
+            db.execute(u'rollback')
+            raise
+        freed = maintenance.vacuum(db)
+    except sqlite3.OperationalError as e:
+        if opts.cron and 'locked' in str(e):
+            logger.debug("Database is in use; skipping maintenance.")
+            return
+        raise
+    if opts.cron:
+        return
+
+    for table, count in sorted(deleted.items()):
+        if count:
+            print ngettext(
+                'deleted %d orphaned row from %s',
+                'deleted %d orphaned rows from %s',
+                count
+            ) % (count, table)
+    print ngettext('freed %d page', 'freed %d pages', freed) % freed
+    table = [['Table', 'Rows', 'Pages']]
+    for name, rows, pages in maintenance.get_table_sizes(db):
+        table.append([name, str(rows), str(pages) if pages is not None else '?'])
+    cmdutil.pprint_table(table)
+    page_size, page_count, free_pages = maintenance.get_file_usage(db)
+    print '%d pages of %d bytes, %d free' % (page_count, page_size, free_pages)
+
+
+@command('copy the timebook database into the backup directory',
+         name='backup', locking=False, read_only=True)
+def backup_(db, args):
+    from timebook import backup
+    parser = optparse.OptionParser(usage='''usage: %prog backup [--list]
+
+Copy the timebook database into a timestamped file in the backup
+directory, then delete all but the newest backups there.  Archive files are
+not copied.''')
+    parser.add_option('-d', '--directory', dest='directory', type='string',
+            default=backup.get_directory(db),
+            help='Keep backups in this directory.'
+            )
+    parser.add_option('-k', '--keep', dest='keep', type='int',
+            default=backup.get_keep(db),
+            help='Keep this many backups (default %default).'
+            )
+    parser.add_option('-z', '--compress', dest='compress', type='choice',
+            choices=sorted(backup.COMPRESSIONS),
+            default=backup.get_compression(db),
+            help='Compress the backup with gzip or lzma.'
+            )
+    parser.add_option('-l', '--list', dest='list', action='store_true',
+            default=False, help='List the backups instead of taking one.'
+            )
+    opts, args = parser.parse_args(args=args)
+    if args:
+        parser.error('"t backup" takes no arguments.')
+    if db.path == ':memory:':
+        raise exceptions.CommandError(
+            'An in-memory database cannot be backed up.'
+        )
+    if opts.list:
+        for path in backup.get_backups(db.path, opts.directory):
+            print path
+        return
+    if opts.keep < 1:
+        parser.error('--keep must be at least 1.')
+    path, deleted = backup.backup(
+        db, opts.directory, opts.compress, opts.keep
+    )
+    print 'backed up to %s' % path
+    for path in deleted:
+        print 'deleted %s' % path
+
+
+@command('replace the timebook database with a backup', locking=False)
+def restore(db, args):
+    from timebook import backup
+    parser = optparse.OptionParser(usage='''usage: %prog restore BACKUP
+
+Check the backup BACKUP, a path or the name of a file in the backup
+directory, for damage, then back up the timebook database and replace it
+with BACKUP.  No other timebook command may be using the database, so stop
+the daemon first.''')
+    opts, args = parser.parse_args(args=args)
+    if len(args) != 1:
+        parser.error('"t restore" takes one backup.')
+    if db.path == ':memory:':
+        raise exceptions.CommandError(
+            'An in-memory database cannot be restored.'
+        )
+    path = args[0]
+    if not os.path.exists(path):
+        path = os.path.join(backup.get_directory(db), path)
+    if not os.path.exists(path):
+        raise exceptions.CommandError('No such backup: %s' % args[0])
+    saved = backup.restore(
+        db, path, backup.get_directory(db), backup.get_compression(db),
+        backup.get_keep(db)
+    )
+    print 'backed up the database to %s' % saved
+    print 'restored %s' % path
+
+
+@command('check or rebuild the stored totals of each timesheet',
+         name='rebuild-totals')
+def rebuild_totals(db, args):
+    parser = optparse.OptionParser(usage='''usage: %prog rebuild-totals
+
+Recompute the number of entries and total time recorded on each timesheet,
+overall and per day, which are kept up to date as entries change and used
+by "t list" and "t hours".  With --check, report the timesheets and days
+whose stored totals are wrong instead.''')
+    parser.add_option('-c', '--check', dest='check', action='store_true',
+            default=False,
+            help='Only report stored totals that differ from the entries.'
+            )
+    opts, args = parser.parse_args(args=args)
+    if args:
+        parser.error('"t rebuild-totals" takes no arguments.')
+    if not opts.check:
+        dbutil.rebuild_sheet_counters(db)
+        dbutil.rebuild_daily_totals(db)
+        return
+    mismatches = 0
+    for sheet, stored, actual in dbutil.check_sheet_counters(db):
+        mismatches += 1
+        print '%s: stored %s, actual %s' % (
+            sheet, format_sheet_counters(stored), format_sheet_counters(actual)
+        )
+    for sheet, day, stored, actual in dbutil.check_daily_totals(db):
+        mismatches += 1
+        print '%s %s: stored %s, actual %s' % (
+            sheet, day, format_totals(stored), format_totals(actual)
+        )
+    if mismatches:
+        raise SystemExit(1)
+
+
+def format_totals(totals):
+    if totals is None:
+        return 'none'
+    seconds, count = totals
+    return '%s in %s' % (
+        timedelta(seconds=seconds),
+        ngettext('%d entry', '%d entries', count) % count,
+    )
 
 
-@command('get ticket details', read_only=True)
+def format_sheet_counters(counters):
+    count, seconds, running_id = counters
+    return '%s, %s' % (
+        format_totals((seconds, count)),
+        'running entry %s' % running_id if running_id else 'not running',
+    )
+
+
+@command('get ticket details', locking=False, read_only=True)
 def details(db, args):
     ticket_number = args[0]
     try:
@@ -1031,6 +1316,7 @@ def details(db, args):
 
 @command('get timesheet statistics', locking=False, read_only=True)
 def stats(db, args):
+    from timebook import archive
     parser = optparse.OptionParser(usage='''usage: %prog stats''')
     parser.add_option('-s', '--start', dest='start', type='string',
                       metavar='DATE',
@@ -1055,117 +1341,120 @@ YYYY-MM-DD.')
                 opts.start, opts.end
             )
 
-    db.execute("""
-        SELECT
-            COALESCE(billable, 0),
-            SUM(
-                ROUND(
-                    (
-                        COALESCE(end_time, strftime('%s', 'now'))
-                        - start_time
-                    )
-                    / CAST(3600 AS FLOAT)
-                , 2)
-            ) as hours
-        FROM entry
-        LEFT JOIN entry_details ON entry_details.entry_id = entry.id
-        WHERE
-            start_time > STRFTIME('%s', ?, 'utc')
-            and (
-                end_time < STRFTIME('%s', ?, 'utc', '1 day')
-                or end_time is null
-            )
-        AND sheet = 'default'
-        GROUP BY billable
-        ORDER BY billable
-        """, (start_date, end_date))
-    results = db.fetchall()
-
-    billable_hours = 0
-    total_hours = 0
-    for result in results:
-        if result[0] == 1:
-            billable_hours = billable_hours + result[1]
-        total_hours = total_hours + result[1]
-
-    print "Total Hours: %s (%s%% billable)" % (
-                round(total_hours, 2),
-                round(billable_hours / total_hours * 100, 2)
-            )
+    # Reach into the archives of the years the range covers.
+    with archive.attached(db, time.mktime(start_date.timetuple())):
+        db.execute("""
+            SELECT
+                COALESCE(billable, 0),
+                SUM(
+                    ROUND(
+                        (
+                            COALESCE(end_time, strftime('%s', 'now'))
+                            - start_time
+                        )
+                        / CAST(3600 AS FLOAT)
+                    , 2)
+                ) as hours
+            FROM entry
+            LEFT JOIN entry_details ON entry_details.entry_id = entry.id
+            WHERE
+                start_time > STRFTIME('%s', ?, 'utc')
+                and (
+                    end_time < STRFTIME('%s', ?, 'utc', '1 day')
+                    or end_time is null
+                )
+            AND sheet = 'default'
+            GROUP BY billable
+            ORDER BY billable
+            """, (start_date, end_date))
+        results = db.fetchall()
+
+        billable_hours = 0
+        total_hours = 0
+        for result in results:
+            if result[0] == 1:
+                billable_hours = billable_hours + result[1]
+            total_hours = total_hours + result[1]
 
-    db.execute("""
-        SELECT
-            project,
-            SUM(
-                ROUND(
-                    (COALESCE(end_time, strftime('%s', 'now')) - start_time)
-                    / CAST(3600 AS FLOAT), 2)
-            ) as hours
-        FROM entry_details
-        INNER JOIN entry ON entry_details.entry_id = entry.id
-        LEFT JOIN ticket_details ON
-            ticket_details.number = entry_details.ticket_number
-        WHERE start_time > STRFTIME('%s', ?, 'utc')
-            and (
-                end_time < STRFTIME('%s', ?, 'utc', '1 day')
-                OR end_time is null
-            )
-        AND sheet = 'default'
-        GROUP BY project
-        ORDER BY hours DESC
-        """,
-            (start_date, end_date)
-            )
-    rows = db.fetchall()
+        print "Total Hours: %s (%s%% billable)" % (
+                    round(total_hours, 2),
+                    round(billable_hours / total_hours * 100, 2)
+                )
 
-    print "\nProject time allocations"
-    for row in rows:
-        print "%s%%\t%s\t%s" % (
-                    round((row[1] / total_hours) * 100, 2),
-                    row[1],
-                    row[0]
+        db.execute("""
+            SELECT
+                project,
+                SUM(
+                    ROUND(
+                        (COALESCE(end_time, strftime('%s', 'now')) - start_time)
+                        / CAST(3600 AS FLOAT), 2)
+                ) as hours
+            FROM entry_details
+            INNER JOIN entry ON entry_details.entry_id = entry.id
+            LEFT JOIN ticket_details ON
+                ticket_details.number = entry_details.ticket_number
+            WHERE start_time > STRFTIME('%s', ?, 'utc')
+                and (
+                    end_time < STRFTIME('%s', ?, 'utc', '1 day')
+                    OR end_time is null
+                )
+            AND sheet = 'default'
+            GROUP BY project
+            ORDER BY hours DESC
+            """,
+                (start_date, end_date)
                 )
+        rows = db.fetchall()
 
-    db.execute("""
-        SELECT
-            details,
-            number,
-            SUM(
-                ROUND(
-                    (COALESCE(end_time, strftime('%s', 'now')) - start_time)
-                    / CAST(3600 AS FLOAT), 2)
-            ) as hours
-        FROM entry_details
-        INNER JOIN entry ON entry_details.entry_id = entry.id
-        INNER JOIN ticket_details ON
-            ticket_details.number = entry_details.ticket_number
-        WHERE start_time > STRFTIME('%s', ?, 'utc')
-            and (
-                end_time < STRFTIME('%s', ?, 'utc', '1 day')
-                OR end_time is null
-            )
-        AND sheet = 'default'
-        GROUP BY details, number
-        ORDER BY hours DESC
-        LIMIT 10
-        """,
-            (start_date, end_date)
-            )
-    rows = db.fetchall()
+        print "\nProject time allocations"
+        for row in rows:
+            print "%s%%\t%s\t%s" % (
+                        round((row[1] / total_hours) * 100, 2),
+                        row[1],
+                        row[0]
+                    )
 
-    print "\nBiggest Tickets"
-    for row in rows:
-        print "%s%%\t%s\t%s\t%s" % (
-                    round((row[2] / total_hours) * 100, 2),
-                    row[2],
-                    row[1],
-                    row[0]
+        db.execute("""
+            SELECT
+                details,
+                number,
+                SUM(
+                    ROUND(
+                        (COALESCE(end_time, strftime('%s', 'now')) - start_time)
+                        / CAST(3600 AS FLOAT), 2)
+                ) as hours
+            FROM entry_details
+            INNER JOIN entry ON entry_details.entry_id = entry.id
+            INNER JOIN ticket_details ON
+                ticket_details.number = entry_details.ticket_number
+            WHERE start_time > STRFTIME('%s', ?, 'utc')
+                and (
+                    end_time < STRFTIME('%s', ?, 'utc', '1 day')
+                    OR end_time is null
+                )
+            AND sheet = 'default'
+            GROUP BY details, number
+            ORDER BY hours DESC
+            LIMIT 10
+            """,
+                (start_date, end_date)
                 )
+        rows = db.fetchall()
+
+        print "\nBiggest Tickets"
+        for row in rows:
+            print "%s%%\t%s\t%s\t%s" % (
+                        round((row[2] / total_hours) * 100, 2),
+                        row[2],
+                        row[1],
+                        row[0]
+                    )
 
 
 @command('display timesheet, by default the current one',
-         aliases=('export', 'format', 'show'), read_only=True)
+         aliases=('export', 'format', 'show'), locking=False, read_only=True)
 def display(db, args):
+    from timebook import archive
     # arguments
     parser = optparse.OptionParser(usage='''usage: %prog display [TIMESHEET]
 
@@ -1178,11 +1467,11 @@ If a specific timesheet is given, display the same information for that
 timesheet instead.''')
     parser.add_option('-s', '--start', dest='start', type='string',
                       metavar='DATE', help='Show only entries \
-starting after 00:00 on this date. The date should be of the format \
+running after 00:00 on this date. The date should be of the format \
 YYYY-MM-DD.')
     parser.add_option('-e', '--end', dest='end', type='string',
                       metavar='DATE', help='Show only entries \
-ending before 00:00 on this date. The date should be of the format \
+started before 00:00 on this date. The date should be of the format \
 YYYY-MM-DD.')
     parser.add_option('-f', '--format', dest='format', type='string',
                   default='plain',
@@ -1213,26 +1502,28 @@ style (--format=plain) or csv --format=csv or eu timesheet csv --format=eu")
 
     if opts.start is not None:
         start = cmdutil.parse_date_time(opts.start)
-        where += ' and start_time >= %s' % start
     else:
-        where += ''' and start_time >
-            STRFTIME(\'%s\', \'now\', \'-6 days\', \'start of day\')
-        '''
+        start = time.mktime(
+            (datetime.now() - timedelta(days=6)).date().timetuple()
+        )
+    end = None
     if opts.end is not None:
         end = cmdutil.parse_date_time(opts.end)
-        where += ' and end_time <= %s' % end
-    if opts.format == 'plain':
-        format_timebook(
-            db, sheet, where, show_ids=opts.show_ids, summary=opts.summary
-        )
-    elif opts.format == 'csv':
-        format_csv(db, sheet, where, show_ids=opts.show_ids)
-    elif opts.format == 'eu':
-        format_eu(
-            db, sheet, where, show_ids=opts.show_ids,
-            sdate=datetime.strptime(opts.start, '%Y-%m-%d'), edate=datetime.strptime(opts.end, '%Y-%m-%d'))
-    else:
+    if opts.format not in ('plain', 'csv', 'eu'):
         raise SystemExit('Invalid format: %s' % opts.format)
+    # Reach into the archives of the years the range covers.
+    with archive.attached(db, start):
+        where += ' and ' + dbutil.get_interval_condition(db, start, end)
+        if opts.format == 'plain':
+            format_timebook(
+                db, sheet, where, show_ids=opts.show_ids, summary=opts.summary
+            )
+        elif opts.format == 'csv':
+            format_csv(db, sheet, where, show_ids=opts.show_ids)
+        elif opts.format == 'eu':
+            format_eu(
+                db, sheet, where, show_ids=opts.show_ids,
+                sdate=datetime.strptime(opts.start, '%Y-%m-%d'), edate=datetime.strptime(opts.end, '%Y-%m-%d'))
 
 
 def format_eu(db, sheet, where, show_ids=False, sdate=None, edate=None):
@@ -1255,10 +1546,10 @@ def format_eu(db, sheet, where, show_ids=False, sdate=None, edate=None):
         return round(t*2/60.0/60.0, 0)/2
 
     day_total = None
-    db.execute(u'''
+    rows = db.query(u'''
     select
         id,
-        date(e.start_time, 'unixepoch', 'localtime') as day,
+        e.day as day,
         ifnull(sum(ifnull(e.end_time, strftime('%%s', 'now')) -
                    e.start_time), 0) as day_total,
         ifnull(e.description, '') as description
@@ -1271,7 +1562,6 @@ def format_eu(db, sheet, where, show_ids=False, sdate=None, edate=None):
     order by
         day asc;
     ''' % where, (sheet,))
-    rows = db.fetchall()
     export_data = {}
     description_list = []
 
@@ -1330,7 +1620,7 @@ def format_csv(db, sheet, where, show_ids=False):
 
     writer = csv.writer(sys.stdout)
     writer.writerow(('Start', 'End', 'Length', 'Description'))
-    db.execute(u'''
+    rows = db.query(u'''
     select
        start_time,
        end_time,
@@ -1346,33 +1636,16 @@ def format_csv(db, sheet, where, show_ids=False):
     ''' % where, (sheet,))
     format = lambda t: datetime.fromtimestamp(t).strftime(
         '%m/%d/%Y %H:%M:%S')
-    rows = db.fetchall()
-    if(show_ids):
-        writer.writerows(
-            map(
-                lambda row: (
-                    format(row[0]),
-                    format(row[1]),
-                    row[2],
-                    row[3],
-                    row[4]
-                ),
-                rows
-            )
-        )
-    else:
-        writer.writerows(
-            map(
-                lambda row: (
-                    format(row[0]),
-                    format(row[1]),
-                    row[2],
-                    row[3]
-                ),
-                rows
+    count = 0
+    for row in rows:
+        count += 1
+        if(show_ids):
+            writer.writerow(
+                (format(row[0]), format(row[1]), row[2], row[3], row[4])
             )
-        )
-    total_formula = '=SUM(C2:C%d)/3600' % (len(rows) + 1)
+        else:
+            writer.writerow((format(row[0]), format(row[1]), row[2], row[3]))
+    total_formula = '=SUM(C2:C%d)/3600' % (count + 1)
     writer.writerow(('Total', '', total_formula, ''))
 
 
@@ -1395,27 +1668,11 @@ def format_timebook(db, sheet, where, show_ids=False, summary=False):
 
     last_day = None
     day_total = None
-    db.execute(u'''
-    select
-        date(e.start_time, 'unixepoch', 'localtime') as day,
-        ifnull(sum(ifnull(e.end_time, strftime('%%s', 'now')) -
-                   e.start_time), 0) as day_total
-    from
-        entry e
-    where
-        e.sheet = ?%s
-    group by
-        day
-    order by
-        day asc;
-    ''' % where, (sheet,))
-    days = db.fetchall()
-    days_iter = iter(days)
-
+    total = 0
     if summary:
-        db.execute(u'''
+        entries = db.query(u'''
         select
-            date(e.start_time, 'unixepoch', 'localtime') as day,
+            e.day as day,
             min(e.start_time) as start,
             max(e.end_time) as end,
             sum(ifnull(e.end_time, strftime('%%s', 'now')) - e.start_time) as
@@ -1427,15 +1684,15 @@ def format_timebook(db, sheet, where, show_ids=False, summary=False):
         where
             e.sheet = ?%s
         group by
-            date(e.start_time, 'unixepoch', 'localtime'),
+            e.day,
             ifnull(e.description, '')
         order by
             day asc;
         ''' % where, (sheet,))
     else:
-        db.execute(u'''
+        entries = db.query(u'''
         select
-            date(e.start_time, 'unixepoch', 'localtime') as day,
+            e.day as day,
             e.start_time as start,
             e.end_time as end,
             ifnull(e.end_time, strftime('%%s', 'now')) - e.start_time as
@@ -1449,7 +1706,6 @@ def format_timebook(db, sheet, where, show_ids=False, summary=False):
         order by
             day asc;
         ''' % where, (sheet,))
-    entries = db.fetchall()
 
     # Get list of total metadata keys
     db.execute(u'''
@@ -1498,7 +1754,9 @@ def format_timebook(db, sheet, where, show_ids=False, summary=False):
                     + [''] * extra_count
                 )
             row = [date]
-            cur_day, day_total = days_iter.next()
+            day_total = 0
+        day_total += duration
+        total += duration
         row.extend([
                 trange, diff
             ])
@@ -1516,16 +1774,7 @@ def format_timebook(db, sheet, where, show_ids=False, summary=False):
         table.append(row)
         last_day = day
 
-    db.execute(u'''
-    select
-        ifnull(sum(ifnull(e.end_time, strftime('%%s', 'now')) -
-                   e.start_time), 0) as total
-    from
-        entry e
-    where
-        e.sheet = ?%s;
-    ''' % where, (sheet,))
-    total = displ_total(db.fetchone()[0])
+    total = displ_total(total)
     table += [['', '', displ_total(day_total), ''] + [''] * extra_count,
               ['Total', '', total, '',] + [''] * extra_count]
     cmdutil.pprint_table(table, footer_row=True)
@@ -0,0 +1,153 @@
+# completion.py
+#
+# Copyright (c) 2008-2009 Trevor Caira, 2011-2012 Adam Coddington
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Completion index for ``timebook-bash-completion.sh``.
+
+The index is a directory kept next to the timebook database holding plain
+text files with one entry per line, so that the completion script can
+offer candidates with ``compgen`` rather than by starting ``t``:
+
+``commands``
+    command names, built-in aliases and aliases configured in ``[aliases]``
+``aliases``
+    ``ALIAS COMMAND`` pairs
+``sheets``
+    timesheet names
+``global_options``
+    options accepted before the command
+``options/COMMAND``
+    options accepted by ``COMMAND``
+``stamp``
+    the versions of timebook and of the configuration file and the
+    timesheets the index was built from
+"""
+
+import os
+
+from timebook import dbutil, get_version, registry
+
+
+def get_index_path(db_path):
+    if db_path == ':memory:':
+        return None
+    return os.path.splitext(db_path)[0] + '.completion'
+
+
+def get_sheets(db):
+    sheets = set(dbutil.get_sheet_names(db))
+    sheets.add(dbutil.get_current_sheet(db))
+    return sorted(sheets)
+
+
+def get_stamp(db, sheets=None):
+    """Returns what the index depends on: the versions of timebook, whose
+    commands and options it lists, and of the configuration file, and the
+    timesheets."""
+    if sheets is None:
+        sheets = get_sheets(db)
+    return '%r\n' % ((get_version(), db.config.key, sheets), )
+
+
+def get_global_options():
+    from timebook.cmdline import make_parser
+    options = []
+    for option in make_parser().option_list:
+        options.extend(option._short_opts)
+        options.extend(option._long_opts)
+    return options
+
+
+def get_index(db, sheets=None):
+    """Returns a dictionary of the index's file names and their lines."""
+    aliases = dict(registry.cmd_aliases)
+    aliases.update(db.config.get_aliases())
+    if sheets is None:
+        sheets = get_sheets(db)
+    index = {
+        'commands': sorted(set(registry.commands) | set(aliases)),
+        'aliases': [
+            '%s %s' % (alias, aliases[alias]) for alias in sorted(aliases)
+        ],
+        'sheets': sheets,
+        'global_options': get_global_options(),
+    }
+    for name in registry.commands:
+        index[os.path.join('options', name)] = registry.get_command_options(
+            db.config, name
+        )
+    return index
+
+
+def write_file(path, content):
+    """Writes ``content`` to ``path`` unless it is already there."""
+    try:
+        f = open(path)
+        try:
+            if f.read() == content:
+                return
+        finally:
+            f.close()
+    except IOError:
+        pass
+    temp_path = '%s.%s.tmp' % (path, os.getpid())
+    f = open(temp_path, 'w')
+    try:
+        f.write(content)
+    finally:
+        f.close()
+    os.rename(temp_path, path)
+
+
+def write_index(db):
+    path = get_index_path(db.path)
+    if path is None:
+        return
+    options_path = os.path.join(path, 'options')
+    if not os.path.isdir(options_path):
+        os.makedirs(options_path)
+    sheets = get_sheets(db)
+    for name, lines in get_index(db, sheets).items():
+        write_file(os.path.join(path, name), ''.join(
+            '%s\n' % (line.encode('utf-8')
+                      if isinstance(line, unicode) else line)
+            for line in lines
+        ))
+    # Written last, so that an index interrupted part-way is rebuilt.
+    write_file(os.path.join(path, 'stamp'), get_stamp(db, sheets))
+
+
+def index_is_stale(db):
+    """Whether the index is missing or was built by another version of
+    timebook, from another version of the configuration file or from other
+    timesheets."""
+    path = get_index_path(db.path)
+    if path is None:
+        return False
+    try:
+        f = open(os.path.join(path, 'stamp'))
+        try:
+            return f.read() != get_stamp(db)
+        finally:
+            f.close()
+    except IOError:
+        return True
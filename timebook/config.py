@@ -21,11 +21,26 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-from ConfigParser import SafeConfigParser
+from ConfigParser import RawConfigParser, SafeConfigParser
+import marshal
 import os
+import re
+import shlex
+
+# Bump whenever the layout of the compiled configuration changes.
+CACHE_VERSION = 1
+
+HOOK_OPTION = re.compile(r'^(?:pre|post)(?:_.+)?_hook$')
 
 
 class ConfigParser(SafeConfigParser):
+    def __init__(self, *args, **kwargs):
+        SafeConfigParser.__init__(self, *args, **kwargs)
+        self._compiled = None
+        # Identifies the version of the file this was parsed from; see
+        # ``parse_config``.
+        self.key = None
+
     def __getitem__(self, name):
         return dict(self.items(name))
 
@@ -34,6 +49,97 @@ class ConfigParser(SafeConfigParser):
             return self.get(section, name)
         return default
 
+    @property
+    def compiled(self):
+        if self._compiled is None:
+            self._compiled = self.compile()
+        return self._compiled
+
+    def compile(self):
+        """Gathers the options consulted on every command into plain
+        dictionaries and lists that can be cached."""
+        compiled = {
+            'hooks': {},
+            'reporting_urls': {},
+            'aliases': {},
+            'custom_ticket_meta': [],
+        }
+        for section in self.sections():
+            for option in self.options(section):
+                if HOOK_OPTION.match(option):
+                    compiled['hooks'].setdefault(section, {})[option] = (
+                        shlex.split(self.get(section, option))
+                    )
+                elif option == 'reporting_url':
+                    compiled['reporting_urls'][section] = self.get(
+                        section, option
+                    )
+        if self.has_section('aliases'):
+            compiled['aliases'] = dict(
+                (option, self.get('aliases', option))
+                for option in self.options('aliases')
+            )
+        if self.has_section('custom_ticket_meta'):
+            compiled['custom_ticket_meta'] = [
+                (key, self.get('custom_ticket_meta', key))
+                for key in self.options('custom_ticket_meta')
+            ]
+        return compiled
+
+    def get_hook(self, section, name):
+        """Returns the command configured for hook ``name`` as a list of
+        arguments, or None."""
+        return self.compiled['hooks'].get(section, {}).get(name)
+
+    def get_reporting_url(self, section):
+        return self.compiled['reporting_urls'].get(section)
+
+    def get_alias(self, name):
+        return self.compiled['aliases'].get(name)
+
+    def get_aliases(self):
+        return self.compiled['aliases']
+
+    def get_custom_ticket_meta(self):
+        """Returns (option name, help text) pairs for each custom ticket
+        metadata attribute."""
+        return self.compiled['custom_ticket_meta']
+
+    def dump(self):
+        return {
+            'defaults': self.defaults().items(),
+            'sections': [
+                (section, [
+                    (k, v) for k, v in self._sections[section].items()
+                    if k != '__name__'
+                ])
+                for section in self.sections()
+            ],
+            'compiled': self.compiled,
+        }
+
+    def load(self, dumped):
+        # Values are stored raw, as when reading the file, so that they are
+        # only interpolated (and validated) when read.
+        for option, value in dumped['defaults']:
+            RawConfigParser.set(self, 'DEFAULT', option, value)
+        for section, options in dumped['sections']:
+            # Not ``add_section``, which refuses a section named "default"
+            # (the default timesheet) although reading the file accepts it.
+            self._sections[section] = self._dict()
+            self._sections[section]['__name__'] = section
+            for option, value in options:
+                RawConfigParser.set(self, section, option, value)
+        self._compiled = dumped['compiled']
+
+    def _read(self, fp, fpname):
+        SafeConfigParser._read(self, fp, fpname)
+        self._compiled = None
+
+    def set(self, section, option, value=None):
+        SafeConfigParser.set(self, section, option, value)
+        self._compiled = None
+
 
 def subdirs(path):
     path = os.path.abspath(path)
@@ -45,8 +151,70 @@ def subdirs(path):
         last = path.find(os.path.sep, last + 1)
 
 
+def get_cache_path(filename):
+    return filename + '.cache'
+
+
+def read_cache(filename, key):
+    try:
+        f = open(get_cache_path(filename), 'rb')
+        try:
+            cached_key, dumped = marshal.load(f)
+        finally:
+            f.close()
+    except (IOError, EOFError, ValueError, TypeError):
+        return None
+    if cached_key != key:
+        return None
+    return dumped
+
+
+def write_cache(filename, key, dumped):
+    path = get_cache_path(filename)
+    temp_path = '%s.%s.tmp' % (path, os.getpid())
+    try:
+        f = open(temp_path, 'wb')
+        try:
+            marshal.dump((key, dumped), f)
+        finally:
+            f.close()
+        os.rename(temp_path, path)
+    except (IOError, OSError):
+        # The cache is only an optimization.
+        pass
+
+
 def parse_config(filename):
+    """Parses ``filename``, creating it if it does not yet exist.
+
+    The parsed options are cached in ``<filename>.cache`` and reused for
+    as long as the modification time and size of ``filename`` match.
+    """
     config = ConfigParser()
+    config.path = filename
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        create_config(filename)
+        stat = os.stat(filename)
+    key = (CACHE_VERSION, stat.st_mtime, stat.st_size)
+    config.key = key
+
+    dumped = read_cache(filename, key)
+    if dumped is not None:
+        config.load(dumped)
+        return config
+
+    f = open(filename)
+    try:
+        config.readfp(f)
+    finally:
+        f.close()
+    write_cache(filename, key, config.dump())
+    return config
+
+
+def create_config(filename):
     if not os.path.exists(os.path.dirname(filename)):
         for d in subdirs(filename):
             if os.path.exists(d):
@@ -59,9 +227,3 @@ def parse_config(filename):
             f.write('# timebook configuration file')
         finally:
             f.close()
-    f = open(filename)
-    try:
-        config.readfp(f)
-    finally:
-        f.close()
-    return config
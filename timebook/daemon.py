@@ -0,0 +1,228 @@
+# daemon.py
+#
+# Copyright (c) 2008-2009 Trevor Caira, 2011-2012 Adam Coddington
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import optparse
+import os
+import signal
+import socket
+import sqlite3
+import SocketServer
+import sys
+
+from timebook import client, cmdline, logger, registry
+from timebook.cmdutil import AmbiguousLookup, NoMatch
+from timebook.commands import command, relay_hook_output
+from timebook.config import parse_config
+
+
+class OutputCapture(object):
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self.chunks = []
+        self.softspace = 0
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode(self.encoding, 'replace')
+        self.chunks.append(data)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return ''.join(self.chunks)
+
+
+class DaemonRequestHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        argv, cwd, environ = client.decode_request(self.rfile.read())
+        self.wfile.write(
+            client.encode_response(*self.server.run(argv, cwd, environ))
+        )
+
+
+class TimebookDaemon(SocketServer.UnixStreamServer):
+    """Runs forwarded command lines against a single open ``Database``.
+
+    Requests are handled one at a time, so commands never interleave on
+    the shared connection.
+    """
+    def __init__(self, path, db):
+        self.db = db
+        self.config_stat = self._stat_config()
+        SocketServer.UnixStreamServer.__init__(
+            self, path, DaemonRequestHandler
+        )
+
+    def _stat_config(self):
+        try:
+            stat = os.stat(self.db.config.path)
+            return (stat.st_mtime, stat.st_size)
+        except OSError:
+            return None
+
+    def reload_config(self):
+        config_stat = self._stat_config()
+        if config_stat != self.config_stat:
+            logger.info("Configuration changed; reloading.")
+            self.db.config = parse_config(self.db.config.path)
+            self.config_stat = config_stat
+
+    def is_local(self, options, args):
+        if options.profile or options.trace_sql:
+            # Profile or trace a command run by ``t`` itself, as it would be
+            # without the daemon.
+            return True
+        if not (
+            os.path.isabs(options.timebook) and os.path.isabs(options.config)
+        ):
+            # Relative paths name files in the client's working directory,
+            # which need not be the daemon's.
+            return True
+        if (
+            os.path.abspath(options.timebook) != os.path.abspath(self.db.path)
+            or os.path.abspath(options.config)
+                != os.path.abspath(self.db.config.path)
+        ):
+            return True
+        try:
+            cmd = registry.get_command_by_name(self.db.config, args[0])
+        except (AmbiguousLookup, NoMatch):
+            # Let the command line report the lookup error.
+            return False
+        return registry.commands[cmd].interactive
+
+    def run(self, argv, cwd=None, environ=None):
+        """Runs ``argv`` in the client's working directory and environment,
+        if given, and returns its exit status and output, including that
+        of its hooks."""
+        self.reload_config()
+        real_cwd, real_environ = os.getcwd(), dict(os.environ)
+        if cwd is not None:
+            os.chdir(cwd)
+        if environ is not None:
+            set_environ(environ)
+        stdout = OutputCapture(cmdline.DEFAULTS['encoding'])
+        stderr = OutputCapture(cmdline.DEFAULTS['encoding'])
+        real_stdout, real_stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = stdout, stderr
+        try:
+            try:
+                # Made here, so that its defaults come from the client's
+                # environment.
+                parser = cmdline.make_parser()
+                options, args = cmdline.parse_options(parser, argv)
+                if self.is_local(options, args):
+                    return client.RUN_LOCALLY, '', ''
+                with relay_hook_output():
+                    cmdline.dispatch(parser, self.db, args)
+                status = 0
+            except SystemExit as e:
+                status = get_exit_status(e)
+            except Exception as e:
+                logger.exception(e)
+                status = 1
+        finally:
+            sys.stdout, sys.stderr = real_stdout, real_stderr
+            self.rollback()
+            set_environ(real_environ)
+            os.chdir(real_cwd)
+        return status, stdout.getvalue(), stderr.getvalue()
+
+    def rollback(self):
+        # Commands that exit early may leave their transaction open; a
+        # short-lived process would discard it on exit, so do the same.
+        try:
+            self.db.execute(u'rollback')
+        except sqlite3.OperationalError:
+            pass
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def set_environ(environ):
+    # Through os.environ, so that subprocesses see the change too.
+    for name in set(os.environ) - set(environ):
+        del os.environ[name]
+    os.environ.update(environ)
+
+
+def get_exit_status(exc):
+    if exc.code is None:
+        return 0
+    if isinstance(exc.code, int):
+        return exc.code
+    print >> sys.stderr, exc.code
+    return 1
+
+
+def daemon_is_running(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+
+@command('serve commands from a resident process', locking=False,
+         read_only=True)
+def daemon(db, args):
+    parser = optparse.OptionParser(usage='''usage: %prog daemon
+
+Keep the timebook database and configuration open in a long-running
+process.  While it is running, ``t`` forwards each command line to it
+over a unix socket instead of starting up from scratch; interactive
+commands are still run by ``t`` itself.''')
+    parser.add_option('--socket', dest='socket', type='string',
+            default=client.get_socket_path(),
+            help='Path of the unix socket to listen on (default: "%s").'
+                % client.get_socket_path()
+            )
+    opts, args = parser.parse_args(args=args)
+
+    if os.path.exists(opts.socket):
+        if daemon_is_running(opts.socket):
+            raise SystemExit(
+                'error: a daemon is already listening on %s' % opts.socket
+            )
+        os.unlink(opts.socket)
+
+    old_umask = os.umask(0o077)
+    try:
+        server = TimebookDaemon(opts.socket, db)
+    finally:
+        os.umask(old_umask)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logger.info("Listening on %s" % opts.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
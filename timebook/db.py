@@ -21,21 +21,181 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import os
 import sqlite3
+import time
 
-from timebook.migrations import MigrationManager
+from timebook import logger, profiling
+from timebook.migrations import LATEST_VERSION, MigrationManager
+from timebook.storage import SQLiteStorage
+
+
+CURSOR_METHODS = (
+    'execute', 'executemany', 'executescript', 'fetchone', 'fetchall',
+)
+
+# Defaults for the ``database`` section of the configuration file.
+DEFAULT_JOURNAL_MODE = 'wal'
+DEFAULT_BUSY_TIMEOUT = 5000
+DEFAULT_LOCK_RETRIES = 5
+DEFAULT_LOCK_BACKOFF = 0.05
+
+JOURNAL_MODES = ('delete', 'truncate', 'persist', 'memory', 'wal', 'off')
+
+
+def get_read_only_uri(path):
+    path = os.path.abspath(path)
+    for char in ('%', '?', '#'):
+        path = path.replace(char, '%%%02x' % ord(char))
+    return 'file:%s?mode=ro' % path
+
+
+def connect_read_only(path):
+    """Returns a connection to ``path`` which cannot write to it, or None
+    if this SQLite cannot open databases read-only by URI."""
+    uri = get_read_only_uri(path)
+    try:
+        return sqlite3.connect(uri, isolation_level=None, uri=True)
+    except TypeError:
+        # Python 2 cannot ask for URI filenames; they are only understood
+        # if SQLite was built to accept them by default, and otherwise
+        # would create a file of that name.
+        connection = sqlite3.connect(':memory:')
+        options = [row[0] for row in connection.execute(
+            'pragma compile_options'
+        )]
+        connection.close()
+        if 'USE_URI' not in options:
+            return None
+        return sqlite3.connect(uri, isolation_level=None)
 
 
 class Database(object):
-    def __init__(self, path, config):
+    def __init__(self, path, config, trace_stream=None, read_only=False):
         self.config = config
         self.path = path
-        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.tracer = None
+        self.read_only = False
+        self.storage = SQLiteStorage(self)
+        with profiling.phase('db_open'):
+            if read_only and self._open_read_only(trace_stream):
+                return
+            self._open(sqlite3.connect(path, isolation_level=None),
+                       trace_stream)
+            self._configure_connection()
+        with profiling.phase('migrations'):
+            self._initialize_db()
+
+    def _open(self, connection, trace_stream):
+        self.connection = connection
         self.cursor = self.connection.cursor()
-        for attr in ('execute', 'executescript', 'fetchone', 'fetchall'):
+        for attr in CURSOR_METHODS:
             setattr(self, attr, getattr(self.cursor, attr))
+        if trace_stream is not None:
+            self.start_tracing(trace_stream)
+
+    def _open_read_only(self, trace_stream):
+        """Opens the database for reading only, so that commands which
+        never write take no locks but those needed to read and leave the
+        journal alone; returns False if it must be opened for writing
+        instead, as when it does not exist yet or needs migrating."""
+        if self.path == ':memory:' or not os.path.exists(self.path):
+            return False
+        try:
+            connection = connect_read_only(self.path)
+        except sqlite3.OperationalError:
+            return False
+        if connection is None:
+            return False
+        self._open(connection, trace_stream)
+        self.execute(u'pragma busy_timeout = %d' % self.get_setting(
+            'busy_timeout', DEFAULT_BUSY_TIMEOUT
+        ))
+        self.execute(u'pragma query_only = 1')
+        if self.db_version < LATEST_VERSION:
+            self.connection.close()
+            return False
+        self.read_only = True
+        return True
+
+    def reopen(self):
+        """Connects afresh to the database file, as after it has been
+        replaced, and brings it up to date; statements traced so far stay
+        recorded."""
+        tracer = self.tracer
+        self.connection.close()
+        self._open(sqlite3.connect(self.path, isolation_level=None), None)
+        if tracer is not None:
+            tracer.finish()
+            tracer.cursor = self.cursor
+            self.tracer = tracer
+            for attr in CURSOR_METHODS:
+                setattr(self, attr, getattr(tracer, attr))
+        self.read_only = False
+        self._configure_connection()
         self._initialize_db()
 
+    def get_setting(self, name, default):
+        return type(default)(
+            self.config.get_with_default('database', name, default)
+        )
+
+    def _configure_connection(self):
+        # Wait for other writers instead of failing at once, and let
+        # readers and the writer proceed side by side.
+        self.execute(u'pragma busy_timeout = %d' % self.get_setting(
+            'busy_timeout', DEFAULT_BUSY_TIMEOUT
+        ))
+        journal_mode = self.get_setting('journal_mode', DEFAULT_JOURNAL_MODE)
+        if not journal_mode:
+            return
+        if journal_mode.lower() not in JOURNAL_MODES:
+            raise ValueError(
+                'journal_mode must be one of %s, not %r' % (
+                    ', '.join(JOURNAL_MODES), journal_mode
+                )
+            )
+        try:
+            self.execute(u'pragma journal_mode = %s' % journal_mode)
+            self.fetchone()
+        except sqlite3.OperationalError as e:
+            # Switching journal modes needs the database to itself; carry
+            # on in the current mode and try again next time.
+            logger.debug("Unable to set journal mode %s: %s" % (
+                journal_mode, e
+            ))
+
+    def begin(self):
+        """Starts a write transaction, retrying with exponential backoff
+        while another connection holds the write lock."""
+        retries = self.get_setting('lock_retries', DEFAULT_LOCK_RETRIES)
+        backoff = self.get_setting('lock_backoff', DEFAULT_LOCK_BACKOFF)
+        for attempt in range(retries + 1):
+            try:
+                self.execute(u'begin immediate')
+                return
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e) or attempt == retries:
+                    raise
+                logger.debug("Database is locked; retrying.")
+                time.sleep(backoff * 2 ** attempt)
+
+    @property
+    def in_transaction(self):
+        """Whether a transaction is open on the connection."""
+        try:
+            return self.connection.in_transaction
+        except AttributeError:
+            pass
+        # Python 2's sqlite3 cannot tell; a deferred transaction takes no
+        # locks, so starting one is a cheap way to find out.
+        try:
+            self.execute(u'begin deferred')
+        except sqlite3.OperationalError:
+            return True
+        self.execute(u'commit')
+        return False
+
     @property
     def db_version(self):
         try:
@@ -49,3 +209,23 @@ class Database(object):
     def _initialize_db(self):
         manager = MigrationManager(self)
         manager.upgrade()
+
+    def query(self, sql, params=()):
+        """Runs ``sql`` on a cursor of its own and returns the cursor.
+
+        Unlike ``execute``, the results can be iterated over row by row
+        while other statements are run on the database.
+        """
+        cursor = self.connection.cursor()
+        if self.tracer is not None:
+            return self.tracer.query(cursor, sql, params)
+        return cursor.execute(sql, params)
+
+    def start_tracing(self, stream=None):
+        """Records the statements run from now on, logging each to
+        ``stream`` if given; returns the ``QueryTracer``."""
+        from timebook.sqltrace import QueryTracer
+        self.tracer = QueryTracer(self.cursor, stream)
+        for attr in CURSOR_METHODS:
+            setattr(self, attr, getattr(self.tracer, attr))
+        return self.tracer
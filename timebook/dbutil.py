@@ -23,206 +23,275 @@
 
 import datetime
 import re
+import sqlite3
 import time
 
-from timebook.chiliproject import ChiliprojectConnector
+# Timesheets are read and written through ``db.storage``; see
+# ``timebook.storage``.  The rest works on the SQLite database itself.
+
+
+# The first SQLite version supporting ``insert ... on conflict do update``.
+UPSERT_SQLITE_VERSION = (3, 24, 0)
+
+
+def has_upsert():
+    return sqlite3.sqlite_version_info >= UPSERT_SQLITE_VERSION
 
 
 def get_current_sheet(db):
-    db.execute(u'''
-    select
-        value
-    from
-        meta
-    where
-        key = 'current_sheet'
-    ''')
-    return db.fetchone()[0]
+    return db.storage.get_current_sheet()
 
 
 def get_sheet_names(db):
-    db.execute(u'''
-    select
-        distinct sheet
-    from
-        entry
-    ''')
-    return tuple(r[0] for r in db.fetchall())
+    return db.storage.get_sheet_names()
 
 
 def get_active_info(db, sheet):
-    db.execute(u'''
-    select
-        strftime('%s', 'now') - entry.start_time,
-        entry.description,
-        id
-    from
-        entry
-    where
-        entry.sheet = ? and
-        entry.end_time is null
-    ''', (sheet,))
-    return db.fetchone()
+    """Returns how long the running entry of ``sheet`` has been running,
+    its description and its id, if it has one."""
+    running = db.storage.get_running_entry(sheet)
+    if running is None:
+        return None
+    id, start_time, description = running
+    return (int(time.time()) - start_time, description, id)
 
 
 def get_current_active_info(db):
+    running = get_active_info(db, get_current_sheet(db))
+    if running is None:
+        return None
+    return (running[2], running[0])
+
+
+def get_current_start_time(db):
+    running = db.storage.get_running_entry(get_current_sheet(db))
+    if running is None:
+        return None
+    return running[:2]
+
+
+def get_entry_count(db, sheet):
+    return db.storage.get_entry_count(sheet)
+
+
+def get_previous_entry(db, sheet, timestamp):
+    """Returns the id, start time, end time and description of the entry
+    of ``sheet`` which started last at or before ``timestamp``, if any."""
+    return db.storage.get_previous_entry(sheet, timestamp)
+
+
+def get_next_entry(db, sheet, timestamp):
+    """Returns the id, start time, end time and description of the entry
+    of ``sheet`` which starts first after ``timestamp``, if any."""
+    return db.storage.get_next_entry(sheet, timestamp)
+
+
+def get_overlapping_neighbors(db, sheet, start, end=None):
+    """Returns the entries of ``sheet``, as ``get_previous_entry`` does,
+    either side of the period from ``start`` to ``end`` (or open-ended)
+    which overlap it.
+
+    Commands check this before adding entries, so that those of a sheet do
+    not overlap one another and only the entries either side of ``start``
+    need checking; both are found through ``entry_sheet_start_time``.
+    """
+    overlapping = []
+    previous = get_previous_entry(db, sheet, start)
+    if previous is not None and (previous[2] is None or previous[2] > start):
+        overlapping.append(previous)
+    following = get_next_entry(db, sheet, start)
+    if following is not None and (end is None or following[1] < end):
+        overlapping.append(following)
+    return overlapping
+
+
+# End stored in entry_interval for running entries: the end of 9999.
+RUNNING_END = 253402300799
+
+
+def has_interval_index(db):
+    """Whether ``entry_interval`` can narrow down queries on ``entry``.
+
+    It is missing if SQLite was built without R*Trees, and covers only the
+    database's own entries while archives are attached.
+    """
     db.execute(u'''
     select
-        entry.id,
-        strftime('%s', 'now') - entry.start_time
-    from
-        entry
-    inner join
-        meta
-    on
-        meta.key = 'current_sheet' and
-        meta.value = entry.sheet
-    where
-        entry.end_time is null
+        exists (
+            select 1 from sqlite_master where name = 'entry_interval'
+        )
+        and not exists (
+            select 1 from sqlite_temp_master where name = 'entry'
+        )
     ''')
-    return db.fetchone()
+    return bool(db.fetchone()[0])
+
+
+def get_interval_condition(db, start=None, end=None):
+    """Returns the condition on ``entry`` which holds for the entries
+    overlapping the period from ``start`` to ``end``, either of which may
+    be None for no limit; running entries last until now."""
+    conditions = []
+    interval_conditions = []
+    if start is not None:
+        conditions.append(
+            u'ifnull(end_time, %d) > %d' % (int(time.time()), start)
+        )
+        interval_conditions.append(u'end_time > %d' % start)
+    if end is not None:
+        conditions.append(u'start_time < %d' % end)
+        interval_conditions.append(u'start_time < %d' % end)
+    if interval_conditions and has_interval_index(db):
+        # The R*Tree rounds its bounds outwards, so it narrows down the
+        # entries to check rather than replacing the checks.
+        conditions.append(
+            u'id in (select id from entry_interval where %s)'
+            % u' and '.join(interval_conditions)
+        )
+    return u' and '.join(conditions) or u'1'
 
 
-def get_current_start_time(db):
+def get_overlapping_entries(db, start, end):
+    """Returns the id, sheet, start time, end time and description of the
+    entries of every sheet overlapping the period from ``start`` to
+    ``end``, in the order they started."""
+    return db.storage.get_overlapping_entries(start, end)
+
+
+def update_entry_meta(db, id, meta):
+    db.storage.update_entry_meta(id, meta)
+
+
+def rebuild_local_days(db):
+    """Recomputes the stored local day of each entry for the current
+    timezone; returns the number of entries whose day changed."""
     db.execute(u'''
-    select
-        entry.id,
-        entry.start_time
-    from
+    update
         entry
-    inner join
-        meta
-    on
-        meta.key = 'current_sheet' and
-        meta.value = entry.sheet
+    set
+        day = date(start_time, 'unixepoch', 'localtime')
     where
-        entry.end_time is null
+        day is not date(start_time, 'unixepoch', 'localtime')
     ''')
-    return db.fetchone()
+    count = db.cursor.rowcount
+    if count:
+        rebuild_daily_totals(db)
+    return count
 
 
-def get_entry_count(db, sheet):
-    db.execute(u'''
+# The totals of finished entries per sheet and day, as kept in
+# ``daily_totals``.
+DAILY_TOTALS_QUERY = u'''
     select
-        count(*)
+        sheet, day, sum(end_time - start_time), count(*)
     from
-        entry e
+        entry
     where
-        sheet = ?
-    ''', (sheet,))
-    return db.fetchone()[0]
+        end_time is not null
+    group by
+        sheet, day
+'''
 
 
-def get_most_recent_clockout(db, sheet):
+def rebuild_daily_totals(db):
+    db.execute(u'delete from daily_totals')
     db.execute(u'''
+    insert into daily_totals
+        (sheet, day, seconds, entry_count)
+    %s
+    ''' % DAILY_TOTALS_QUERY)
+
+
+def check_daily_totals(db):
+    """Returns the (sheet, day, stored, actual) of each day whose stored
+    (seconds, entry count) totals differ from those of its entries."""
+    db.execute(u'select sheet, day, seconds, entry_count from daily_totals')
+    stored = dict(((r[0], r[1]), (r[2], r[3])) for r in db.fetchall())
+    db.execute(DAILY_TOTALS_QUERY)
+    actual = dict(((r[0], r[1]), (r[2], r[3])) for r in db.fetchall())
+    return [
+        (key[0], key[1], stored.get(key), actual.get(key))
+        for key in sorted(set(stored) | set(actual))
+        if stored.get(key) != actual.get(key)
+    ]
+
+
+def get_running_entries(db):
+    """Returns the sheet, start time, local day and description of each
+    running entry."""
+    return [
+        (sheet, start_time,
+         time.strftime('%Y-%m-%d', time.localtime(start_time)), description)
+        for _, sheet, start_time, description
+        in db.storage.get_running_entries()
+    ]
+
+
+def get_sheet_totals(db):
+    """Returns the name, entry count and total length of the finished
+    entries of each sheet that has entries."""
+    return db.storage.get_sheet_totals()
+
+
+# The counters of each sheet, as kept in ``sheet``.
+SHEET_COUNTERS_QUERY = u'''
     select
-        id, start_time, end_time, description
+        sheet,
+        count(*),
+        ifnull(sum(end_time - start_time), 0),
+        max(case when end_time is null then id end)
     from
         entry
-    where
-        sheet = ?
-    order by
-        -end_time
-    ''', (sheet,))
-    return db.fetchone()
+    group by
+        sheet
+'''
 
 
-def update_entry_meta(db, id, meta):
-    existing_meta = get_entry_meta(db, id)
-    for key, value in meta.items():
-        if key in existing_meta.keys() and value != existing_meta[key]:
-            db.execute(u'''
-            update
-                entry_meta
-            set 
-                value = ?
-            where 
-                key = ?
-                and
-                entry_id = ?
-            ''', (
-                    value,
-                    key,
-                    id,
-                )
-            )
-        else:
-            db.execute(u'''
-            insert into
-                entry_meta
-                (key, value, entry_id)
-            values
-                (?, ?, ?)
-            ''', (
-                    key,
-                    value,
-                    id
-                )
-            )
+def rebuild_sheet_counters(db):
+    db.execute(u'insert or ignore into sheet (name) select sheet from entry')
+    db.execute(u'''
+    update sheet set entry_count = 0, seconds = 0, running_entry_id = null
+    ''')
+    for name, count, seconds, running in db.query(SHEET_COUNTERS_QUERY):
+        db.execute(u'''
+        update sheet set
+            entry_count = ?, seconds = ?, running_entry_id = ?
+        where
+            name = ?
+        ''', (count, seconds, running, name))
+
+
+def check_sheet_counters(db):
+    """Returns the (sheet, stored, actual) of each sheet whose stored
+    (entry count, seconds, running entry id) counters differ from those of
+    its entries."""
+    db.execute(u'''
+    select name, entry_count, seconds, running_entry_id from sheet
+    ''')
+    stored = dict((r[0], tuple(r[1:])) for r in db.fetchall())
+    db.execute(SHEET_COUNTERS_QUERY)
+    actual = dict((r[0], tuple(r[1:])) for r in db.fetchall())
+    return [
+        (name, stored.get(name, (0, 0, None)), actual.get(name, (0, 0, None)))
+        for name in sorted(set(stored) | set(actual))
+        if stored.get(name, (0, 0, None)) != actual.get(name, (0, 0, None))
+    ]
 
 
 def get_entry_meta(db, id):
-    meta = {}
-    db.execute(u'''
-    select
-        key, value
-    from 
-        entry_meta
-    where
-        entry_id = ?
-    order by
-        key
-    ''', (id, ))
-    for row in db.fetchall():
-        key = row[0]
-        value = row[1]
-        meta[key] = value
-    return meta
+    return db.storage.get_entry_meta(id)
 
 
 def date_is_vacation(db, year, month, day):
-    db.execute(u'''
-    select
-        count(*)
-    from
-        vacation
-    where year = ?
-    and month = ?
-    and day = ?
-    ''', (year, month, day,))
-    if db.fetchone()[0] > 0:
-        return True
-    return False
+    return db.storage.is_excluded_day('vacation', year, month, day)
 
 
 def date_is_holiday(db, year, month, day):
-    db.execute(u'''
-    select
-        count(*)
-    from
-        holidays
-    where year = ?
-    and month = ?
-    and day = ?
-    ''', (year, month, day,))
-    if db.fetchone()[0] > 0:
-        return True
-    return False
+    return db.storage.is_excluded_day('holidays', year, month, day)
 
 
 def date_is_unpaid(db, year, month, day):
-    db.execute(u'''
-    select
-        count(*)
-    from
-        unpaid
-    where year = ?
-    and month = ?
-    and day = ?
-    ''', (year, month, day,))
-    if db.fetchone()[0] > 0:
-        return True
-    return False
+    return db.storage.is_excluded_day('unpaid', year, month, day)
 
 
 def date_is_untracked(db, year, month, day):
@@ -374,6 +443,7 @@ CHILIPROJECT_LOOKUP = None
 def timesheet_row_factory(cursor, row):
     global CHILIPROJECT_LOOKUP
     if not CHILIPROJECT_LOOKUP:
+        from timebook.chiliproject import ChiliprojectConnector
         CHILIPROJECT_LOOKUP = ChiliprojectConnector()
     ts = TimesheetRow.from_row(row)
     ts.set_lookup_handler(CHILIPROJECT_LOOKUP)
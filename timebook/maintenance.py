@@ -0,0 +1,155 @@
+# maintenance.py
+#
+# Copyright (c) 2008-2009 Trevor Caira, 2011-2012 Adam Coddington
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Housekeeping of the timebook database, as run by ``t maintain``."""
+
+import sqlite3
+
+from timebook.storage import ENTRY_TABLES
+
+# ``pragma auto_vacuum`` value of databases which free pages on request.
+AUTO_VACUUM_INCREMENTAL = 2
+
+# Suffixes of the tables in which an R*Tree such as entry_interval keeps
+# its nodes.
+SHADOW_TABLE_SUFFIXES = ('_node', '_parent', '_rowid')
+
+
+def delete_orphans(db):
+    """Deletes the rows of entries which no longer exist; returns the
+    number deleted from each table, by table name."""
+    deleted = {}
+    for table in ENTRY_TABLES:
+        db.execute(u'''
+        delete from
+            %s
+        where
+            entry_id not in (select id from entry)
+        ''' % table)
+        deleted[table] = db.cursor.rowcount
+    return deleted
+
+
+def analyze(db):
+    db.execute(u'analyze')
+
+
+def vacuum(db):
+    """Returns the database's free pages to the file system; returns the
+    number of pages freed.
+
+    Databases are created without incremental vacuuming, so the first run
+    switches it on, which takes a full ``VACUUM``; later runs only release
+    the free pages.  Neither can be run inside a transaction.
+    """
+    before = get_page_count(db)
+    db.execute(u'pragma auto_vacuum')
+    if db.fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+        db.execute(u'pragma auto_vacuum = incremental')
+        db.execute(u'vacuum')
+    else:
+        db.execute(u'pragma incremental_vacuum')
+        # The pragma frees one page per step.
+        db.fetchall()
+    # Switching modes adds pages of its own, which may outnumber those freed.
+    return max(0, before - get_page_count(db))
+
+
+def check_integrity(db):
+    """Returns the problems found by SQLite's integrity check, if any."""
+    db.execute(u'pragma integrity_check')
+    problems = [row[0] for row in db.fetchall()]
+    if problems == [u'ok']:
+        return []
+    return problems
+
+
+def get_page_count(db):
+    db.execute(u'pragma page_count')
+    return db.fetchone()[0]
+
+
+def get_table_sizes(db):
+    """Returns the name, number of rows and number of pages, including
+    those of its indexes, of each table; the number of pages is None if
+    SQLite was built without the ``dbstat`` table.
+
+    The pages of the shadow tables of a virtual table are counted as its
+    own, and the shadow tables are not listed."""
+    db.execute(u'''
+    select
+        name,
+        sql like 'create virtual table%'
+    from
+        sqlite_master
+    where
+        type = 'table'
+        and name not like 'sqlite_%'
+    order by
+        name
+    ''')
+    rows = db.fetchall()
+    owners = {}
+    for name, virtual in rows:
+        if virtual:
+            for suffix in SHADOW_TABLE_SUFFIXES:
+                owners[name + suffix] = name
+    tables = [name for name, _ in rows if name not in owners]
+    try:
+        db.execute(u'''
+        select
+            sqlite_master.tbl_name, count(*)
+        from
+            dbstat
+        inner join
+            sqlite_master
+        on
+            sqlite_master.name = dbstat.name
+        group by
+            sqlite_master.tbl_name
+        ''')
+        pages = {}
+        for name, count in db.fetchall():
+            name = owners.get(name, name)
+            pages[name] = pages.get(name, 0) + count
+    except sqlite3.OperationalError:
+        pages = None
+    sizes = []
+    for table in tables:
+        db.execute(u'select count(*) from "%s"' % table)
+        sizes.append((
+            table,
+            db.fetchone()[0],
+            pages.get(table, 0) if pages is not None else None,
+        ))
+    return sizes
+
+
+def get_file_usage(db):
+    """Returns the page size, the number of pages and the number of free
+    pages of the database."""
+    usage = []
+    for pragma in ('page_size', 'page_count', 'freelist_count'):
+        db.execute(u'pragma %s' % pragma)
+        usage.append(db.fetchone()[0])
+    return tuple(usage)
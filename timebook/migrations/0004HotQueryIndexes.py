@@ -0,0 +1,33 @@
+from timebook.migrations import Migration
+
+
+class HotQueryIndexesMigration(Migration):
+    def run(self):
+        self.db.executescript(u'''
+        begin;
+        -- Keep only the most recently written of any duplicated rows so
+        -- that the unique indexes can be built.
+        delete from entry_meta where rowid not in (
+            select max(rowid) from entry_meta group by entry_id, key
+        );
+        delete from ticket_details where rowid not in (
+            select max(rowid) from ticket_details group by number
+        );
+        create index if not exists entry_sheet_start_time
+            on entry (sheet, start_time);
+        create index if not exists entry_sheet_end_time
+            on entry (sheet, end_time);
+        create unique index if not exists entry_meta_entry_id_key
+            on entry_meta (entry_id, key);
+        create unique index if not exists ticket_details_number
+            on ticket_details (number);
+        create index if not exists holidays_date
+            on holidays (year, month, day);
+        create index if not exists vacation_date
+            on vacation (year, month, day);
+        create index if not exists unpaid_date
+            on unpaid (year, month, day);
+        -- Covered by entry_sheet_start_time.
+        drop index if exists entry_sheet;
+        commit;
+        ''')
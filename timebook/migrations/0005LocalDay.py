@@ -0,0 +1,31 @@
+from timebook.migrations import Migration
+
+
+class LocalDayMigration(Migration):
+    def run(self):
+        self.db.execute(u'pragma table_info(entry)')
+        if 'day' not in [column[1] for column in self.db.fetchall()]:
+            # The day an entry starts on in local time, which reports
+            # group entries by; "t rebuild-days" recomputes it if the
+            # timezone changes.
+            self.db.execute(u'alter table entry add column day varchar(10)')
+        self.db.executescript(u'''
+        begin;
+        update entry set day = date(start_time, 'unixepoch', 'localtime');
+        create index if not exists entry_sheet_day on entry (sheet, day);
+        create trigger if not exists entry_day_insert
+        after insert on entry
+        begin
+            update entry
+            set day = date(new.start_time, 'unixepoch', 'localtime')
+            where id = new.id;
+        end;
+        create trigger if not exists entry_day_update
+        after update of start_time on entry
+        begin
+            update entry
+            set day = date(new.start_time, 'unixepoch', 'localtime')
+            where id = new.id;
+        end;
+        commit;
+        ''')
@@ -0,0 +1,108 @@
+from timebook import dbutil
+from timebook.migrations import Migration
+
+
+def add_to_totals(day):
+    """Returns the statements adding a finished ``new`` entry starting on
+    ``day`` to ``daily_totals``: one upsert, or, with SQLite too old for
+    upserts, an insert of the day's row followed by an update."""
+    if dbutil.has_upsert():
+        return u'''
+            insert into daily_totals (sheet, day, seconds, entry_count)
+            select
+                new.sheet,
+                %(day)s,
+                new.end_time - new.start_time,
+                1
+            where new.end_time is not null
+            on conflict (sheet, day) do update set
+                seconds = seconds + excluded.seconds,
+                entry_count = entry_count + 1;
+        ''' % {'day': day}
+    return u'''
+            insert or ignore into daily_totals (sheet, day)
+            select new.sheet, %(day)s
+            where new.end_time is not null;
+            update daily_totals set
+                seconds = seconds + (new.end_time - new.start_time),
+                entry_count = entry_count + 1
+            where
+                new.end_time is not null
+                and sheet = new.sheet
+                and day = %(day)s;
+        ''' % {'day': day}
+
+
+class DailyTotalsMigration(Migration):
+    def run(self):
+        # daily_totals holds the number and total length of the finished
+        # entries of each sheet starting on each local day; running entries
+        # are left out, since their length changes until they end.
+        #
+        # The triggers replace those of 0005LocalDay so that an entry's day
+        # is stored before it is added to the totals.
+        self.db.executescript(u'''
+        begin;
+        create table if not exists daily_totals (
+            sheet varchar(32) not null,
+            day varchar(10) not null,
+            seconds integer not null default 0,
+            entry_count integer not null default 0,
+            primary key (sheet, day)
+        );
+        drop trigger if exists entry_day_insert;
+        drop trigger if exists entry_day_update;
+        create trigger if not exists entry_insert
+        after insert on entry
+        begin
+            update entry
+            set day = date(new.start_time, 'unixepoch', 'localtime')
+            where id = new.id;
+            %(add_inserted)s
+        end;
+        create trigger if not exists entry_update
+        after update of sheet, start_time, end_time on entry
+        begin
+            update entry
+            set day = date(new.start_time, 'unixepoch', 'localtime')
+            where id = new.id and new.start_time is not old.start_time;
+            update daily_totals set
+                seconds = seconds - (old.end_time - old.start_time),
+                entry_count = entry_count - 1
+            where
+                old.end_time is not null
+                and sheet = old.sheet
+                and day = old.day;
+            delete from daily_totals
+            where sheet = old.sheet and day = old.day and entry_count = 0;
+            %(add_updated)s
+        end;
+        create trigger if not exists entry_delete
+        after delete on entry
+        begin
+            update daily_totals set
+                seconds = seconds - (old.end_time - old.start_time),
+                entry_count = entry_count - 1
+            where
+                old.end_time is not null
+                and sheet = old.sheet
+                and day = old.day;
+            delete from daily_totals
+            where sheet = old.sheet and day = old.day and entry_count = 0;
+        end;
+        delete from daily_totals;
+        insert into daily_totals (sheet, day, seconds, entry_count)
+        select sheet, day, sum(end_time - start_time), count(*)
+        from entry
+        where end_time is not null
+        group by sheet, day;
+        commit;
+        ''' % {
+            'add_inserted': add_to_totals(
+                u"date(new.start_time, 'unixepoch', 'localtime')"
+            ),
+            # The day stored by the statement before.
+            'add_updated': add_to_totals(
+                u'(select day from entry where id = new.id)'
+            ),
+        })
@@ -0,0 +1,79 @@
+from timebook.migrations import Migration
+
+
+class SheetsMigration(Migration):
+    def run(self):
+        # Each sheet that has ever held an entry gets a row in ``sheet``,
+        # which keeps its number of entries, the total length of its
+        # finished entries and its running entry up to date, so that
+        # listing sheets does not mean scanning every entry.  Entries are
+        # still looked up by sheet name, through entry_sheet_start_time, so
+        # they do not refer to their sheet by id.
+        self.db.executescript(u'''
+        begin;
+        create table if not exists sheet (
+            id integer primary key not null,
+            name varchar(32) not null unique,
+            entry_count integer not null default 0,
+            seconds integer not null default 0,
+            running_entry_id integer references entry (id)
+        );
+        create trigger if not exists sheet_entry_insert
+        after insert on entry
+        begin
+            insert or ignore into sheet (name) values (new.sheet);
+            update sheet set
+                entry_count = entry_count + 1,
+                seconds = seconds
+                    + ifnull(new.end_time - new.start_time, 0),
+                running_entry_id = case
+                    when new.end_time is null then new.id
+                    else running_entry_id
+                end
+            where name = new.sheet;
+        end;
+        create trigger if not exists sheet_entry_update
+        after update of sheet, start_time, end_time on entry
+        begin
+            update sheet set
+                entry_count = entry_count - 1,
+                seconds = seconds
+                    - ifnull(old.end_time - old.start_time, 0),
+                running_entry_id = nullif(running_entry_id, old.id)
+            where name = old.sheet;
+            insert or ignore into sheet (name) values (new.sheet);
+            update sheet set
+                entry_count = entry_count + 1,
+                seconds = seconds
+                    + ifnull(new.end_time - new.start_time, 0),
+                running_entry_id = case
+                    when new.end_time is null then new.id
+                    else running_entry_id
+                end
+            where name = new.sheet;
+        end;
+        create trigger if not exists sheet_entry_delete
+        after delete on entry
+        begin
+            update sheet set
+                entry_count = entry_count - 1,
+                seconds = seconds
+                    - ifnull(old.end_time - old.start_time, 0),
+                running_entry_id = nullif(running_entry_id, old.id)
+            where name = old.sheet;
+        end;
+        insert or ignore into sheet (name) select distinct sheet from entry;
+        update sheet set
+            entry_count = (
+                select count(*) from entry where entry.sheet = sheet.name
+            ),
+            seconds = (
+                select ifnull(sum(end_time - start_time), 0) from entry
+                where entry.sheet = sheet.name and end_time is not null
+            ),
+            running_entry_id = (
+                select max(id) from entry
+                where entry.sheet = sheet.name and end_time is null
+            );
+        commit;
+        ''')
@@ -0,0 +1,64 @@
+from timebook import logger
+from timebook.migrations import Migration
+
+# The running entries which are not their sheet's newest.
+EXTRA_RUNNING_ENTRIES = u'''
+    end_time is null
+    and id != (
+        select max(id) from entry newest
+        where newest.sheet = entry.sheet and newest.end_time is null
+    )
+'''
+
+
+class OneRunningEntryMigration(Migration):
+    def run(self):
+        # A sheet's running entry is looked up through
+        # sheet.running_entry_id, which only has room for one; refuse to
+        # start a second rather than lose track of it.  Sheets that already
+        # have several running entries keep only the newest, the one looked
+        # up, running: the others end when the next entry of their sheet
+        # starts, or, if none starts after them, when they started.
+        self.db.execute(
+            u'select count(*) from entry where %s' % EXTRA_RUNNING_ENTRIES
+        )
+        count = self.db.fetchone()[0]
+        if count:
+            logger.warning(
+                "Ending %s entries left running alongside a newer entry "
+                "of the same timesheet." % count
+            )
+        self.db.executescript(u'''
+        begin;
+        update entry set end_time = coalesce((
+            select min(later.start_time) from entry later
+            where
+                later.sheet = entry.sheet
+                and later.start_time > entry.start_time
+        ), start_time)
+        where %s;
+        create trigger if not exists entry_running_insert
+        before insert on entry
+        when new.end_time is null
+        begin
+            select raise(abort, 'timesheet already active')
+            where exists (
+                select 1 from entry
+                where sheet = new.sheet and end_time is null
+            );
+        end;
+        create trigger if not exists entry_running_update
+        before update of sheet, end_time on entry
+        when new.end_time is null
+        begin
+            select raise(abort, 'timesheet already active')
+            where exists (
+                select 1 from entry
+                where
+                    sheet = new.sheet
+                    and end_time is null
+                    and id != new.id
+            );
+        end;
+        commit;
+        ''' % EXTRA_RUNNING_ENTRIES)
@@ -0,0 +1,61 @@
+import sqlite3
+
+from timebook import logger
+from timebook.migrations import Migration
+
+
+class EntryIntervalsMigration(Migration):
+    def run(self):
+        # entry_interval is an R*Tree over the period each entry covers, so
+        # that finding the entries running at a time or overlapping a period
+        # is a lookup rather than a scan of every entry started before it.
+        # Running entries are stored as lasting until the end of 9999.
+        #
+        # R*Trees are an optional part of SQLite; without one, queries for
+        # periods filter the entry table alone.
+        try:
+            self.db.execute(u'''
+            create virtual table if not exists entry_interval
+            using rtree (id, start_time, end_time)
+            ''')
+        except sqlite3.OperationalError as e:
+            logger.debug("Unable to create entry_interval: %s" % e)
+            return
+        self.db.executescript(u'''
+        begin;
+        create trigger if not exists entry_interval_insert
+        after insert on entry
+        begin
+            insert into entry_interval (id, start_time, end_time)
+            values (
+                new.id,
+                new.start_time,
+                max(new.start_time, ifnull(new.end_time, 253402300799))
+            );
+        end;
+        create trigger if not exists entry_interval_update
+        after update of id, start_time, end_time on entry
+        begin
+            delete from entry_interval where id = old.id;
+            insert into entry_interval (id, start_time, end_time)
+            values (
+                new.id,
+                new.start_time,
+                max(new.start_time, ifnull(new.end_time, 253402300799))
+            );
+        end;
+        create trigger if not exists entry_interval_delete
+        after delete on entry
+        begin
+            delete from entry_interval where id = old.id;
+        end;
+        delete from entry_interval;
+        insert into entry_interval (id, start_time, end_time)
+        select
+            id,
+            start_time,
+            max(start_time, ifnull(end_time, 253402300799))
+        from
+            entry;
+        commit;
+        ''')
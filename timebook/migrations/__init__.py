@@ -1,7 +1,21 @@
-import imp
-import inspect
-import os.path
-import re
+import importlib
+
+# Every migration module, in order, with the schema version it upgrades
+# the database to.  Listing them here lets ``MigrationManager.upgrade``
+# compare ``db_version`` against ``LATEST_VERSION`` without scanning or
+# importing anything; new migrations must be appended to this manifest.
+MIGRATIONS = (
+    (1, '0001InitialMigration'),
+    (2, '0002TicketMetadata'),
+    (3, '0003AddHourAdjustments'),
+    (4, '0004HotQueryIndexes'),
+    (5, '0005LocalDay'),
+    (6, '0006DailyTotals'),
+    (7, '0007Sheets'),
+    (8, '0008OneRunningEntry'),
+    (9, '0009EntryIntervals'),
+)
+LATEST_VERSION = MIGRATIONS[-1][0]
 
 
 class MigrationManager(object):
@@ -13,17 +27,12 @@ class MigrationManager(object):
             return True
         return False
 
-    def _get_migration_classes(self, migration_number, mod_path):
+    def _get_migration_classes(self, mod_name):
+        import inspect
         migrations = []
 
-        mod = imp.load_source(
-                'timebook.migrations.migration%s' % migration_number,
-                os.path.join(
-                    os.path.dirname(
-                        __file__
-                    ),
-                    mod_path,
-                )
+        mod = importlib.import_module(
+                'timebook.migrations.%s' % mod_name
             )
         members = inspect.getmembers(mod)
         for name, member in members:
@@ -35,34 +44,20 @@ class MigrationManager(object):
                 migrations.append(member)
         return migrations
 
-    def _find_migration_modules(self):
+    def _find_migration_modules(self, after=0):
         migration_modules = []
-        for mod_path in os.listdir(os.path.dirname(
-                __file__
-            )):
-            migration_details = re.match(r'^(\d+)(\D*)\.py$', mod_path)
-            if migration_details:
-                try:
-                    number = int(migration_details.groups()[0])
-                    name = migration_details.groups()[1]
-                    migrations = self._get_migration_classes(
-                                            number,
-                                            mod_path
-                            )
-                    if migrations:
-                        migration_modules.append(
-                                    {
-                                        'name': name,
-                                        'number': number,
-                                        'migrations': migrations
-                                    }
-                                )
-                except ValueError:
-                    pass
-        migration_modules = sorted(
-                migration_modules,
-                key=lambda k: k['number']
-            )
+        for number, mod_name in MIGRATIONS:
+            if number <= after:
+                continue
+            migrations = self._get_migration_classes(mod_name)
+            if migrations:
+                migration_modules.append(
+                            {
+                                'name': mod_name.lstrip('0123456789'),
+                                'number': number,
+                                'migrations': migrations
+                            }
+                        )
         return migration_modules
 
     def _apply_migration(self, module):
@@ -78,7 +73,10 @@ class MigrationManager(object):
         ''', (module['number'], ))
 
     def upgrade(self):
-        modules = self._find_migration_modules()
+        current_version = self.db.db_version
+        if current_version >= LATEST_VERSION:
+            return
+        modules = self._find_migration_modules(after=current_version)
         for module in modules:
             if self._is_unapplied(module):
                 self._apply_migration(module)
@@ -22,7 +22,7 @@ from datetime import datetime, timedelta
 import logging
 import time
 
-from timebook import payperiodtypes
+from timebook import dbutil, payperiodtypes
 
 
 logger = logging.getLogger(__name__)
@@ -103,63 +103,39 @@ class PayPeriodUtil(object):
         return outgoing
 
     def get_adjustments(self, min_date, max_date):
-        self.db.execute("""
-            SELECT SUM(adjustment) AS adjustment_sum
-            FROM adjustments
-            WHERE timestamp >= ? and timestamp < ?
-            ;
-        """, (
+        return self.db.storage.get_adjustment_total(
             time.mktime(min_date.timetuple()),
             time.mktime(max_date.timetuple()),
-        ))
-        value = self.db.fetchone()[0]
-        return value if value else 0
+        )
 
     def is_unpaid(self, date_to_check):
         dx = date_to_check
-        self.db.execute("""
-            SELECT * FROM unpaid
-            WHERE year = ? AND month = ? AND day = ?
-            """, (dx.year, dx.month, dx.day,))
-        if(self.db.fetchone()):
-            return True
-        else:
-            return False
+        return dbutil.date_is_unpaid(self.db, dx.year, dx.month, dx.day)
 
     def is_vacation(self, date_to_check):
         dx = date_to_check
-        self.db.execute("""
-            SELECT * FROM vacation
-            WHERE year = ? AND month = ? AND day = ?
-            """, (dx.year, dx.month, dx.day,))
-        if(self.db.fetchone()):
-            return True
-        else:
-            return False
+        return dbutil.date_is_vacation(self.db, dx.year, dx.month, dx.day)
 
     def is_holiday(self, date_to_check):
         dx = date_to_check
-        self.db.execute("""
-            SELECT * FROM holidays
-            WHERE year = ? AND month = ? AND day = ?
-            """, (dx.year, dx.month, dx.day,))
-        if(self.db.fetchone()):
-            return True
-        else:
-            return False
+        return dbutil.date_is_holiday(self.db, dx.year, dx.month, dx.day)
 
     def count_hours_for_day(self, begin_time):
         self.db.execute("""
-            SELECT SUM(
-                COALESCE(end_time, STRFTIME('%s', 'now'))
-                - start_time)
-            FROM entry
-            WHERE
-                start_time >= STRFTIME('%s', ?, 'utc')
-                AND
-                start_time <= STRFTIME('%s', ?, 'utc', '1 day')
-                AND
-                sheet = 'default'
+            SELECT
+                COALESCE((
+                    SELECT seconds
+                    FROM daily_totals
+                    WHERE sheet = 'default' AND day = ?
+                ), 0)
+                + COALESCE((
+                    SELECT SUM(STRFTIME('%s', 'now') - start_time)
+                    FROM entry
+                    WHERE
+                        sheet = 'default'
+                        AND end_time is null
+                        AND day = ?
+                ), 0)
             """, (
                 begin_time.strftime("%Y-%m-%d"),
                 begin_time.strftime("%Y-%m-%d"),
@@ -172,24 +148,28 @@ class PayPeriodUtil(object):
         return total_hours
 
     def count_hours_after(self, begin_time, end_time):
+        # Entries are found through entry_interval, and only their time
+        # between begin_time and end_time is counted; running entries last
+        # until now.
+        begin_timestamp = time.mktime(begin_time.timetuple())
+        end_timestamp = time.mktime(end_time.timetuple())
         self.db.execute("""
-            SELECT SUM(
-                COALESCE(end_time, STRFTIME('%s', 'now'))
-                - start_time)
+            SELECT
+                COALESCE(SUM(
+                    MIN(IFNULL(end_time, %d), %d) - MAX(start_time, %d)
+                ), 0)
             FROM entry
             WHERE
-                start_time >= STRFTIME('%s', ?, 'utc')
-                AND
-                (
-                    end_time <= STRFTIME('%s', ?, 'utc', '1 day')
-                    OR
-                    end_time is null
-                )
-                AND sheet = 'default'
-            """, (
-                begin_time.strftime("%Y-%m-%d"),
-                end_time.strftime("%Y-%m-%d")
-                ))
+                sheet = 'default'
+                AND %s
+            """ % (
+                time.time(),
+                end_timestamp,
+                begin_timestamp,
+                dbutil.get_interval_condition(
+                    self.db, begin_timestamp, end_timestamp
+                ),
+            ))
         result = self.db.fetchone()
         if(result[0]):
             total_hours = float(result[0]) / 60 / 60
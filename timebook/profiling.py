@@ -0,0 +1,124 @@
+# profiling.py
+#
+# Copyright (c) 2008-2009 Trevor Caira, 2011-2012 Adam Coddington
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Wall-clock timing of the phases of a ``t`` invocation.
+
+Timing is off unless ``enable`` has been called, in which case each
+``phase`` block adds its duration to the total for its name, and blocks
+run within ``profiled`` are also profiled with cProfile if a dump was
+asked for.  Phases do not nest: a ``phase`` block within another, as when
+one command runs another, is timed as part of the outer one, so that the
+phases add up to no more than the total.
+"""
+
+from contextlib import contextmanager
+import time
+
+enabled = False
+started = None
+timings = {}
+profiler = None
+# Name of the ``phase`` block being timed, if any.
+current_phase = None
+# Nesting depth of ``profiled`` blocks; commands can run other commands.
+profiled_depth = 0
+
+
+def enable(profile=False):
+    global enabled, started, profiler, current_phase
+    enabled = True
+    current_phase = None
+    started = time.time()
+    timings.clear()
+    if profile:
+        import cProfile
+        profiler = cProfile.Profile()
+
+
+def disable():
+    global enabled, profiler, current_phase
+    enabled = False
+    profiler = None
+    current_phase = None
+    timings.clear()
+
+
+@contextmanager
+def phase(name):
+    global current_phase
+    if not enabled or current_phase is not None:
+        yield
+        return
+    current_phase = name
+    start = time.time()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.time() - start
+        current_phase = None
+
+
+@contextmanager
+def profiled():
+    global profiled_depth
+    if profiler is None or profiled_depth:
+        yield
+        return
+    profiled_depth += 1
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiled_depth -= 1
+
+
+def get_report(argv):
+    phases = dict(timings)
+    return {
+        'argv': argv,
+        'phases': phases,
+        'total': time.time() - started,
+    }
+
+
+def print_report(report, stream):
+    print >> stream, 'phase            ms'
+    for name, seconds in sorted(
+        report['phases'].items(), key=lambda item: -item[1]
+    ):
+        print >> stream, '%-10s %8.2f' % (name, seconds * 1000)
+    print >> stream, '%-10s %8.2f' % (
+        'other', (report['total'] - sum(report['phases'].values())) * 1000
+    )
+    print >> stream, '%-10s %8.2f' % ('total', report['total'] * 1000)
+
+
+def write_report(report, path):
+    import json
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def dump_profile(path):
+    profiler.dump_stats(path)
@@ -0,0 +1,189 @@
+# registry.py
+#
+# Copyright (c) 2008-2009 Trevor Caira, 2011-2012 Adam Coddington
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Static table of the available commands.
+
+The description, aliases and ``locking``/``read_only`` flags of each
+command are recorded here so that commands can be listed and resolved
+without importing their implementation; ``CommandInfo.load`` imports it
+only when the command is run.  Entries must agree with the ``@command``
+decorator on the implementation (see ``tests/test_registry.py``).
+"""
+
+import importlib
+
+from timebook import cmdutil, exceptions
+
+commands = {}
+cmd_aliases = {}
+
+
+class CommandInfo(object):
+    def __init__(self, name, description, module='timebook.commands',
+                 aliases=(), locking=True, read_only=False,
+                 interactive=False, options=(), custom_ticket_meta=False,
+                 query_only=False, own_transaction=False,
+                 refreshes_index=False):
+        self.name = name
+        self.description = description
+        self.module = module
+        self.aliases = aliases
+        # Options accepted by the command, for shell completion; commands
+        # with ``custom_ticket_meta`` also accept an option for each custom
+        # ticket metadata attribute.
+        self.options = options
+        self.custom_ticket_meta = custom_ticket_meta
+        self.locking = locking
+        self.read_only = read_only
+        # Commands which never write to the database open it read-only.
+        self.query_only = query_only
+        # Interactive commands use the terminal and are never forwarded
+        # to the daemon.
+        self.interactive = interactive
+        # Commands which begin and commit their own transactions, or run
+        # statements that cannot run within one, and so cannot be run in a
+        # batch.
+        self.own_transaction = own_transaction
+        # The completion index is only checked after commands which switch
+        # to another timesheet or have this flag: those which can remove
+        # timesheets, and ``list``, which the completion script runs to
+        # build a missing or outdated index.
+        self.refreshes_index = refreshes_index
+
+    def load(self):
+        importlib.import_module(self.module)
+        from timebook.commands import commands as implementations
+        return implementations[self.name]
+
+
+def register(name, description, **kwargs):
+    info = CommandInfo(name, description, **kwargs)
+    commands[name] = info
+    for alias in info.aliases:
+        cmd_aliases[alias] = name
+    return info
+
+
+def get_command_by_user_configured_alias(config, cmd):
+    alias = config.get_alias(cmd)
+    if alias is None:
+        return
+    if alias in commands.keys():
+        return alias
+    else:
+        raise exceptions.CommandError("The alias '%s' is mapped to a function that does not exist." % cmd)
+
+
+def get_command_by_name(config, cmd):
+    func = get_command_by_user_configured_alias(config, cmd)
+    if func:
+        return func
+    func = cmd_aliases.get(cmd, None)
+    if func:
+        return func
+    return cmdutil.complete(commands, cmd, 'command')
+
+
+def get_command_options(config, name):
+    info = commands[name]
+    options = list(info.options)
+    if info.custom_ticket_meta:
+        options.extend(
+            '--%s' % key for key, _ in config.get_custom_ticket_meta()
+        )
+    return options
+
+
+IN_OPTIONS = ('-s', '--switch', '-o', '--out', '-a', '--at', '-t',
+              '--ticket', '--billable', '--non-billable')
+
+register('alter', 'alter the description of the active period',
+         aliases=('write',), custom_ticket_meta=True,
+         options=('-t', '--ticket', '--billable', '--non-billable', '--id'))
+register('archive', 'move the entries of past years into archive files',
+         locking=False, own_transaction=True, refreshes_index=True,
+         options=('-b', '--before'))
+register('at', 'show the entries running at a time', locking=False,
+         read_only=True, query_only=True)
+register('backdate', 'create a new timebook entry and backdate it')
+register('backend', "open the backend's interactive shell",
+         aliases=('shell',), locking=False, interactive=True)
+register('backup', 'copy the timebook database into the backup directory',
+         locking=False, read_only=True, own_transaction=True,
+         options=('-d', '--directory', '-k', '--keep', '-z', '--compress',
+                  '-l', '--list'))
+register('batch', 'run many commands read from standard input',
+         module='timebook.batch', locking=False, interactive=True,
+         options=('-n', '--transaction-size', '-k', '--keep-going'))
+register('change', 'start a new task on the current timesheet',
+         options=IN_OPTIONS, custom_ticket_meta=True)
+register('daemon', 'serve commands from a resident process',
+         module='timebook.daemon', locking=False, read_only=True,
+         interactive=True, options=('--socket', ))
+register('details', 'get ticket details', locking=False, read_only=True,
+         query_only=True)
+register('display', 'display timesheet, by default the current one',
+         aliases=('export', 'format', 'show'), locking=False, read_only=True,
+         query_only=True,
+         options=('-s', '--start', '-e', '--end', '-f', '--format', '-i',
+                  '--show-ids', '--summary', '-m', '--month'))
+register('hours', 'provides hours information for the current pay period',
+         aliases=('payperiod', 'pay', 'period', 'offset', ), locking=False,
+         read_only=True, query_only=True,
+         options=('--param', '--payperiod-type'))
+register('in', 'start the timer for the current timesheet',
+         aliases=('start',), options=IN_OPTIONS, custom_ticket_meta=True)
+register('insert', 'insert a new timesheet entry at a specified time')
+register('kill', 'delete a timesheet', aliases=('delete',),
+         interactive=True, refreshes_index=True)
+register('list', 'show the available timesheets', aliases=('ls',),
+         locking=False, read_only=True, query_only=True,
+         refreshes_index=True, options=('-s', '--simple'))
+register('maintain', 'tidy up and check the timebook database',
+         locking=False, own_transaction=True, options=('--cron', ))
+register('modify', 'change details about a specific entry in the timesheet',
+         interactive=True)
+register('now', 'show the status of the current timesheet',
+         aliases=('info',), locking=False, read_only=True, query_only=True,
+         options=('-s', '--simple', '--from-snapshot'))
+register('out', 'stop the timer for the current timesheet',
+         aliases=('stop',), options=('-v', '--verbose', '-a', '--at', '--all'))
+register('overlapping', 'show the entries overlapping a period',
+         locking=False, read_only=True, query_only=True)
+register('post', 'post timesheet hours to timesheet online', locking=False,
+         interactive=True, options=('--date', ))
+register('rebuild-days', 'recompute the local day of every entry')
+register('rebuild-totals',
+         'check or rebuild the stored totals of each timesheet',
+         options=('-c', '--check'))
+register('restore', 'replace the timebook database with a backup',
+         locking=False, interactive=True, own_transaction=True,
+         refreshes_index=True)
+register('running', 'show all running timesheets', aliases=('active',),
+         locking=False, read_only=True, query_only=True)
+register('stats', 'get timesheet statistics', locking=False, read_only=True,
+         query_only=True, options=('-s', '--start', '-e', '--end'))
+register('switch', 'switch to a new timesheet', read_only=True,
+         options=('-v', '--verbose'))
+register('taskwarrior', 'monitors for taskwarrior changes',
+         aliases=('watch_tasks', 'task'), locking=False, interactive=True)
@@ -0,0 +1,152 @@
+# snapshot.py
+#
+# Copyright (c) 2008-2009 Trevor Caira, 2011-2012 Adam Coddington
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Status snapshot of the current timesheet.
+
+The snapshot is a file of shell variable assignments kept next to the
+timebook database, so that prompts and status bars can ``source`` it
+rather than run ``t now``::
+
+    TIMEBOOK_SHEET='default'
+    TIMEBOOK_ENTRY_ID='42'
+    TIMEBOOK_START='1366206000'
+    TIMEBOOK_DESCRIPTION='document timebook'
+    TIMEBOOK_META='billable: yes'
+    TIMEBOOK_STATUS='document timebook; billable: yes'
+
+``TIMEBOOK_START`` is a unix timestamp, so the elapsed time is
+``$(( $(date +%s) - TIMEBOOK_START ))``.  The entry variables are empty
+when the current timesheet is not running.
+"""
+
+from datetime import timedelta
+import os
+import shlex
+import time
+
+from timebook import dbutil, exceptions, registry
+
+FIELDS = (
+    'TIMEBOOK_SHEET',
+    'TIMEBOOK_ENTRY_ID',
+    'TIMEBOOK_START',
+    'TIMEBOOK_DESCRIPTION',
+    'TIMEBOOK_META',
+    'TIMEBOOK_STATUS',
+)
+
+
+def get_snapshot_path(db_path):
+    if db_path == ':memory:':
+        return None
+    return os.path.splitext(db_path)[0] + '.status'
+
+
+def shell_quote(value):
+    if value is None:
+        value = u''
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return "'%s'" % str(value).replace("'", "'\\''")
+
+
+def get_snapshot(db):
+    sheet = dbutil.get_current_sheet(db)
+    snapshot = dict.fromkeys(FIELDS, u'')
+    snapshot['TIMEBOOK_SHEET'] = sheet
+    running = dbutil.get_current_start_time(db)
+    if running is not None:
+        entry_id, start_time = running
+        meta = dbutil.get_entry_meta(db, entry_id)
+        snapshot.update({
+            'TIMEBOOK_ENTRY_ID': entry_id,
+            'TIMEBOOK_START': start_time,
+            'TIMEBOOK_DESCRIPTION': dbutil.get_active_info(db, sheet)[1],
+            'TIMEBOOK_META': ', '.join(
+                '%s: %s' % (k, v) for k, v in meta.items()
+            ),
+            'TIMEBOOK_STATUS': dbutil.get_status_string(db, sheet),
+        })
+    return snapshot
+
+
+def write_snapshot(db):
+    path = get_snapshot_path(db.path)
+    if path is None:
+        return
+    snapshot = get_snapshot(db)
+    content = ''.join(
+        '%s=%s\n' % (field, shell_quote(snapshot[field]))
+        for field in FIELDS
+    )
+    # Write alongside and rename over the old snapshot so that readers
+    # never see a partially-written file.
+    temp_path = '%s.%s.tmp' % (path, os.getpid())
+    f = open(temp_path, 'w')
+    try:
+        f.write(content)
+    finally:
+        f.close()
+    os.rename(temp_path, path)
+
+
+def read_snapshot(path):
+    """Returns the snapshot at ``path``, or None if there is none."""
+    if path is None or not os.path.exists(path):
+        return None
+    f = open(path)
+    try:
+        content = f.read()
+    finally:
+        f.close()
+    snapshot = {}
+    for assignment in shlex.split(content):
+        key, _, value = assignment.partition('=')
+        snapshot[key] = value.decode('utf-8')
+    return snapshot
+
+
+def format_status(snapshot):
+    """Formats a snapshot the way ``t now`` describes the current sheet."""
+    sheet = snapshot['TIMEBOOK_SHEET']
+    if not snapshot['TIMEBOOK_START']:
+        return u'%s: (inactive)' % sheet
+    if not snapshot['TIMEBOOK_STATUS']:
+        return u'%s: (active)' % sheet
+    duration = timedelta(
+        seconds=int(time.time()) - int(snapshot['TIMEBOOK_START'])
+    )
+    return u'%s: %s (%s)' % (sheet, duration, snapshot['TIMEBOOK_STATUS'])
+
+
+def is_snapshot_request(config, args):
+    """Whether ``args`` is a ``t now --from-snapshot`` for the current sheet,
+    which can be answered without opening the database."""
+    if '--from-snapshot' not in args[1:]:
+        return False
+    if [arg for arg in args[1:] if not arg.startswith('-')]:
+        return False
+    try:
+        return registry.get_command_by_name(config, args[0]) == 'now'
+    except (ValueError, exceptions.CommandError):
+        return False
@@ -0,0 +1,196 @@
+# sqltrace.py
+#
+# Copyright (c) 2008-2009 Trevor Caira, 2011-2012 Adam Coddington
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""Opt-in tracing of the SQL statements run through a ``Database``.
+
+A ``QueryTracer`` stands in for the database's cursor methods, recording
+each statement with its parameters, the time spent executing it and
+fetching its results, and the number of rows fetched or changed.
+"""
+
+from collections import Counter
+import re
+import time
+
+WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(sql):
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+class TracedQuery(object):
+    def __init__(self, sql, params):
+        self.sql = normalize(sql)
+        self.params = params
+        self.duration = 0.0
+        self.rows = 0
+
+    def __repr__(self):
+        return '<TracedQuery %r %r>' % (self.sql, self.params)
+
+
+class TracedCursor(object):
+    """A cursor of its own for one statement, as returned by
+    ``Database.query``, which is logged once all its rows are read."""
+    def __init__(self, tracer, cursor, query):
+        self.tracer = tracer
+        self.cursor = cursor
+        self.query = query
+
+    def __iter__(self):
+        return self
+
+    def _fetch(self, method):
+        start = time.time()
+        result = method()
+        self.query.duration += time.time() - start
+        return result
+
+    def next(self):
+        row = self._fetch(self.cursor.fetchone)
+        if row is None:
+            self.tracer.log(self.query)
+            raise StopIteration
+        self.query.rows += 1
+        return row
+
+    def fetchone(self):
+        try:
+            return self.next()
+        except StopIteration:
+            return None
+
+    def fetchall(self):
+        rows = self._fetch(self.cursor.fetchall)
+        self.query.rows += len(rows)
+        self.tracer.log(self.query)
+        return rows
+
+
+class QueryTracer(object):
+    """Wraps ``cursor``, logging each statement to ``stream`` once its
+    results have been fetched, if a stream is given."""
+    def __init__(self, cursor, stream=None):
+        self.cursor = cursor
+        self.stream = stream
+        self.queries = []
+        self.current = None
+        # Statements run by ``query`` and not yet logged.
+        self.pending = []
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    def reset(self):
+        self.finish()
+        del self.queries[:]
+
+    def log(self, query):
+        if query in self.pending:
+            self.pending.remove(query)
+        if self.stream is not None:
+            print >> self.stream, 'sql: %.2fms %s row%s: %s %r' % (
+                query.duration * 1000,
+                query.rows,
+                '' if query.rows == 1 else 's',
+                query.sql,
+                query.params,
+            )
+
+    def finish(self):
+        if self.current is not None:
+            self.log(self.current)
+        self.current = None
+
+    def query(self, cursor, sql, params=()):
+        query = TracedQuery(sql, params)
+        self.queries.append(query)
+        self.pending.append(query)
+        start = time.time()
+        try:
+            cursor.execute(sql, params)
+        finally:
+            query.duration += time.time() - start
+        return TracedCursor(self, cursor, query)
+
+    def _run(self, method, sql, *args):
+        self.finish()
+        self.current = TracedQuery(sql, args[0] if args else ())
+        self.queries.append(self.current)
+        start = time.time()
+        try:
+            return method(sql, *args)
+        finally:
+            self.current.duration += time.time() - start
+            if self.cursor.rowcount > 0:
+                self.current.rows = self.cursor.rowcount
+
+    def execute(self, sql, *args):
+        return self._run(self.cursor.execute, sql, *args)
+
+    def executemany(self, sql, seq_of_params):
+        # Record every row of parameters, which may come from a generator.
+        return self._run(self.cursor.executemany, sql, list(seq_of_params))
+
+    def executescript(self, sql):
+        return self._run(self.cursor.executescript, sql)
+
+    def _fetch(self, method):
+        start = time.time()
+        result = method()
+        if self.current is not None:
+            self.current.duration += time.time() - start
+            if isinstance(result, list):
+                self.current.rows += len(result)
+            elif result is not None:
+                self.current.rows += 1
+        return result
+
+    def fetchone(self):
+        return self._fetch(self.cursor.fetchone)
+
+    def fetchall(self):
+        return self._fetch(self.cursor.fetchall)
+
+    def get_summary(self, limit=5):
+        """Returns the number of statements, their total duration and the
+        ``limit`` most frequently run statements with their counts."""
+        counts = Counter(query.sql for query in self.queries)
+        return (
+            self.count,
+            sum(query.duration for query in self.queries),
+            counts.most_common(limit),
+        )
+
+    def print_summary(self, stream, label, limit=5):
+        self.finish()
+        for query in list(self.pending):
+            self.log(query)
+        count, duration, common = self.get_summary(limit)
+        print >> stream, 'sql: %s: %s statement%s in %.2fms' % (
+            label, count, '' if count == 1 else 's', duration * 1000
+        )
+        for sql, times in common:
+            print >> stream, 'sql: %6d x %s' % (times, sql)
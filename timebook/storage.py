@@ -0,0 +1,787 @@
+# storage.py
+#
+# Copyright (c) 2008-2009 Trevor Caira, 2011-2012 Adam Coddington
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""Where timesheets are kept.
+
+Commands and ``dbutil`` read and write timesheets through the ``Storage``
+of the database, ``db.storage``, rather than by SQL:
+
+``SQLiteStorage``
+    the timebook database itself, as opened by ``timebook.db.Database``
+``MemoryStorage``
+    plain Python structures, used by ``MemoryDatabase``
+
+Entries are given as ``(id, sheet, start_time, end_time, description,
+extra)``; running entries have no end time.  Reports, the archive,
+backups and maintenance work on the SQLite database directly.
+"""
+
+import abc
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, timedelta
+import sqlite3
+import time
+
+from timebook import dbutil, exceptions
+
+# Tables of per-entry rows, which are orphaned when their entry is deleted.
+ENTRY_TABLES = ('entry_meta', 'entry_details')
+
+# Fields of an entry which can be changed once it has been added.
+ENTRY_FIELDS = ('start_time', 'end_time', 'description')
+
+# Tables of days on which no hours are expected.
+EXCLUDED_DAY_KINDS = ('holidays', 'unpaid', 'vacation')
+
+# Sorts after every entry id starting at the same time.
+LAST_ID = float('inf')
+
+
+def get_day_bounds(day):
+    """Returns the unix timestamps of the start of the local day ``day``,
+    given as YYYY-MM-DD, and of the next."""
+    start = date(*time.strptime(day, '%Y-%m-%d')[:3])
+    return (
+        int(time.mktime(start.timetuple())),
+        int(time.mktime((start + timedelta(days=1)).timetuple())),
+    )
+
+
+class Storage(object):
+    """The operations on timesheets which every storage engine provides;
+    an engine lacking any of them cannot be created."""
+
+    __metaclass__ = abc.ABCMeta
+
+    # Sheets
+
+    @abc.abstractmethod
+    def get_current_sheet(self):
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def set_current_sheet(self, sheet):
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_sheet_names(self):
+        """Returns the names, in order, of the sheets having entries."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_sheet_totals(self):
+        """Returns the name, entry count and total length of the finished
+        entries of each sheet that has entries, in order of name."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_entry_count(self, sheet):
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_day_totals(self, day):
+        """Returns the total length of the finished entries of each sheet
+        starting on the local day ``day``, by sheet name."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def delete_sheet(self, sheet):
+        """Deletes the entries of ``sheet`` and their meta."""
+        raise NotImplementedError()
+
+    # Entries
+
+    @abc.abstractmethod
+    def add_entry(self, sheet, start_time, end_time=None, description=None,
+                  extra=None):
+        """Adds an entry and returns its id; raises ``CommandError`` if it
+        is running and ``sheet`` already has a running entry."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_entry(self, id):
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_entries(self, sheet=None):
+        """Returns the entries of ``sheet``, or of every sheet, in the
+        order they were added."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_latest_entry(self, sheet):
+        """Returns the entry of ``sheet`` added last, if any."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def update_entry(self, id, **fields):
+        """Changes the ``ENTRY_FIELDS`` given of entry ``id``; raises
+        ``CommandError`` if this would leave its sheet with two running
+        entries."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def end_running_entries(self, end_time):
+        """Ends the running entries of every sheet at ``end_time``."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_running_entry(self, sheet):
+        """Returns the id, start time and description of the running entry
+        of ``sheet``, if any."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_running_entries(self):
+        """Returns the id, sheet, start time and description of the running
+        entry of each sheet, in order of sheet."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_previous_entry(self, sheet, timestamp):
+        """Returns the id, start time, end time and description of the
+        entry of ``sheet`` which started last at or before ``timestamp``,
+        if any."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_next_entry(self, sheet, timestamp):
+        """Returns the id, start time, end time and description of the
+        entry of ``sheet`` which starts first after ``timestamp``, if
+        any."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_overlapping_entries(self, start, end):
+        """Returns the id, sheet, start time, end time and description of
+        the entries of every sheet overlapping the period from ``start`` to
+        ``end``, in the order they started; running entries last until
+        now."""
+        raise NotImplementedError()
+
+    # Meta
+
+    @abc.abstractmethod
+    def get_entry_meta(self, id):
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def update_entry_meta(self, id, meta):
+        raise NotImplementedError()
+
+    # Calendar exclusions and adjustments
+
+    @abc.abstractmethod
+    def is_excluded_day(self, kind, year, month, day):
+        """Whether the day is one of the ``EXCLUDED_DAY_KINDS``."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_adjustment_total(self, start, end):
+        """Returns the sum of the hour adjustments made from the unix
+        timestamp ``start`` until ``end``."""
+        raise NotImplementedError()
+
+    # Ticket details
+
+    @abc.abstractmethod
+    def get_ticket_details(self, number):
+        """Returns the project and details stored for ticket ``number``,
+        if any."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def set_ticket_details(self, number, project, details):
+        raise NotImplementedError()
+
+
+def check_excluded_day_kind(kind):
+    if kind not in EXCLUDED_DAY_KINDS:
+        raise ValueError('kind must be one of %s, not %r' % (
+            ', '.join(EXCLUDED_DAY_KINDS), kind
+        ))
+
+
+def check_entry_fields(fields):
+    for field in fields:
+        if field not in ENTRY_FIELDS:
+            raise ValueError('%r is not a field of entries' % (field, ))
+
+
+class SQLiteStorage(Storage):
+    """The timebook database; ``sheet`` and ``daily_totals`` keep the
+    counters read here up to date."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def get_current_sheet(self):
+        self.db.execute(u'''
+        select
+            value
+        from
+            meta
+        where
+            key = 'current_sheet'
+        ''')
+        return self.db.fetchone()[0]
+
+    def set_current_sheet(self, sheet):
+        self.db.execute(u'''
+        update
+            meta
+        set
+            value = ?
+        where
+            key = 'current_sheet'
+        ''', (sheet,))
+
+    def get_sheet_names(self):
+        self.db.execute(u'''
+        select
+            name
+        from
+            sheet
+        where
+            entry_count > 0
+        order by
+            name
+        ''')
+        return tuple(r[0] for r in self.db.fetchall())
+
+    def get_sheet_totals(self):
+        self.db.execute(u'''
+        select
+            name, entry_count, seconds
+        from
+            sheet
+        where
+            entry_count > 0
+        order by
+            name
+        ''')
+        return self.db.fetchall()
+
+    def get_entry_count(self, sheet):
+        self.db.execute(u'''
+        select
+            entry_count
+        from
+            sheet
+        where
+            name = ?
+        ''', (sheet,))
+        row = self.db.fetchone()
+        return row[0] if row else 0
+
+    def get_day_totals(self, day):
+        self.db.execute(u'''
+        select
+            sheet, seconds
+        from
+            daily_totals
+        where
+            day = ?
+        ''', (day,))
+        return dict(self.db.fetchall())
+
+    def delete_sheet(self, sheet):
+        for table in ENTRY_TABLES:
+            self.db.execute(u'''
+            delete from
+                %s
+            where
+                entry_id in (select id from entry where sheet = ?)
+            ''' % table, (sheet,))
+        self.db.execute(u'delete from entry where sheet = ?', (sheet,))
+
+    def add_entry(self, sheet, start_time, end_time=None, description=None,
+                  extra=None):
+        try:
+            self.db.execute(u'''
+            insert into entry (
+                sheet, start_time, end_time, description, extra
+            ) values (?,?,?,?,?)
+            ''', (sheet, start_time, end_time, description, extra))
+        except sqlite3.IntegrityError as e:
+            # Raised by the entry_running_insert trigger.
+            raise exceptions.CommandError(str(e))
+        return self.db.cursor.lastrowid
+
+    def get_entry(self, id):
+        self.db.execute(u'''
+        select
+            id, sheet, start_time, end_time, description, extra
+        from
+            entry
+        where
+            id = ?
+        ''', (id,))
+        return self.db.fetchone()
+
+    def get_entries(self, sheet=None):
+        if sheet is None:
+            self.db.execute(u'''
+            select
+                id, sheet, start_time, end_time, description, extra
+            from
+                entry
+            order by
+                id
+            ''')
+        else:
+            self.db.execute(u'''
+            select
+                id, sheet, start_time, end_time, description, extra
+            from
+                entry
+            where
+                sheet = ?
+            order by
+                id
+            ''', (sheet,))
+        return self.db.fetchall()
+
+    def get_latest_entry(self, sheet):
+        self.db.execute(u'''
+        select
+            id, sheet, start_time, end_time, description, extra
+        from
+            entry
+        where
+            sheet = ?
+        order by
+            id desc
+        limit 1
+        ''', (sheet,))
+        return self.db.fetchone()
+
+    def update_entry(self, id, **fields):
+        check_entry_fields(fields)
+        if not fields:
+            return
+        names = sorted(fields)
+        try:
+            self.db.execute(u'''
+            update
+                entry
+            set
+                %s
+            where
+                id = ?
+            ''' % u', '.join(u'%s = ?' % name for name in names),
+                tuple(fields[name] for name in names) + (id,))
+        except sqlite3.IntegrityError as e:
+            # Raised by the entry_running_update trigger.
+            raise exceptions.CommandError(str(e))
+
+    def end_running_entries(self, end_time):
+        self.db.execute(u'''
+        update
+            entry
+        set
+            end_time = ?
+        where
+            end_time is null
+        ''', (end_time,))
+
+    def get_running_entry(self, sheet):
+        self.db.execute(u'''
+        select
+            entry.id,
+            entry.start_time,
+            entry.description
+        from
+            sheet
+        inner join
+            entry
+        on
+            entry.id = sheet.running_entry_id
+        where
+            sheet.name = ?
+        ''', (sheet,))
+        return self.db.fetchone()
+
+    def get_running_entries(self):
+        self.db.execute(u'''
+        select
+            entry.id, sheet.name, entry.start_time, entry.description
+        from
+            sheet
+        inner join
+            entry
+        on
+            entry.id = sheet.running_entry_id
+        order by
+            sheet.name
+        ''')
+        return self.db.fetchall()
+
+    def get_previous_entry(self, sheet, timestamp):
+        self.db.execute(u'''
+        select
+            id, start_time, end_time, description
+        from
+            entry
+        where
+            sheet = ?
+            and start_time <= ?
+        order by
+            start_time desc
+        limit 1
+        ''', (sheet, timestamp))
+        return self.db.fetchone()
+
+    def get_next_entry(self, sheet, timestamp):
+        self.db.execute(u'''
+        select
+            id, start_time, end_time, description
+        from
+            entry
+        where
+            sheet = ?
+            and start_time > ?
+        order by
+            start_time
+        limit 1
+        ''', (sheet, timestamp))
+        return self.db.fetchone()
+
+    def get_overlapping_entries(self, start, end):
+        self.db.execute(u'''
+        select
+            id, sheet, start_time, end_time, description
+        from
+            entry
+        where
+            %s
+        order by
+            start_time, id
+        ''' % dbutil.get_interval_condition(self.db, start, end))
+        return self.db.fetchall()
+
+    def get_entry_meta(self, id):
+        self.db.execute(u'''
+        select
+            key, value
+        from
+            entry_meta
+        where
+            entry_id = ?
+        order by
+            key
+        ''', (id, ))
+        return dict(self.db.fetchall())
+
+    def update_entry_meta(self, id, meta):
+        # (entry_id, key) is unique, so every key is written by one upsert;
+        # values which have not changed are left alone.
+        rows = [(id, key, value) for key, value in meta.items()]
+        if not dbutil.has_upsert():
+            self.db.executemany(u'''
+            insert or ignore into
+                entry_meta
+                (entry_id, key, value)
+            values
+                (?, ?, ?)
+            ''', rows)
+            self.db.executemany(u'''
+            update
+                entry_meta
+            set
+                value = ?3
+            where
+                entry_id = ?1 and key = ?2 and value is not ?3
+            ''', rows)
+            return
+        self.db.executemany(u'''
+        insert into
+            entry_meta
+            (entry_id, key, value)
+        values
+            (?, ?, ?)
+        on conflict (entry_id, key) do update set
+            value = excluded.value
+        where
+            value is not excluded.value
+        ''', rows)
+
+    def is_excluded_day(self, kind, year, month, day):
+        check_excluded_day_kind(kind)
+        self.db.execute(u'''
+        select
+            count(*)
+        from
+            %s
+        where year = ?
+        and month = ?
+        and day = ?
+        ''' % kind, (year, month, day,))
+        return self.db.fetchone()[0] > 0
+
+    def get_adjustment_total(self, start, end):
+        self.db.execute(u'''
+        select
+            sum(adjustment)
+        from
+            adjustments
+        where
+            timestamp >= ? and timestamp < ?
+        ''', (start, end))
+        return self.db.fetchone()[0] or 0
+
+    def get_ticket_details(self, number):
+        self.db.execute(u'''
+        select
+            project, details
+        from
+            ticket_details
+        where
+            number = ?
+        ''', (number, ))
+        return self.db.fetchone()
+
+    def set_ticket_details(self, number, project, details):
+        self.db.execute(u'''
+        insert or replace into ticket_details (number, project, details)
+        values (?, ?, ?)
+        ''', (number, project, details))
+
+
+class MemoryStorage(Storage):
+    """Timesheets held in memory, which are lost with it.
+
+    Each sheet keeps the ``(start_time, id)`` of its entries in order, so
+    entries are found by bisection, and the id of its running entry, as
+    ``sheet.running_entry_id`` does.  Like the commands which check for
+    overlaps before adding entries, this counts on the entries of a sheet
+    not overlapping one another: only the entries before the end of a
+    period up to the first which ends before its start are looked at.
+
+    Excluded days and adjustments, which no command adds, are given with
+    ``add_excluded_day`` and ``add_adjustment``.
+    """
+
+    def __init__(self):
+        self.current_sheet = u'default'
+        self.entries = {}
+        self.sheets = {}
+        self.running = {}
+        self.entry_meta = {}
+        self.excluded_days = dict((kind, set()) for kind in EXCLUDED_DAY_KINDS)
+        self.adjustments = []
+        self.ticket_details = {}
+
+    def get_current_sheet(self):
+        return self.current_sheet
+
+    def set_current_sheet(self, sheet):
+        self.current_sheet = sheet
+
+    def get_sheet_names(self):
+        return tuple(sorted(self.sheets))
+
+    def get_sheet_totals(self):
+        totals = []
+        for name in sorted(self.sheets):
+            entries = [self.entries[id] for _, id in self.sheets[name]]
+            totals.append((name, len(entries), sum(
+                entry[3] - entry[2] for entry in entries
+                if entry[3] is not None
+            )))
+        return totals
+
+    def get_entry_count(self, sheet):
+        return len(self.sheets.get(sheet, ()))
+
+    def get_day_totals(self, day):
+        start, end = get_day_bounds(day)
+        totals = {}
+        for name, keys in self.sheets.items():
+            seconds = [
+                self.entries[id][3] - self.entries[id][2]
+                for _, id in keys[
+                    bisect_left(keys, (start, )):bisect_left(keys, (end, ))
+                ]
+                if self.entries[id][3] is not None
+            ]
+            if seconds:
+                totals[name] = sum(seconds)
+        return totals
+
+    def delete_sheet(self, sheet):
+        self.running.pop(sheet, None)
+        for _, id in self.sheets.pop(sheet, ()):
+            del self.entries[id]
+            self.entry_meta.pop(id, None)
+
+    def check_running(self, sheet, id=None):
+        if self.running.get(sheet, id) != id:
+            raise exceptions.CommandError('timesheet already active')
+
+    def add_entry(self, sheet, start_time, end_time=None, description=None,
+                  extra=None):
+        if end_time is None:
+            self.check_running(sheet)
+        # Ids are reused as SQLite reuses them, after the highest.
+        id = max(self.entries) + 1 if self.entries else 1
+        self.entries[id] = [id, sheet, start_time, end_time, description,
+                            extra]
+        insort(self.sheets.setdefault(sheet, []), (start_time, id))
+        if end_time is None:
+            self.running[sheet] = id
+        return id
+
+    def get_entry(self, id):
+        entry = self.entries.get(id)
+        return tuple(entry) if entry is not None else None
+
+    def get_entries(self, sheet=None):
+        return [
+            tuple(self.entries[id]) for id in sorted(self.entries)
+            if sheet is None or self.entries[id][1] == sheet
+        ]
+
+    def get_latest_entry(self, sheet):
+        keys = self.sheets.get(sheet)
+        if not keys:
+            return None
+        return self.get_entry(max(id for _, id in keys))
+
+    def update_entry(self, id, **fields):
+        check_entry_fields(fields)
+        entry = self.entries[id]
+        if 'end_time' in fields and fields['end_time'] is None:
+            self.check_running(entry[1], id)
+        if 'start_time' in fields:
+            keys = self.sheets[entry[1]]
+            keys.remove((entry[2], id))
+            insort(keys, (fields['start_time'], id))
+            entry[2] = fields['start_time']
+        if 'end_time' in fields:
+            entry[3] = fields['end_time']
+            if entry[3] is None:
+                self.running[entry[1]] = id
+            elif self.running.get(entry[1]) == id:
+                del self.running[entry[1]]
+        if 'description' in fields:
+            entry[4] = fields['description']
+
+    def end_running_entries(self, end_time):
+        for id in self.running.values():
+            self.entries[id][3] = end_time
+        self.running.clear()
+
+    def get_running_entry(self, sheet):
+        if sheet not in self.running:
+            return None
+        entry = self.entries[self.running[sheet]]
+        return (entry[0], entry[2], entry[4])
+
+    def get_running_entries(self):
+        running = []
+        for name in sorted(self.running):
+            entry = self.entries[self.running[name]]
+            running.append((entry[0], name, entry[2], entry[4]))
+        return running
+
+    def get_previous_entry(self, sheet, timestamp):
+        keys = self.sheets.get(sheet, ())
+        index = bisect_right(keys, (timestamp, LAST_ID))
+        if index == 0:
+            return None
+        entry = self.entries[keys[index - 1][1]]
+        return (entry[0], entry[2], entry[3], entry[4])
+
+    def get_next_entry(self, sheet, timestamp):
+        keys = self.sheets.get(sheet, ())
+        index = bisect_right(keys, (timestamp, LAST_ID))
+        if index == len(keys):
+            return None
+        entry = self.entries[keys[index][1]]
+        return (entry[0], entry[2], entry[3], entry[4])
+
+    def get_overlapping_entries(self, start, end):
+        now = int(time.time())
+        overlapping = []
+        for keys in self.sheets.values():
+            for _, id in reversed(keys[:bisect_left(keys, (end, ))]):
+                entry = self.entries[id]
+                if (entry[3] if entry[3] is not None else now) <= start:
+                    break
+                overlapping.append(tuple(entry[:5]))
+        overlapping.sort(key=lambda entry: (entry[2], entry[0]))
+        return overlapping
+
+    def get_entry_meta(self, id):
+        return dict(self.entry_meta.get(id, {}))
+
+    def update_entry_meta(self, id, meta):
+        self.entry_meta.setdefault(id, {}).update(meta)
+
+    def is_excluded_day(self, kind, year, month, day):
+        check_excluded_day_kind(kind)
+        return (year, month, day) in self.excluded_days[kind]
+
+    def add_excluded_day(self, kind, year, month, day):
+        check_excluded_day_kind(kind)
+        self.excluded_days[kind].add((year, month, day))
+
+    def get_adjustment_total(self, start, end):
+        return sum(
+            adjustment[1] for adjustment in self.adjustments[
+                bisect_left(self.adjustments, (start, )):
+                bisect_left(self.adjustments, (end, ))
+            ]
+        )
+
+    def add_adjustment(self, timestamp, adjustment, description=None):
+        insort(self.adjustments, (timestamp, adjustment, description))
+
+    def get_ticket_details(self, number):
+        return self.ticket_details.get(number)
+
+    def set_ticket_details(self, number, project, details):
+        self.ticket_details[number] = (project, details)
+
+
+class MemoryDatabase(object):
+    """A database of which ``MemoryStorage`` keeps the timesheets.
+
+    It runs the commands which go through ``db.storage`` and ``dbutil``
+    alone, such as ``in``, ``out``, ``switch``, ``alter``, ``insert`` and
+    ``list``; those which query the SQLite database, such as ``display``,
+    need a ``timebook.db.Database``.  Having no transactions to begin and
+    commit, it only runs commands called directly, not through
+    ``commands.run_command``.
+    """
+
+    path = ':memory:'
+    read_only = False
+    in_transaction = False
+    tracer = None
+
+    def __init__(self, config):
+        self.config = config
+        self.storage = MemoryStorage()